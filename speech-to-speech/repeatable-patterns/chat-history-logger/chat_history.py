@@ -124,6 +124,37 @@ class ChatHistory:
         """Get the last n messages in the chat history"""
         return self.messages[-n:] if n < len(self.messages) else self.messages.copy()
     
+    def get_replay_messages(
+        self,
+        start: int = 0,
+        max_messages: Optional[int] = None,
+        max_chars: int = 1000
+    ) -> List[tuple]:
+        """Get a compacted (role, text) list of the conversation, for replaying it into a new session.
+
+        Only USER and ASSISTANT text is kept: tool calls, tool results and barge-in
+        markers are dropped, consecutive messages from the same role are merged and
+        each text is capped to its last `max_chars` characters. With `max_messages`
+        only the most recent messages are kept, starting at a USER turn.
+        """
+        replay = []
+        for msg in self.messages[start:]:
+            if not isinstance(msg, TextMessage) or msg.role not in ("USER", "ASSISTANT"):
+                continue
+            content = msg.content.strip()
+            if not content or content == '{ "interrupted" : true }':
+                continue
+            if replay and replay[-1][0] == msg.role:
+                replay[-1] = (msg.role, replay[-1][1] + " " + content)
+            else:
+                replay.append((msg.role, content))
+
+        if max_messages is not None and len(replay) > max_messages:
+            replay = replay[-max_messages:]
+            while replay and replay[0][0] != "USER":
+                replay.pop(0)
+        return [(role, content[-max_chars:]) for role, content in replay]
+    
     def get_messages_by_role(self, role: str) -> List[ChatMessage]:
         """Get all messages with the specified role"""
         return [msg for msg in self.messages if msg.role == role]
@@ -10,12 +10,13 @@ import random
 import hashlib
 import datetime
 import time
-import inspect
+import sys
 from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
 from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
 from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
 from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
 from chat_history import ChatHistory
+from event_decoder import EventDecoder
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -33,9 +34,11 @@ DEBUG = False
 def debug_print(message):
     """Print only if debug mode is enabled"""
     if DEBUG:
-        functionName = inspect.stack()[1].function
+        # Walk the frame chain directly; inspect.stack() builds context for every frame on each call
+        frame = sys._getframe(1)
+        functionName = frame.f_code.co_name
         if  functionName == 'time_it' or functionName == 'time_it_async':
-            functionName = inspect.stack()[2].function
+            functionName = frame.f_back.f_code.co_name
         print('{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())[:-3] + ' ' + functionName + ' ' + message)
 
 def time_it(label, methodToRun):
@@ -52,6 +55,18 @@ async def time_it_async(label, methodToRun):
     debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
     return result
 
+class SonicStream:
+    """One bidirectional stream together with the prompt and audio content names used on it."""
+
+    def __init__(self, stream_response, prompt_name, audio_content_name, history_len=0):
+        self.stream_response = stream_response
+        self.prompt_name = prompt_name
+        self.audio_content_name = audio_content_name
+        # Number of chat history messages already replayed into this stream
+        self.history_len = history_len
+        self.response_task = None
+        self.opened_at = time.monotonic()
+
 class BedrockStreamManager:
     """Manages bidirectional streaming with AWS Bedrock using asyncio"""
     
@@ -165,7 +180,15 @@ class BedrockStreamManager:
         }
     }'''
     
-    def start_prompt(self):
+    # Replayed history limits: most recent messages kept, characters kept per message
+    ROLLOVER_MAX_HISTORY_MESSAGES = 40
+    ROLLOVER_MAX_MESSAGE_CHARS = 1000
+    # Seconds between attempts to open a successor stream
+    ROLLOVER_RETRY_DELAY = 5
+    # Seconds a replaced stream may keep delivering output before it is cancelled
+    ROLLOVER_DRAIN_TIMEOUT = 10
+
+    def start_prompt(self, prompt_name=None):
         """Create a promptStart event"""
         get_default_tool_schema = json.dumps({
             "type": "object",
@@ -193,7 +216,7 @@ class BedrockStreamManager:
         prompt_start_event = {
             "event": {
                 "promptStart": {
-                    "promptName": self.prompt_name,
+                    "promptName": prompt_name or self.prompt_name,
                     "textOutputConfiguration": {
                         "mediaType": "text/plain"
                     },
@@ -256,10 +279,19 @@ class BedrockStreamManager:
         }
         return json.dumps(tool_result_event)
    
-    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1'):
+    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', rollover_after=None, rollover_lead=30):
         """Initialize the stream manager."""
         self.model_id = model_id
         self.region = region
+
+        # Session rollover: a successor stream is opened `rollover_lead` seconds before
+        # the current one is `rollover_after` seconds old and takes over at the next turn boundary
+        self.rollover_after = rollover_after
+        self.rollover_lead = rollover_lead
+        self.stream_opened_at = None
+        self.successor = None
+        self.rollover_task = None
+        self.rollovers = 0
         
         # Replace RxPy subjects with asyncio queues
         self.audio_input_queue = asyncio.Queue()
@@ -290,6 +322,17 @@ class BedrockStreamManager:
         # Chat history
         self.chat_history = ChatHistory()
 
+        # Output event decoding: handler table keyed by event name
+        self.decoder = EventDecoder()
+        self.event_handlers = {
+            'contentStart': self._handle_content_start,
+            'contentEnd': self._handle_content_end,
+            'textOutput': self._handle_text_output,
+            'audioOutput': self._handle_audio_output,
+            'toolUse': self._handle_tool_use,
+            'completionEnd': self._handle_completion_end,
+        }
+
     def _initialize_client(self):
         """Initialize the Bedrock client."""
         config = Config(
@@ -301,35 +344,56 @@ class BedrockStreamManager:
         )
         self.bedrock_client = BedrockRuntimeClient(config=config)
     
+    async def _open_stream(self, prompt_name, history_messages=()):
+        """Open a bidirectional stream and send the session setup, system prompt and any replayed history."""
+        stream_response = await time_it_async("invoke_model_with_bidirectional_stream", lambda : self.bedrock_client.invoke_model_with_bidirectional_stream( InvokeModelWithBidirectionalStreamOperationInput(model_id=self.model_id)))
+        default_system_prompt = "You are a friend. The user and you will engage in a spoken dialog exchanging the transcripts of a natural real-time conversation." \
+        "When reading order numbers, please read each digit individually, separated by pauses. For example, order #1234 should be read as 'order number one-two-three-four' rather than 'order number one thousand two hundred thirty-four'."
+        content_name = str(uuid.uuid4())
+
+        # Send initialization events
+        prompt_event = self.start_prompt(prompt_name)
+        text_content_start = self.TEXT_CONTENT_START_EVENT % (prompt_name, content_name, "SYSTEM")
+        text_content = self.TEXT_INPUT_EVENT % (prompt_name, content_name, default_system_prompt)
+        text_content_end = self.CONTENT_END_EVENT % (prompt_name, content_name)
+
+        init_events = [self.START_SESSION_EVENT, prompt_event, text_content_start, text_content, text_content_end]
+
+        for event in init_events:
+            await self.send_raw_event(event, stream_response)
+            # Small delay between init events
+            await asyncio.sleep(0.1)
+
+        await self._send_history(stream_response, prompt_name, history_messages)
+        return stream_response
+
+    async def _send_history(self, stream_response, prompt_name, history_messages):
+        """Replay (role, text) history messages as text content on a stream."""
+        for role, text in history_messages:
+            content_name = str(uuid.uuid4())
+            await self.send_raw_event(self.TEXT_CONTENT_START_EVENT % (prompt_name, content_name, role), stream_response)
+            # The template is not JSON-aware, escape the transcript text
+            await self.send_raw_event(self.TEXT_INPUT_EVENT % (prompt_name, content_name, json.dumps(text)[1:-1]), stream_response)
+            await self.send_raw_event(self.CONTENT_END_EVENT % (prompt_name, content_name), stream_response)
+
     async def initialize_stream(self):
         """Initialize the bidirectional stream with Bedrock."""
         if not self.bedrock_client:
             self._initialize_client()
         
         try:
-            self.stream_response = await time_it_async("invoke_model_with_bidirectional_stream", lambda : self.bedrock_client.invoke_model_with_bidirectional_stream( InvokeModelWithBidirectionalStreamOperationInput(model_id=self.model_id)))
             self.is_active = True
-            default_system_prompt = "You are a friend. The user and you will engage in a spoken dialog exchanging the transcripts of a natural real-time conversation." \
-            "When reading order numbers, please read each digit individually, separated by pauses. For example, order #1234 should be read as 'order number one-two-three-four' rather than 'order number one thousand two hundred thirty-four'."
-            
-            # Send initialization events
-            prompt_event = self.start_prompt()
-            text_content_start = self.TEXT_CONTENT_START_EVENT % (self.prompt_name, self.content_name, "SYSTEM")
-            text_content = self.TEXT_INPUT_EVENT % (self.prompt_name, self.content_name, default_system_prompt)
-            text_content_end = self.CONTENT_END_EVENT % (self.prompt_name, self.content_name)
-            
-            init_events = [self.START_SESSION_EVENT, prompt_event, text_content_start, text_content, text_content_end]
-            
-            for event in init_events:
-                await self.send_raw_event(event)
-                # Small delay between init events
-                await asyncio.sleep(0.1)
+            self.stream_response = await self._open_stream(self.prompt_name)
+            self.stream_opened_at = time.monotonic()
             
             # Start listening for responses
-            self.response_task = asyncio.create_task(self._process_responses())
+            self.response_task = asyncio.create_task(self._process_responses(self.stream_response))
             
             # Start processing audio input
             asyncio.create_task(self._process_audio_input())
+
+            if self.rollover_after:
+                self.rollover_task = asyncio.create_task(self._rollover_watchdog())
             
             # Wait a bit to ensure everything is set up
             await asyncio.sleep(0.1)
@@ -341,9 +405,10 @@ class BedrockStreamManager:
             print(f"Failed to initialize stream: {str(e)}")
             raise
     
-    async def send_raw_event(self, event_json):
-        """Send a raw event JSON to the Bedrock stream."""
-        if not self.stream_response or not self.is_active:
+    async def send_raw_event(self, event_json, stream_response=None):
+        """Send a raw event JSON to the Bedrock stream (the current one unless another is given)."""
+        stream_response = stream_response or self.stream_response
+        if not stream_response or not self.is_active:
             debug_print("Stream not initialized or closed")
             return
        
@@ -352,7 +417,7 @@ class BedrockStreamManager:
         )
         
         try:
-            await self.stream_response.input_stream.send(event)
+            await stream_response.input_stream.send(event)
             # For debugging large events, you might want to log just the type
             if DEBUG:
                 if len(event_json) > 200:
@@ -459,87 +524,38 @@ class BedrockStreamManager:
         self.is_active = False
         debug_print("Session ended")
     
-    async def _process_responses(self):
-        """Process incoming responses from Bedrock."""
+    async def _process_responses(self, stream_response):
+        """Process incoming responses from one Bedrock stream."""
         try:            
             while self.is_active:
                 try:
-                    output = await self.stream_response.await_output()
+                    output = await stream_response.await_output()
                     result = await output[1].receive()
                     if result.value and result.value.bytes_:
                         try:
-                            response_data = result.value.bytes_.decode('utf-8')
-                            json_data = json.loads(response_data)
-                            
-                            # Handle different response types
-                            if 'event' in json_data:
-                                if 'contentStart' in json_data['event']:
-                                    debug_print("Content start detected")
-                                    content_start = json_data['event']['contentStart']
-                                    # set role
-                                    self.role = content_start['role']
-                                    # Check for speculative content
-                                    if 'additionalModelFields' in content_start:
-                                        try:
-                                            additional_fields = json.loads(content_start['additionalModelFields'])
-                                            if additional_fields.get('generationStage') == 'SPECULATIVE':
-                                                debug_print("Speculative content detected")
-                                                self.display_assistant_text = True
-                                            else:
-                                                self.display_assistant_text = False
-                                        except json.JSONDecodeError:
-                                            debug_print("Error parsing additionalModelFields")
-                                elif 'textOutput' in json_data['event']:
-                                    text_content = json_data['event']['textOutput']['content']
-                                    role = json_data['event']['textOutput']['role']
-                                    # Check if there is a barge-in
-                                    if '{ "interrupted" : true }' in text_content:
-                                        debug_print("Barge-in detected. Stopping audio output.")
-                                        self.barge_in = True
-
-                                    if not self.display_assistant_text:
-                                        self.chat_history.add_message(role, text_content)
-
-                                    if (self.role == "ASSISTANT" and self.display_assistant_text):
-                                        print(f"Assistant: {text_content}")
-                                    elif (self.role == "USER"):
-                                        print(f"User: {text_content}")
-
-                                elif 'audioOutput' in json_data['event']:
-                                    audio_content = json_data['event']['audioOutput']['content']
-                                    audio_bytes = base64.b64decode(audio_content)
-                                    await self.audio_output_queue.put(audio_bytes)
-                                elif 'toolUse' in json_data['event']:
-                                    self.toolUseContent = json_data['event']['toolUse']
-                                    self.toolName = json_data['event']['toolUse']['toolName']
-                                    self.toolUseId = json_data['event']['toolUse']['toolUseId']
-                                    # Add tool use to chat history
-                                    self.chat_history.add_tool_call(
-                                        tool_use_content=self.toolUseContent
-                                    )
-                                    debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
-                                elif 'contentEnd' in json_data['event'] and json_data['event'].get('contentEnd', {}).get('type') == 'TOOL':
-                                    debug_print("Processing tool use and sending result")
-                                    toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
-                                    # Update tool use in history with result
-                                    self.chat_history.add_tool_result(self.toolUseId, toolResult)
-                                    toolContent = str(uuid.uuid4())
-                                    await self.send_tool_start_event(toolContent)
-                                    await self.send_tool_result_event(toolContent, toolResult)
-                                    await self.send_tool_content_end_event(toolContent)
-                                
-                                elif 'completionEnd' in json_data['event']:
-                                    # Handle end of conversation, no more response will be generated
-                                    print("End of response sequence")
+                            event_name, body, json_data = self.decoder.decode(result.value.bytes_)
+                            # Dispatch on the event key through the handler table
+                            handler = self.event_handlers.get(event_name)
+                            if handler:
+                                await handler(body)
                             
-                            # Put the response in the output queue for other components
-                            await self.output_queue.put(json_data)
+                            # Put the response in the output queue for other components;
+                            # fast-path audio is only delivered through audio_output_queue
+                            if json_data is not None:
+                                await self.output_queue.put(json_data)
+
+                            if event_name == 'completionEnd' and stream_response is not self.stream_response:
+                                # A replaced stream has delivered all of its output
+                                break
                         except json.JSONDecodeError:
-                            await self.output_queue.put({"raw_data": response_data})
+                            await self.output_queue.put({"raw_data": result.value.bytes_.decode('utf-8')})
                 except StopAsyncIteration:
                     # Stream has ended
                     break
                 except Exception as e:
+                    if stream_response is not self.stream_response:
+                        # A stream we rolled over from has been closed
+                        break
                    # Handle ValidationException properly
                     if "ValidationException" in str(e):
                         error_message = str(e)
@@ -551,7 +567,159 @@ class BedrockStreamManager:
         except Exception as e:
             print(f"Response processing error: {e}")
         finally:
-            self.is_active = False
+            # Only the current stream ending ends the session
+            if stream_response is self.stream_response:
+                self.is_active = False
+
+    async def _handle_content_start(self, content_start):
+        """Handle a contentStart event."""
+        debug_print("Content start detected")
+        # set role
+        self.role = content_start['role']
+        # Check for speculative content
+        if 'additionalModelFields' in content_start:
+            try:
+                if self.decoder.generation_stage(content_start) == 'SPECULATIVE':
+                    debug_print("Speculative content detected")
+                    self.display_assistant_text = True
+                else:
+                    self.display_assistant_text = False
+            except json.JSONDecodeError:
+                debug_print("Error parsing additionalModelFields")
+
+    async def _handle_text_output(self, text_output):
+        """Handle a textOutput event."""
+        text_content = text_output['content']
+        role = text_output['role']
+        # Check if there is a barge-in
+        if '{ "interrupted" : true }' in text_content:
+            debug_print("Barge-in detected. Stopping audio output.")
+            self.barge_in = True
+
+        if not self.display_assistant_text:
+            self.chat_history.add_message(role, text_content)
+
+        if (self.role == "ASSISTANT" and self.display_assistant_text):
+            print(f"Assistant: {text_content}")
+        elif (self.role == "USER"):
+            print(f"User: {text_content}")
+
+    async def _handle_audio_output(self, audio_bytes):
+        """Handle an audioOutput event; the decoder has already base64-decoded the payload."""
+        await self.audio_output_queue.put(audio_bytes)
+
+    async def _handle_tool_use(self, tool_use):
+        """Handle a toolUse event."""
+        self.toolUseContent = tool_use
+        self.toolName = tool_use['toolName']
+        self.toolUseId = tool_use['toolUseId']
+        # Add tool use to chat history
+        self.chat_history.add_tool_call(
+            tool_use_content=self.toolUseContent
+        )
+        debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
+
+    async def _handle_content_end(self, content_end):
+        """Handle a contentEnd event."""
+        if content_end.get('type') == 'TOOL':
+            debug_print("Processing tool use and sending result")
+            toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
+            # Update tool use in history with result
+            self.chat_history.add_tool_result(self.toolUseId, toolResult)
+            toolContent = str(uuid.uuid4())
+            await self.send_tool_start_event(toolContent)
+            await self.send_tool_result_event(toolContent, toolResult)
+            await self.send_tool_content_end_event(toolContent)
+        elif (self.successor and self.role == "ASSISTANT" and content_end.get('type') == 'AUDIO'
+              and content_end.get('stopReason') == 'END_TURN'):
+            # The assistant finished speaking its turn: a safe point to move to the successor stream
+            await self._switch_to_successor()
+
+    async def _handle_completion_end(self, completion_end):
+        """Handle a completionEnd event."""
+        # Handle end of conversation, no more response will be generated
+        print("End of response sequence")
+
+    async def _rollover_watchdog(self):
+        """Open the successor stream ahead of the lifetime limit and force the switch if no turn boundary comes."""
+        opened_at = self.stream_opened_at
+        await asyncio.sleep(max(0, opened_at + self.rollover_after - self.rollover_lead - time.monotonic()))
+        # Keep trying while the stream is still current: without a successor the session ends at the limit
+        while self.is_active and self.stream_opened_at == opened_at:
+            await self._prepare_successor()
+            if self.successor:
+                break
+            await asyncio.sleep(self.ROLLOVER_RETRY_DELAY)
+
+        await asyncio.sleep(max(0, opened_at + self.rollover_after - time.monotonic()))
+        if self.is_active and self.successor and self.stream_opened_at == opened_at:
+            print("No turn boundary before the stream limit, rolling over mid-turn")
+            await self._switch_to_successor()
+
+    async def _prepare_successor(self):
+        """Open the next stream in the background and replay the compacted conversation into it."""
+        prompt_name = str(uuid.uuid4())
+        history_len = len(self.chat_history.messages)
+        history_messages = self.chat_history.get_replay_messages(
+            max_messages=self.ROLLOVER_MAX_HISTORY_MESSAGES,
+            max_chars=self.ROLLOVER_MAX_MESSAGE_CHARS
+        )
+        debug_print(f"Opening successor stream, replaying {len(history_messages)} history messages")
+        try:
+            stream_response = await self._open_stream(prompt_name, history_messages)
+        except Exception as e:
+            print(f"Failed to open successor stream: {e}")
+            return
+
+        successor = SonicStream(stream_response, prompt_name, str(uuid.uuid4()), history_len)
+        successor.response_task = asyncio.create_task(self._process_responses(stream_response))
+        self.successor = successor
+
+    async def _switch_to_successor(self):
+        """Move the audio uplink to the successor stream and close the old one."""
+        successor = self.successor
+        if not successor:
+            return
+        self.successor = None
+
+        # Replay what was said since the successor was opened, then open its audio content;
+        # microphone audio keeps flowing to the current stream meanwhile
+        delta = self.chat_history.get_replay_messages(start=successor.history_len, max_chars=self.ROLLOVER_MAX_MESSAGE_CHARS)
+        await self._send_history(successor.stream_response, successor.prompt_name, delta)
+        await self.send_raw_event(self.CONTENT_START_EVENT % (successor.prompt_name, successor.audio_content_name), successor.stream_response)
+
+        # Swap without awaiting in between, so no audio chunk is split across the two streams
+        previous = SonicStream(self.stream_response, self.prompt_name, self.audio_content_name)
+        previous.response_task = self.response_task
+        self.stream_response = successor.stream_response
+        self.prompt_name = successor.prompt_name
+        self.audio_content_name = successor.audio_content_name
+        self.response_task = successor.response_task
+        self.stream_opened_at = successor.opened_at
+        self.rollovers += 1
+        print(f"Rolled over to a new stream (rollover #{self.rollovers})")
+
+        asyncio.create_task(self._close_stream(previous))
+        self.rollover_task = asyncio.create_task(self._rollover_watchdog())
+
+    async def _close_stream(self, stream):
+        """End the session on a stream that is no longer current, letting it finish delivering its output."""
+        try:
+            await self.send_raw_event(self.CONTENT_END_EVENT % (stream.prompt_name, stream.audio_content_name), stream.stream_response)
+            await self.send_raw_event(self.PROMPT_END_EVENT % stream.prompt_name, stream.stream_response)
+            await self.send_raw_event(self.SESSION_END_EVENT, stream.stream_response)
+        except Exception as e:
+            debug_print(f"Error ending previous stream: {e}")
+        if stream.response_task:
+            # Audio still in flight on the old stream keeps playing until completionEnd or the end of the stream
+            done, _ = await asyncio.wait([stream.response_task], timeout=self.ROLLOVER_DRAIN_TIMEOUT)
+            if not done:
+                debug_print("Previous stream did not finish in time, cancelling it")
+                stream.response_task.cancel()
+        try:
+            await stream.stream_response.input_stream.close()
+        except Exception as e:
+            debug_print(f"Error closing previous stream: {e}")
 
     async def processToolUse(self, toolName, toolUseContent):
         """Return the tool result"""
@@ -687,8 +855,16 @@ class BedrockStreamManager:
         if not self.is_active:
             return
        
-        self.is_active = False
         await self.save_chat_history_to_file()
+
+        if self.rollover_task and not self.rollover_task.done():
+            self.rollover_task.cancel()
+        if self.successor:
+            # A successor that never took over
+            successor, self.successor = self.successor, None
+            successor.response_task.cancel()
+            await self._close_stream(successor)
+        self.is_active = False
         
         if self.response_task and not self.response_task.done():
             self.response_task.cancel()
@@ -871,13 +1047,14 @@ class AudioStreamer:
         await self.stream_manager.close() 
 
 
-async def main(debug=False):
+async def main(debug=False, rollover_after=None, rollover_lead=30):
     """Main function to run the application."""
     global DEBUG
     DEBUG = debug
 
     # Create stream manager
-    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
+    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1',
+                                          rollover_after=rollover_after, rollover_lead=rollover_lead)
 
     # Create audio streamer
     audio_streamer = AudioStreamer(stream_manager)
@@ -901,6 +1078,10 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description='Nova Sonic Python Streaming')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--rollover-after', type=int, default=None,
+                        help='Move the conversation to a fresh stream after this many seconds (keep it under the stream lifetime limit)')
+    parser.add_argument('--rollover-lead', type=int, default=30,
+                        help='Open the successor stream this many seconds before the rollover')
     args = parser.parse_args()
     # Set your AWS credentials here or use environment variables
     # os.environ['AWS_ACCESS_KEY_ID'] = "AWS_ACCESS_KEY_ID"
@@ -909,7 +1090,7 @@ if __name__ == "__main__":
 
     # Run the main function
     try:
-        asyncio.run(main(debug=args.debug))
+        asyncio.run(main(debug=args.debug, rollover_after=args.rollover_after, rollover_lead=args.rollover_lead))
     except Exception as e:
         print(f"Application error: {e}")
         if args.debug:
@@ -6,12 +6,13 @@ import warnings
 import pyaudio
 import datetime
 import time
-import inspect
+import sys
 from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
 from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
 from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
 from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
 from langchain_kb import pdf_knowledge_retrieval
+from event_decoder import EventDecoder
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -29,9 +30,11 @@ DEBUG = False
 def debug_print(message):
     """Print only if debug mode is enabled"""
     if DEBUG:
-        functionName = inspect.stack()[1].function
+        # Walk the frame chain directly; inspect.stack() builds context for every frame on each call
+        frame = sys._getframe(1)
+        functionName = frame.f_code.co_name
         if  functionName == 'time_it' or functionName == 'time_it_async':
-            functionName = inspect.stack()[2].function
+            functionName = frame.f_back.f_code.co_name
         print('{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())[:-3] + ' ' + functionName + ' ' + message)
 
 def time_it(label, methodToRun):
@@ -266,6 +269,17 @@ class BedrockStreamManager:
         self.toolUseId = ""
         self.toolName = ""
 
+        # Output event decoding: handler table keyed by event name
+        self.decoder = EventDecoder()
+        self.event_handlers = {
+            'contentStart': self._handle_content_start,
+            'contentEnd': self._handle_content_end,
+            'textOutput': self._handle_text_output,
+            'audioOutput': self._handle_audio_output,
+            'toolUse': self._handle_tool_use,
+            'completionEnd': self._handle_completion_end,
+        }
+
     def _initialize_client(self):
         """Initialize the Bedrock client."""
         config = Config(
@@ -443,65 +457,18 @@ class BedrockStreamManager:
                     result = await output[1].receive()
                     if result.value and result.value.bytes_:
                         try:
-                            response_data = result.value.bytes_.decode('utf-8')
-                            json_data = json.loads(response_data)
-                            
-                            # Handle different response types
-                            if 'event' in json_data:
-                                if 'contentStart' in json_data['event']:
-                                    debug_print("Content start detected")
-                                    content_start = json_data['event']['contentStart']
-                                    # set role
-                                    self.role = content_start['role']
-                                    # Check for speculative content
-                                    if 'additionalModelFields' in content_start:
-                                        try:
-                                            additional_fields = json.loads(content_start['additionalModelFields'])
-                                            if additional_fields.get('generationStage') == 'SPECULATIVE':
-                                                debug_print("Speculative content detected")
-                                                self.display_assistant_text = True
-                                            else:
-                                                self.display_assistant_text = False
-                                        except json.JSONDecodeError:
-                                            debug_print("Error parsing additionalModelFields")
-                                elif 'textOutput' in json_data['event']:
-                                    text_content = json_data['event']['textOutput']['content']
-                                    role = json_data['event']['textOutput']['role']
-                                    # Check if there is a barge-in
-                                    if '{ "interrupted" : true }' in text_content:
-                                        debug_print("Barge-in detected. Stopping audio output.")
-                                        self.barge_in = True
-
-                                    if (self.role == "ASSISTANT" and self.display_assistant_text):
-                                        print(f"Assistant: {text_content}")
-                                    elif (self.role == "USER"):
-                                        print(f"User: {text_content}")
-
-                                elif 'audioOutput' in json_data['event']:
-                                    audio_content = json_data['event']['audioOutput']['content']
-                                    audio_bytes = base64.b64decode(audio_content)
-                                    await self.audio_output_queue.put(audio_bytes)
-                                elif 'toolUse' in json_data['event']:
-                                    self.toolUseContent = json_data['event']['toolUse']
-                                    self.toolName = json_data['event']['toolUse']['toolName']
-                                    self.toolUseId = json_data['event']['toolUse']['toolUseId']
-                                    debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
-                                elif 'contentEnd' in json_data['event'] and json_data['event'].get('contentEnd', {}).get('type') == 'TOOL':
-                                    debug_print("Processing tool use and sending result")
-                                    toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
-                                    toolContent = str(uuid.uuid4())
-                                    await self.send_tool_start_event(toolContent)
-                                    await self.send_tool_result_event(toolContent, toolResult)
-                                    await self.send_tool_content_end_event(toolContent)
-                                
-                                elif 'completionEnd' in json_data['event']:
-                                    # Handle end of conversation, no more response will be generated
-                                    print("End of response sequence")
+                            event_name, body, json_data = self.decoder.decode(result.value.bytes_)
+                            # Dispatch on the event key through the handler table
+                            handler = self.event_handlers.get(event_name)
+                            if handler:
+                                await handler(body)
                             
-                            # Put the response in the output queue for other components
-                            await self.output_queue.put(json_data)
+                            # Put the response in the output queue for other components;
+                            # fast-path audio is only delivered through audio_output_queue
+                            if json_data is not None:
+                                await self.output_queue.put(json_data)
                         except json.JSONDecodeError:
-                            await self.output_queue.put({"raw_data": response_data})
+                            await self.output_queue.put({"raw_data": result.value.bytes_.decode('utf-8')})
                 except StopAsyncIteration:
                     # Stream has ended
                     break
@@ -519,6 +486,62 @@ class BedrockStreamManager:
         finally:
             self.is_active = False
 
+    async def _handle_content_start(self, content_start):
+        """Handle a contentStart event."""
+        debug_print("Content start detected")
+        # set role
+        self.role = content_start['role']
+        # Check for speculative content
+        if 'additionalModelFields' in content_start:
+            try:
+                if self.decoder.generation_stage(content_start) == 'SPECULATIVE':
+                    debug_print("Speculative content detected")
+                    self.display_assistant_text = True
+                else:
+                    self.display_assistant_text = False
+            except json.JSONDecodeError:
+                debug_print("Error parsing additionalModelFields")
+
+    async def _handle_text_output(self, text_output):
+        """Handle a textOutput event."""
+        text_content = text_output['content']
+        role = text_output['role']
+        # Check if there is a barge-in
+        if '{ "interrupted" : true }' in text_content:
+            debug_print("Barge-in detected. Stopping audio output.")
+            self.barge_in = True
+
+        if (self.role == "ASSISTANT" and self.display_assistant_text):
+            print(f"Assistant: {text_content}")
+        elif (self.role == "USER"):
+            print(f"User: {text_content}")
+
+    async def _handle_audio_output(self, audio_bytes):
+        """Handle an audioOutput event; the decoder has already base64-decoded the payload."""
+        await self.audio_output_queue.put(audio_bytes)
+
+    async def _handle_tool_use(self, tool_use):
+        """Handle a toolUse event."""
+        self.toolUseContent = tool_use
+        self.toolName = tool_use['toolName']
+        self.toolUseId = tool_use['toolUseId']
+        debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
+
+    async def _handle_content_end(self, content_end):
+        """Handle a contentEnd event."""
+        if content_end.get('type') == 'TOOL':
+            debug_print("Processing tool use and sending result")
+            toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
+            toolContent = str(uuid.uuid4())
+            await self.send_tool_start_event(toolContent)
+            await self.send_tool_result_event(toolContent, toolResult)
+            await self.send_tool_content_end_event(toolContent)
+
+    async def _handle_completion_end(self, completion_end):
+        """Handle a completionEnd event."""
+        # Handle end of conversation, no more response will be generated
+        print("End of response sequence")
+
     async def processToolUse(self, toolName, toolUseContent):
         """Return the tool result"""
         tool = toolName.lower()
@@ -0,0 +1,268 @@
+import math
+import time
+import numpy as np
+
+# Nova Sonic wire formats: 16-bit little-endian mono PCM
+WIRE_INPUT_RATE = 16000
+WIRE_OUTPUT_RATE = 24000
+
+
+class PolyphaseResampler:
+    """Streaming rational-ratio resampler using a Kaiser-windowed sinc filter split into polyphase branches.
+
+    Only the taps that touch real (non-zero-stuffed) input samples are evaluated,
+    filter history is carried across calls, and the working arrays are preallocated
+    and reused between calls. Works on float32 mono samples.
+    """
+
+    def __init__(self, in_rate, out_rate, zero_crossings=8, rolloff=0.92, beta=7.0, max_input=8192):
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.passthrough = self.up == self.down
+
+        # Lowpass prototype at the upsampled rate, cutting at the lower of the two Nyquist rates
+        factor = max(self.up, self.down)
+        cutoff = 0.5 * rolloff / factor
+        length = 2 * zero_crossings * factor + 1
+        t = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(length, beta) * self.up
+
+        # Polyphase branches: branch p holds taps p, p + up, p + 2*up ..., reversed for a forward dot product
+        self.taps_per_phase = -(-length // self.up)
+        padded = np.zeros(self.taps_per_phase * self.up)
+        padded[:length] = prototype
+        self.phases = np.ascontiguousarray(padded.reshape(self.taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+        # Absolute sample counters; output n is centred on input (n * down) // up
+        self.inputs_seen = 0
+        self.next_output = 0
+
+        self._history = self.taps_per_phase - 1
+        self._allocate(max_input)
+
+    def _allocate(self, max_input):
+        self.max_input = max_input
+        max_output = max_input * self.up // self.down + 2
+        self._buffer = np.zeros(self._history + max_input, dtype=np.float32)
+        self._windows = np.empty((max_output, self.taps_per_phase), dtype=np.float32)
+        self._taps = np.empty((max_output, self.taps_per_phase), dtype=np.float32)
+        self._output = np.empty(max_output, dtype=np.float32)
+        self._positions = np.empty(max_output, dtype=np.int64)
+        self._ramp = np.arange(max_output, dtype=np.int64)
+        self._phase = np.empty(max_output, dtype=np.int64)
+
+    def reset(self):
+        """Forget the filter history (e.g. after a barge-in flush)."""
+        self._buffer[:self._history] = 0
+        self.inputs_seen = 0
+        self.next_output = 0
+
+    def process(self, samples):
+        """Resample a block of float32 samples. The result is a view valid until the next call."""
+        if self.passthrough:
+            return samples
+        count = len(samples)
+        if count > self.max_input:
+            history = self._buffer[:self._history].copy()
+            self._allocate(count)
+            self._buffer[:self._history] = history
+
+        history = self._history
+        buffer = self._buffer
+        buffer[history:history + count] = samples
+        # Absolute input index of buffer[0]
+        base = self.inputs_seen - history
+        self.inputs_seen += count
+
+        # Every output whose centre input sample has arrived
+        first = self.next_output
+        end = (self.inputs_seen * self.up - 1) // self.down + 1
+        produced = end - first
+        if produced > 0:
+            positions = self._positions[:produced]
+            np.add(self._ramp[:produced], first, out=positions)
+            positions *= self.down
+            phase = np.remainder(positions, self.up, out=self._phase[:produced])
+            positions //= self.up
+            # Start of each window inside the buffer
+            positions -= base + self.taps_per_phase - 1
+
+            windows = np.lib.stride_tricks.sliding_window_view(buffer[:history + count], self.taps_per_phase)
+            np.take(windows, positions, axis=0, out=self._windows[:produced])
+            np.take(self.phases, phase, axis=0, out=self._taps[:produced])
+            np.einsum('ij,ij->i', self._windows[:produced], self._taps[:produced], out=self._output[:produced])
+            self.next_output = end
+        else:
+            produced = 0
+
+        # Keep the tail as history for the next block
+        buffer[:history] = buffer[count:count + history]
+        return self._output[:produced]
+
+
+class CaptureConverter:
+    """Converts microphone audio from the device's native format to 16 kHz mono 16-bit PCM."""
+
+    def __init__(self, device_rate, device_channels, wire_rate=WIRE_INPUT_RATE, max_frames=8192):
+        self.device_rate = device_rate
+        self.device_channels = device_channels
+        self.resampler = PolyphaseResampler(device_rate, wire_rate, max_input=max_frames)
+        self._mono = np.empty(max_frames, dtype=np.float32)
+        self._pcm = np.empty(max_frames * wire_rate // device_rate + 2, dtype=np.int16)
+
+    @property
+    def identity(self):
+        return self.device_channels == 1 and self.resampler.passthrough
+
+    def convert(self, data):
+        """Return wire-format PCM bytes for one device buffer (interleaved 16-bit)."""
+        if self.identity:
+            return data
+        frames = np.frombuffer(data, dtype=np.int16).reshape(-1, self.device_channels)
+        count = len(frames)
+        if count > len(self._mono):
+            self._mono = np.empty(count, dtype=np.float32)
+            self._pcm = np.empty(count * self.resampler.up // self.resampler.down + 2, dtype=np.int16)
+
+        # Downmix to mono
+        mono = self._mono[:count]
+        if self.device_channels == 1:
+            mono[:] = frames[:, 0]
+        else:
+            np.mean(frames, axis=1, dtype=np.float32, out=mono)
+
+        resampled = self.resampler.process(mono)
+        return _to_pcm16(resampled, self._pcm)
+
+    def reset(self):
+        self.resampler.reset()
+
+
+class PlaybackConverter:
+    """Converts 24 kHz mono 16-bit PCM from Nova Sonic to the output device's native format."""
+
+    def __init__(self, device_rate, device_channels, wire_rate=WIRE_OUTPUT_RATE, max_frames=16384):
+        self.device_rate = device_rate
+        self.device_channels = device_channels
+        self.resampler = PolyphaseResampler(wire_rate, device_rate, max_input=max_frames)
+        self._samples = np.empty(max_frames, dtype=np.float32)
+        self._pcm = np.empty((max_frames * device_rate // wire_rate + 2, device_channels), dtype=np.int16)
+
+    @property
+    def identity(self):
+        return self.device_channels == 1 and self.resampler.passthrough
+
+    def convert(self, data):
+        """Return interleaved device-format PCM bytes for a block of wire-format audio."""
+        if self.identity:
+            return data
+        pcm = np.frombuffer(data, dtype=np.int16)
+        count = len(pcm)
+        if count > len(self._samples):
+            self._samples = np.empty(count, dtype=np.float32)
+            rows = count * self.resampler.up // self.resampler.down + 2
+            self._pcm = np.empty((rows, self.device_channels), dtype=np.int16)
+
+        samples = self._samples[:count]
+        samples[:] = pcm
+        resampled = self.resampler.process(samples)
+        produced = len(resampled)
+
+        # Upmix: the same signal on every channel
+        out = self._pcm[:produced]
+        np.clip(np.rint(resampled, out=resampled), -32768, 32767, out=resampled)
+        out[:] = resampled[:, None]
+        return out.tobytes()
+
+    def reset(self):
+        self.resampler.reset()
+
+
+class ConvertingSink:
+    """Wraps an audio sink (e.g. PlaybackEngine) so wire-format writes are converted to the device format."""
+
+    def __init__(self, sink, converter):
+        self.sink = sink
+        self.converter = converter
+
+    def write(self, data):
+        self.sink.write(self.converter.convert(data))
+
+    def flush(self):
+        self.converter.reset()
+        self.sink.flush()
+
+
+def _to_pcm16(samples, out):
+    """Round and clip float samples into the preallocated int16 buffer and return the bytes."""
+    np.clip(np.rint(samples, out=samples), -32768, 32767, out=samples)
+    pcm = out[:len(samples)]
+    pcm[:] = samples
+    return pcm.tobytes()
+
+
+def native_format(p, wire_rate, input=True, device_index=None):
+    """Pick (rate, channels) for a device: the wire format if the device accepts it, else its native format."""
+    if device_index is None:
+        info = p.get_default_input_device_info() if input else p.get_default_output_device_info()
+    else:
+        info = p.get_device_info_by_index(device_index)
+    max_channels = int(info['maxInputChannels'] if input else info['maxOutputChannels'])
+    native_rate = int(info['defaultSampleRate'])
+
+    import pyaudio
+    for rate, channels in ((wire_rate, 1), (native_rate, 1), (wire_rate, min(2, max_channels)), (native_rate, min(2, max_channels))):
+        try:
+            if input:
+                supported = p.is_format_supported(rate, input_device=info['index'], input_channels=channels,
+                                                  input_format=pyaudio.paInt16)
+            else:
+                supported = p.is_format_supported(rate, output_device=info['index'], output_channels=channels,
+                                                  output_format=pyaudio.paInt16)
+        except ValueError:
+            supported = False
+        if supported:
+            return rate, channels
+    return native_rate, max(1, min(2, max_channels))
+
+
+def benchmark(seconds=10.0, block_ms=32):
+    """Measure CPU time per second of audio for common device conversions."""
+    results = {}
+    cases = [
+        ("capture 48000 Hz stereo -> 16000 Hz mono", CaptureConverter, 48000, 2, 48000),
+        ("capture 44100 Hz stereo -> 16000 Hz mono", CaptureConverter, 44100, 2, 44100),
+        ("capture 48000 Hz mono -> 16000 Hz mono", CaptureConverter, 48000, 1, 48000),
+        ("playback 24000 Hz mono -> 48000 Hz stereo", PlaybackConverter, 48000, 2, WIRE_OUTPUT_RATE),
+        ("playback 24000 Hz mono -> 44100 Hz stereo", PlaybackConverter, 44100, 2, WIRE_OUTPUT_RATE),
+    ]
+    for label, converter_class, device_rate, channels, source_rate in cases:
+        converter = converter_class(device_rate, channels)
+        source_channels = channels if converter_class is CaptureConverter else 1
+        frames = int(source_rate * block_ms / 1000)
+        t = np.arange(frames * int(seconds * 1000 / block_ms)) / source_rate
+        signal = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+        signal = np.repeat(signal[:, None], source_channels, axis=1)
+        blocks = [signal[i:i + frames].tobytes() for i in range(0, len(signal), frames)]
+
+        start = time.process_time()
+        for block in blocks:
+            converter.convert(block)
+        cpu = time.process_time() - start
+        results[label] = {
+            "cpu_ms_per_audio_second": round(cpu * 1000 / seconds, 3),
+            "realtime_factor": round(seconds / cpu, 1) if cpu else None,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Microbenchmark for the device audio adapter')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Seconds of audio per conversion')
+    parser.add_argument('--block-ms', type=int, default=32, help='Size of each converted block in milliseconds')
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.seconds, args.block_ms), indent=2))
@@ -0,0 +1,165 @@
+import threading
+import time
+import pyaudio
+
+
+class PlaybackEngine:
+    """Low-jitter playback using PyAudio callback-mode output fed from a ring buffer.
+
+    Decoded audio is written into a preallocated jitter buffer from the event loop.
+    PortAudio pulls fixed-size blocks from it on its own thread, so there is no
+    executor round trip per slice. Playback starts (and restarts after an underrun)
+    only once `target_depth_ms` of audio is buffered, and `flush()` drops everything
+    buffered in O(1) for barge-in.
+    """
+
+    def __init__(self, pyaudio_instance, rate=24000, channels=1, sample_width=2,
+                 frames_per_buffer=512, target_depth_ms=120, capacity_ms=30000, underrun_gap_ms=500):
+        self.p = pyaudio_instance
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.bytes_per_frame = sample_width * channels
+        self.target_depth_bytes = int(rate * target_depth_ms / 1000) * self.bytes_per_frame
+        self.target_depth = target_depth_ms / 1000
+
+        # Preallocated jitter buffer, absolute positions modulo capacity
+        self.capacity = int(rate * capacity_ms / 1000) * self.bytes_per_frame
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+        self._read_pos = 0
+        self._write_pos = 0
+        self._lock = threading.Lock()
+        self._priming = True
+        # Set when the buffer runs dry; audio arriving soon after means it was late, not a new response
+        self._starved_at = None
+        self._last_write_at = 0.0
+        self.underrun_gap = underrun_gap_ms / 1000
+        self._silence = bytes(frames_per_buffer * self.bytes_per_frame)
+
+        self.stream = None
+
+        # Counters
+        self.underruns = 0
+        self.overruns = 0
+        self.flushes = 0
+        self.played_bytes = 0
+        self.dropped_bytes = 0
+
+    @property
+    def buffered_bytes(self):
+        """Number of bytes waiting to be played."""
+        return self._write_pos - self._read_pos
+
+    @property
+    def buffered_ms(self):
+        """Buffered audio expressed in milliseconds."""
+        return self.buffered_bytes / self.bytes_per_frame / self.rate * 1000
+
+    def open(self):
+        """Open the callback-mode output stream."""
+        self.stream = self.p.open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.rate,
+            output=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._callback
+        )
+        return self.stream
+
+    def start(self):
+        """Start pulling audio from the jitter buffer."""
+        if self.stream and not self.stream.is_active():
+            self.stream.start_stream()
+
+    def close(self):
+        """Stop and close the output stream."""
+        if self.stream:
+            if self.stream.is_active():
+                self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def write(self, data):
+        """Append decoded PCM to the jitter buffer, dropping the oldest audio on overrun."""
+        data = memoryview(data)
+        size = len(data)
+        if not size:
+            return
+        if size > self.capacity:
+            data = data[size - self.capacity:]
+            self.dropped_bytes += size - self.capacity
+            size = self.capacity
+
+        now = time.monotonic()
+        with self._lock:
+            self._last_write_at = now
+            if self._starved_at is not None:
+                if now - self._starved_at < self.underrun_gap:
+                    self.underruns += 1
+                self._starved_at = None
+
+            free = self.capacity - (self._write_pos - self._read_pos)
+            if size > free:
+                overflow = size - free
+                # Keep sample alignment when dropping from the head
+                overflow += -overflow % self.bytes_per_frame
+                self._read_pos += overflow
+                self.dropped_bytes += overflow
+                self.overruns += 1
+
+            start = self._write_pos % self.capacity
+            first = min(size, self.capacity - start)
+            self._view[start:start + first] = data[:first]
+            if first < size:
+                self._view[0:size - first] = data[first:]
+            self._write_pos += size
+
+    def flush(self):
+        """Drop all buffered audio immediately (barge-in)."""
+        with self._lock:
+            self._read_pos = self._write_pos
+            self._priming = True
+            self._starved_at = None
+            self.flushes += 1
+
+    def stats(self):
+        """Return a snapshot of the playback counters."""
+        return {
+            "buffered_ms": round(self.buffered_ms, 1),
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "flushes": self.flushes,
+            "played_bytes": self.played_bytes,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """PortAudio callback, runs on the audio thread."""
+        needed = frame_count * self.bytes_per_frame
+        with self._lock:
+            available = self._write_pos - self._read_pos
+            if self._priming:
+                # Hold playback until the target depth is reached, unless the writer went quiet (end of response)
+                if available < self.target_depth_bytes and (
+                        not available or time.monotonic() - self._last_write_at < self.target_depth):
+                    return (self._silence if needed == len(self._silence) else bytes(needed), pyaudio.paContinue)
+                self._priming = False
+
+            size = min(needed, available)
+            start = self._read_pos % self.capacity
+            first = min(size, self.capacity - start)
+            out = bytes(self._view[start:start + first])
+            if first < size:
+                out += bytes(self._view[0:size - first])
+            self._read_pos += size
+            self.played_bytes += size
+
+            if size < needed:
+                # Ran dry: pad with silence and rebuild the target depth before resuming
+                self._priming = True
+                self._starved_at = time.monotonic()
+                out += bytes(needed - size)
+
+        return (out, pyaudio.paContinue)
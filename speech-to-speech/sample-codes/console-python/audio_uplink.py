@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+
+# Overflow policies applied when the ring buffer is full
+DROP_OLDEST = "drop_oldest"  # Overwrite the oldest buffered frames, keeps the newest speech
+DROP_NEWEST = "drop_newest"  # Reject the incoming chunk, keeps what is already queued
+
+
+class AudioUplink:
+    """Coalescing, bounded audio uplink fed by the PyAudio callback thread and drained by a single sender task.
+
+    Microphone chunks are copied into a preallocated ring buffer. One long-lived
+    asyncio task waits until at least one full frame of `frame_ms` is buffered and
+    hands it to `send_frame`. When the sender falls behind, up to `max_merge_frames`
+    frames are merged into a single event so the backlog is worked off quickly.
+    """
+
+    def __init__(self, send_frame, sample_rate=16000, sample_width=2, channels=1,
+                 frame_ms=64, capacity_ms=2000, policy=DROP_OLDEST, max_merge_frames=4):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown uplink overflow policy: {policy}")
+
+        self.send_frame = send_frame
+        self.policy = policy
+        self.frame_ms = frame_ms
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * sample_width * channels
+        self.max_merge_frames = max(1, max_merge_frames)
+
+        # Preallocated ring buffer, sized in whole frames
+        self.frame_slots = max(2, capacity_ms // frame_ms)
+        self.capacity = self.frame_slots * self.frame_bytes
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+        # Monotonic time at which each frame slot became complete, used for send latency
+        self._frame_ready_at = [0.0] * self.frame_slots
+
+        # Absolute read/write positions; the ring offset is position % capacity
+        self._read_pos = 0
+        self._write_pos = 0
+        self._lock = threading.Lock()
+
+        self._loop = None
+        self._wakeup = None
+        self._waiting = False
+        self._sender_task = None
+        self.is_running = False
+
+        # Counters
+        self.received_bytes = 0
+        self.sent_frames = 0
+        self.sent_events = 0
+        self.sent_bytes = 0
+        self.dropped_frames = 0
+        self.dropped_bytes = 0
+        self.send_latency_total = 0.0
+        self.send_latency_max = 0.0
+
+    @property
+    def queued_bytes(self):
+        """Number of bytes buffered and not yet sent."""
+        return self._write_pos - self._read_pos
+
+    def start(self):
+        """Start the sender task on the running event loop."""
+        if self.is_running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.is_running = True
+        self._sender_task = asyncio.create_task(self._run())
+
+    async def stop(self, flush=True):
+        """Stop the sender task, optionally sending everything still buffered, including a partial frame."""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._wakeup.set()
+        if self._sender_task:
+            try:
+                await self._sender_task
+            except asyncio.CancelledError:
+                pass
+        if flush:
+            # Each take returns at most max_merge_frames frames
+            while True:
+                frame = self._take(allow_partial=True)
+                if not frame:
+                    break
+                await self._send(frame)
+
+    def write(self, data):
+        """Copy an audio chunk into the ring buffer. Safe to call from any thread."""
+        data = memoryview(data)
+        size = len(data)
+        if not size:
+            return
+        if size > self.capacity:
+            # A chunk larger than the whole ring only keeps its most recent audio
+            self._count_drop(size - self.capacity)
+            data = data[size - self.capacity:]
+            size = self.capacity
+
+        with self._lock:
+            self.received_bytes += size
+            free = self.capacity - (self._write_pos - self._read_pos)
+            if size > free:
+                if self.policy == DROP_NEWEST:
+                    self._count_drop(size)
+                    return
+                # Drop whole frames from the head to make room
+                overflow = size - free
+                frames = -(-overflow // self.frame_bytes)
+                dropped = min(frames * self.frame_bytes, self._write_pos - self._read_pos)
+                self._read_pos += dropped
+                self._count_drop(dropped)
+
+            start = self._write_pos % self.capacity
+            first = min(size, self.capacity - start)
+            self._view[start:start + first] = data[:first]
+            if first < size:
+                self._view[0:size - first] = data[first:]
+
+            # Stamp every frame slot completed by this write
+            previous_frames = self._write_pos // self.frame_bytes
+            self._write_pos += size
+            completed_frames = self._write_pos // self.frame_bytes
+            if completed_frames > previous_frames:
+                now = time.perf_counter()
+                for frame in range(previous_frames, completed_frames):
+                    self._frame_ready_at[frame % self.frame_slots] = now
+
+            # Wake the sender at most once per frame instead of once per chunk
+            if self._waiting and self._write_pos - self._read_pos >= self.frame_bytes:
+                self._waiting = False
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stats(self):
+        """Return a snapshot of the uplink counters."""
+        return {
+            "frame_ms": self.frame_ms,
+            "policy": self.policy,
+            "queued_bytes": self.queued_bytes,
+            "received_bytes": self.received_bytes,
+            "sent_frames": self.sent_frames,
+            "sent_events": self.sent_events,
+            "sent_bytes": self.sent_bytes,
+            "dropped_frames": self.dropped_frames,
+            "dropped_bytes": self.dropped_bytes,
+            "send_latency_avg_ms": (self.send_latency_total / self.sent_events * 1000) if self.sent_events else 0.0,
+            "send_latency_max_ms": self.send_latency_max * 1000,
+        }
+
+    def _count_drop(self, size):
+        self.dropped_bytes += size
+        self.dropped_frames += -(-size // self.frame_bytes)
+
+    def _take(self, allow_partial=False):
+        """Remove up to `max_merge_frames` whole frames from the ring and return them with their ready time."""
+        with self._lock:
+            available = self._write_pos - self._read_pos
+            frames = min(available // self.frame_bytes, self.max_merge_frames)
+            if frames:
+                size = frames * self.frame_bytes
+            elif allow_partial and available:
+                size = available
+            else:
+                # Nothing to send yet, ask the writer to wake us once a frame is complete
+                self._waiting = True
+                self._wakeup.clear()
+                return None
+
+            start = self._read_pos % self.capacity
+            first = min(size, self.capacity - start)
+            if first == size:
+                data = bytes(self._view[start:start + size])
+            else:
+                data = bytes(self._view[start:]) + bytes(self._view[:size - first])
+            ready_at = self._frame_ready_at[(self._read_pos // self.frame_bytes) % self.frame_slots] if frames else time.perf_counter()
+            self._read_pos += size
+            return data, ready_at, max(frames, 1)
+
+    async def _send(self, frame):
+        data, ready_at, frames = frame
+        await self.send_frame(data)
+        latency = time.perf_counter() - ready_at
+        self.sent_frames += frames
+        self.sent_events += 1
+        self.sent_bytes += len(data)
+        self.send_latency_total += latency
+        if latency > self.send_latency_max:
+            self.send_latency_max = latency
+
+    async def _run(self):
+        """Single long-lived sender loop."""
+        while self.is_running:
+            frame = self._take()
+            if frame is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._send(frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error sending audio frame: {e}")
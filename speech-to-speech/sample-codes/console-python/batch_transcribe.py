@@ -0,0 +1,332 @@
+"""Offline batch mode: run recorded calls through BedrockStreamManager.
+
+Each WAV or raw PCM file in a directory is streamed over its own Nova Sonic
+session at a configurable speed, with a bounded number of sessions in flight.
+The transcript (user speech and final assistant text), tool calls and timing of
+every file are appended to a JSON Lines manifest as soon as the file finishes,
+so an interrupted run picks up where it left off.
+
+    python batch_transcribe.py calls/ --out results/ --concurrency 4 --speed 2
+
+WAV files in any rate or channel count are converted to 16 kHz mono with
+`audio_adapter.py`; `.pcm` / `.raw` files must already be 16 kHz mono 16-bit.
+Sessions use the tool use client by default, so the model's tool calls run and
+the conversation continues past them; `--client basic` offers no tools.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import time
+import wave
+
+import nova_sonic
+from audio_adapter import CaptureConverter
+
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+CHUNK_FRAMES = nova_sonic.CHUNK_SIZE
+AUDIO_EXTENSIONS = ('.wav', '.pcm', '.raw')
+INTERRUPTED = '{ "interrupted" : true }'
+# --client choices: module providing the BedrockStreamManager to use
+CLIENTS = {
+    'tool_use': 'nova_sonic_tool_use',
+    'basic': 'nova_sonic',
+}
+
+
+def load_audio(path):
+    """Return 16 kHz mono 16-bit PCM for a WAV or raw PCM file."""
+    if not path.lower().endswith('.wav'):
+        with open(path, 'rb') as f:
+            return f.read()
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != SAMPLE_WIDTH:
+            raise ValueError(f"{path}: expected 16-bit PCM, got {8 * wav.getsampwidth()}-bit")
+        rate, channels = wav.getframerate(), wav.getnchannels()
+        pcm = wav.readframes(wav.getnframes())
+    if (rate, channels) != (INPUT_SAMPLE_RATE, 1):
+        pcm = CaptureConverter(rate, channels).convert(pcm)
+    return pcm
+
+
+def find_audio_files(directory):
+    """Audio files under `directory`, as sorted paths relative to it."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(found)
+
+
+class Manifest:
+    """Append-only JSON Lines manifest; the last entry for a file wins.
+
+    A file is done when its latest entry succeeded and its size and modification
+    time still match, so edited files are processed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write can leave a partial last line
+                        continue
+                    self.entries[entry['file']] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, name, stat):
+        entry = self.entries.get(name)
+        return bool(entry and entry['status'] == 'ok' and entry['size'] == stat.st_size
+                    and entry['mtime'] == stat.st_mtime)
+
+    def append(self, entry):
+        """Write one entry and flush it to disk."""
+        self.entries[entry['file']] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SessionCollector:
+    """Hooks into a BedrockStreamManager's handler table and collects transcript, tool calls and timing."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.transcript = []
+        self.tool_calls = []
+        self.output_audio_bytes = 0
+        self.assistant_turns = 0
+        self.started_at = time.perf_counter()
+        self.last_event_at = self.started_at
+        self.audio_end_at = None
+        self.first_text_at = None
+        self.first_audio_at = None
+        self._role = None
+        self._stage = None
+
+        handlers = manager.event_handlers
+        self._chained = dict(handlers)
+        handlers['contentStart'] = self._content_start
+        handlers['contentEnd'] = self._content_end
+        handlers['textOutput'] = self._text_output
+        handlers['toolUse'] = self._tool_use
+        # Nothing is played; only the amount of audio is kept
+        handlers['audioOutput'] = self._audio_output
+
+    async def _content_start(self, content_start):
+        self.last_event_at = time.perf_counter()
+        self._role = content_start.get('role')
+        self._stage = None
+        if 'additionalModelFields' in content_start:
+            self._stage = self.manager.decoder.generation_stage(content_start)
+        await self._chained['contentStart'](content_start)
+
+    async def _content_end(self, content_end):
+        self.last_event_at = time.perf_counter()
+        if self._role == 'ASSISTANT' and content_end.get('stopReason') == 'END_TURN':
+            self.assistant_turns += 1
+        await self._chained['contentEnd'](content_end)
+
+    async def _text_output(self, text_output):
+        self.last_event_at = time.perf_counter()
+        content = text_output.get('content', '')
+        role = text_output.get('role', self._role)
+        if INTERRUPTED in content:
+            self.transcript.append({"role": role, "interrupted": True})
+        # Speculative assistant text is repeated as FINAL, keep only the final version
+        elif role == 'USER' or self._stage != 'SPECULATIVE':
+            if role == 'ASSISTANT' and self.first_text_at is None:
+                self.first_text_at = self.last_event_at
+            if self.transcript and self.transcript[-1].get('role') == role and 'text' in self.transcript[-1]:
+                self.transcript[-1]['text'] += ' ' + content
+            else:
+                self.transcript.append({"role": role, "text": content})
+        await self._chained['textOutput'](text_output)
+
+    async def _tool_use(self, tool_use):
+        self.last_event_at = time.perf_counter()
+        self.tool_calls.append({
+            "toolName": tool_use.get('toolName'),
+            "toolUseId": tool_use.get('toolUseId'),
+            "content": tool_use.get('content'),
+            "at_seconds": round(self.last_event_at - self.started_at, 3),
+        })
+        # The basic client offers no tools and has no toolUse handler
+        if 'toolUse' in self._chained:
+            await self._chained['toolUse'](tool_use)
+
+    async def _audio_output(self, audio_bytes):
+        self.last_event_at = time.perf_counter()
+        if self.first_audio_at is None:
+            self.first_audio_at = self.last_event_at
+        self.output_audio_bytes += len(audio_bytes)
+
+    def timing(self, finished_at):
+        """Per-file timing; response latencies are measured from the end of the file's audio."""
+        def since_audio_end(at):
+            return round((at - self.audio_end_at) * 1000, 1) if at and self.audio_end_at and at > self.audio_end_at else None
+        return {
+            "wall_seconds": round(finished_at - self.started_at, 3),
+            "first_text_ms": since_audio_end(self.first_text_at),
+            "first_audio_ms": since_audio_end(self.first_audio_at),
+            "output_audio_seconds": round(self.output_audio_bytes / (OUTPUT_SAMPLE_RATE * SAMPLE_WIDTH), 2),
+        }
+
+
+async def stream_pcm(manager, pcm, speed):
+    """Feed PCM to the manager in microphone-sized chunks, paced to `speed` times real time."""
+    chunk_bytes = CHUNK_FRAMES * SAMPLE_WIDTH
+    chunk_seconds = CHUNK_FRAMES / INPUT_SAMPLE_RATE
+    started = time.perf_counter()
+    sent_seconds = 0.0
+    for offset in range(0, len(pcm), chunk_bytes):
+        manager.add_audio_chunk(pcm[offset:offset + chunk_bytes])
+        sent_seconds += chunk_seconds
+        # Pace against the wall clock so slow iterations do not accumulate drift
+        delay = started + sent_seconds / speed - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+
+
+async def process_file(client, directory, name, speed, trailing_silence, idle_seconds, timeout):
+    """Run one file through its own session of the `client` module and return its manifest entry."""
+    path = os.path.join(directory, name)
+    stat = os.stat(path)
+    entry = {"file": name, "size": stat.st_size, "mtime": stat.st_mtime}
+    manager = None
+    try:
+        pcm = load_audio(path)
+        entry["audio_seconds"] = round(len(pcm) / (INPUT_SAMPLE_RATE * SAMPLE_WIDTH), 3)
+
+        manager = client.BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
+        collector = SessionCollector(manager)
+        await manager.initialize_stream()
+        await manager.send_audio_content_start_event()
+
+        await stream_pcm(manager, pcm, speed)
+        collector.audio_end_at = time.perf_counter()
+        # Silence after the recording lets the model detect the end of the last user turn
+        await stream_pcm(manager, bytes(int(trailing_silence * INPUT_SAMPLE_RATE) * SAMPLE_WIDTH), speed)
+
+        # Done once the assistant has finished a turn and the stream has gone quiet,
+        # when the response stream ends, or on timeout
+        deadline = collector.audio_end_at + timeout
+        while time.perf_counter() < deadline and not manager.response_task.done():
+            quiet = time.perf_counter() - collector.last_event_at
+            if collector.assistant_turns and quiet >= idle_seconds:
+                break
+            await asyncio.sleep(0.1)
+
+        entry.update({
+            "status": "ok",
+            "transcript": collector.transcript,
+            "tool_calls": collector.tool_calls,
+            "timing": collector.timing(time.perf_counter()),
+        })
+        if manager.response_error is not None:
+            error = manager.response_error
+            entry.update({"status": "error", "error": f"{type(error).__name__}: {error}"})
+        elif manager.response_task.done() and not collector.assistant_turns:
+            entry.update({"status": "error", "error": "Response stream ended before the assistant answered"})
+        elif time.perf_counter() >= deadline:
+            entry["status"] = "timeout"
+    except Exception as e:
+        entry.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        if manager:
+            await manager.close()
+    return entry
+
+
+async def run_batch(directory, out_dir, concurrency=4, speed=1.0, trailing_silence=2.0, idle_seconds=3.0,
+                    timeout=60.0, verbose=False, client='tool_use'):
+    """Process every pending file in `directory` and return the throughput report."""
+    client = importlib.import_module(CLIENTS[client])
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(out_dir, 'manifest.jsonl'))
+    files = find_audio_files(directory)
+    pending = [name for name in files if not manifest.is_done(name, os.stat(os.path.join(directory, name)))]
+    print(f"{len(files)} audio files, {len(files) - len(pending)} already done, {len(pending)} to process")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"ok": 0, "timeout": 0, "error": 0}
+    audio_seconds = 0.0
+    first_text = []
+
+    async def worker(name):
+        nonlocal audio_seconds
+        async with semaphore:
+            entry = await process_file(client, directory, name, speed, trailing_silence, idle_seconds, timeout)
+        manifest.append(entry)
+        counts[entry["status"]] += 1
+        audio_seconds += entry.get("audio_seconds", 0.0)
+        if entry.get("timing", {}).get("first_text_ms") is not None:
+            first_text.append(entry["timing"]["first_text_ms"])
+        print(f"[{sum(counts.values())}/{len(pending)}] {name}: {entry['status']}", file=sys.stderr)
+
+    client.STARTUP.finish()
+    started = time.perf_counter()
+    # The client prints each User/Assistant line; keep that out of the report unless asked for
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            await asyncio.gather(*(worker(name) for name in pending))
+    finally:
+        manifest.close()
+    wall = time.perf_counter() - started
+
+    return {
+        "files_total": len(files),
+        "files_skipped": len(files) - len(pending),
+        "files_processed": len(pending),
+        **{f"files_{status}": count for status, count in counts.items()},
+        "client": client.__name__,
+        "concurrency": concurrency,
+        "speed": speed,
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall, 2),
+        "audio_seconds_per_wall_second": round(audio_seconds / wall, 2) if wall else None,
+        "files_per_minute": round(len(pending) * 60 / wall, 2) if wall else None,
+        "mean_first_text_ms": round(sum(first_text) / len(first_text), 1) if first_text else None,
+        "manifest": manifest.path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a directory of recorded calls through Nova Sonic')
+    parser.add_argument('directory', help='Directory of .wav / .pcm / .raw files (searched recursively)')
+    parser.add_argument('--out', default='batch_output', help='Output directory for manifest.jsonl')
+    parser.add_argument('--concurrency', type=int, default=4, help='Sessions in flight at once')
+    parser.add_argument('--speed', type=float, default=1.0, help='Streaming speed: 1 is real time, 2 is twice as fast')
+    parser.add_argument('--trailing-silence', type=float, default=2.0, help='Seconds of silence sent after each file')
+    parser.add_argument('--idle-seconds', type=float, default=3.0, help='Quiet period after the last response that ends a file')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Maximum seconds to wait for responses after the audio ends')
+    parser.add_argument('--verbose', action='store_true', help="Keep the client's User/Assistant console output")
+    parser.add_argument('--client', choices=sorted(CLIENTS), default='tool_use',
+                        help='tool_use runs the sample tools when the model calls them; basic offers no tools')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_batch(args.directory, args.out, concurrency=args.concurrency, speed=args.speed,
+                                   trailing_silence=args.trailing_silence, idle_seconds=args.idle_seconds,
+                                   timeout=args.timeout, verbose=args.verbose, client=args.client))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Session flight recorder and replayer for Nova Sonic clients.
+
+Records every event sent to and received from the bidirectional stream into an
+append-only binary log. Each record is a fixed header followed by its payload:
+
+    <u32 payload length> <u64 ns since recording start> <u8 direction> <u8 kind> <payload>
+
+Outbound audio is stored as raw PCM (before base64), other events as the JSON
+bytes that went over the wire. Records are queued without blocking and written
+by a background thread, so recording costs the event loop one tuple per event.
+
+The same module replays a log: recorded inbound events are served from a
+stand-in for `invoke_model_with_bidirectional_stream` and recorded microphone
+audio is fed back through `add_audio_chunk`, both on the original timeline
+(optionally accelerated), against a real `BedrockStreamManager`. The workshop
+server's copy of this module replays into its `S2sSessionManager` instead.
+
+    python flight_recorder.py dump session.sfr
+    python flight_recorder.py replay session.sfr --speed 4 --record replay.sfr
+"""
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+MAGIC = b"SONICFR1"
+# Wall-clock start of the recording, in ns since the epoch
+FILE_HEADER = struct.Struct("<8sQ")
+RECORD_HEADER = struct.Struct("<IQBB")
+
+# Directions
+OUTBOUND = 0
+INBOUND = 1
+
+# Kinds
+EVENT = 0        # JSON event bytes
+AUDIO = 1        # raw 16-bit PCM of an audioInput event
+
+DIRECTION_NAMES = {OUTBOUND: "out", INBOUND: "in"}
+
+FlightRecord = namedtuple("FlightRecord", "timestamp_ns direction kind payload")
+
+
+class FlightRecorder:
+    """Append-only session log written by a background thread.
+
+    `record_*` calls only timestamp the event and put it on a queue. The writer
+    thread packs records into a buffered file and flushes whenever the queue
+    runs empty, so a crash loses at most the records still queued.
+    """
+
+    def __init__(self, path, clock=time.monotonic_ns):
+        self.path = path
+        self.clock = clock
+        self.origin = clock()
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, time.time_ns()))
+        self._thread = threading.Thread(target=self._write_loop, name="flight-recorder", daemon=True)
+        self._thread.start()
+        self.closed = False
+
+        # Counters
+        self.records = 0
+        self.bytes_written = FILE_HEADER.size
+
+    def record_event(self, direction, data):
+        """Record a JSON event (str or bytes) sent or received."""
+        if self.closed:
+            return
+        self._queue.put((self.clock() - self.origin, direction, EVENT, data))
+
+    def record_audio(self, pcm):
+        """Record outbound microphone audio as raw PCM."""
+        if self.closed:
+            return
+        self._queue.put((self.clock() - self.origin, OUTBOUND, AUDIO, bytes(pcm)))
+
+    def close(self):
+        """Write out everything queued and close the log."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def stats(self):
+        """Return the recorder counters."""
+        return {"records": self.records, "bytes_written": self.bytes_written, "path": self.path}
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write(*item)
+            if self._queue.empty():
+                self._file.flush()
+        self._file.flush()
+
+    def _write(self, timestamp_ns, direction, kind, payload):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self._file.write(RECORD_HEADER.pack(len(payload), timestamp_ns, direction, kind))
+        self._file.write(payload)
+        self.records += 1
+        self.bytes_written += RECORD_HEADER.size + len(payload)
+
+
+def read_log(path):
+    """Yield the FlightRecords of a log in order. A truncated final record is ignored."""
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"{path} is not a flight recorder log")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, timestamp_ns, direction, kind = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield FlightRecord(timestamp_ns, direction, kind, payload)
+
+
+def event_name(record):
+    """Return the event key of a record ("audioInput" for raw audio records)."""
+    if record.kind == AUDIO:
+        return "audioInput"
+    try:
+        return next(iter(json.loads(record.payload)["event"]))
+    except (ValueError, KeyError, StopIteration):
+        return "?"
+
+
+def dump(path):
+    """Print one line per record: time, direction, event name and size."""
+    for record in read_log(path):
+        print(f"{record.timestamp_ns / 1e6:10.1f} ms  {DIRECTION_NAMES[record.direction]:3}  "
+              f"{event_name(record):14} {len(record.payload):7} B")
+
+
+class _Received:
+    def __init__(self, payload):
+        self.value = _Payload(payload)
+
+
+class _Payload:
+    def __init__(self, payload):
+        self.bytes_ = payload
+
+
+class _ReplayOutput:
+    def __init__(self, payload):
+        self._result = _Received(payload)
+
+    async def receive(self):
+        return self._result
+
+
+class _ReplayInputStream:
+    """Accepts and counts the events the manager sends."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.events = 0
+
+    async def send(self, event):
+        self.events += 1
+
+    async def close(self):
+        self.owner.closed.set()
+
+
+class ReplayStream:
+    """Stand-in bidirectional stream serving recorded inbound events on the replay timeline."""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.input_stream = _ReplayInputStream(self)
+        self.closed = asyncio.Event()
+        self._events = iter(replayer.inbound)
+
+    async def await_output(self):
+        record = next(self._events, None)
+        if record is None:
+            # Nothing left to replay: behave like an idle stream until the manager closes it
+            await self.closed.wait()
+            raise StopAsyncIteration
+        await self.replayer.wait_until(record.timestamp_ns)
+        self.replayer.inbound_replayed += 1
+        return None, _ReplayOutput(record.payload)
+
+
+class ReplayClient:
+    """Stand-in for BedrockRuntimeClient that opens a ReplayStream."""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.stream = None
+
+    async def invoke_model_with_bidirectional_stream(self, operation_input):
+        self.stream = ReplayStream(self.replayer)
+        return self.stream
+
+
+class FlightReplayer:
+    """Re-drives a stream manager from a flight recorder log.
+
+    Both directions share one timeline starting at the first record, divided by
+    `speed`, so the interleaving of user audio and model events (e.g. a barge-in
+    landing mid-response) is reproduced. Lateness against that timeline is tracked.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.records = list(records)
+        self.speed = speed
+        self.inbound = [r for r in self.records if r.direction == INBOUND]
+        self.outbound = [r for r in self.records if r.direction == OUTBOUND]
+        self.start_ns = self.records[0].timestamp_ns if self.records else 0
+        self._t0 = None
+
+        # Counters
+        self.inbound_replayed = 0
+        self.outbound_replayed = 0
+        self.max_lateness_ms = 0.0
+        self.total_lateness_ms = 0.0
+        self.waits = 0
+
+    def start_clock(self):
+        """Start the replay timeline now."""
+        self._t0 = time.perf_counter()
+
+    async def wait_until(self, timestamp_ns):
+        """Sleep until a recorded timestamp comes up on the replay timeline."""
+        if self._t0 is None:
+            self.start_clock()
+        due = self._t0 + (timestamp_ns - self.start_ns) / 1e9 / self.speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lateness = max(0.0, (time.perf_counter() - due) * 1000)
+        self.waits += 1
+        self.total_lateness_ms += lateness
+        self.max_lateness_ms = max(self.max_lateness_ms, lateness)
+
+    def report(self):
+        """Return replay counters and timing accuracy."""
+        return {
+            "records": len(self.records),
+            "inbound_replayed": self.inbound_replayed,
+            "outbound_replayed": self.outbound_replayed,
+            "recorded_duration_s": round((self.records[-1].timestamp_ns - self.start_ns) / 1e9, 3) if self.records else 0,
+            "speed": self.speed,
+            "mean_lateness_ms": round(self.total_lateness_ms / self.waits, 3) if self.waits else 0,
+            "max_lateness_ms": round(self.max_lateness_ms, 3),
+        }
+
+
+async def replay_console(replayer, recorder=None):
+    """Replay a log into nova_sonic.BedrockStreamManager; only microphone audio is re-driven."""
+    import nova_sonic
+    from replay_benchmark import ensure_event_types
+    ensure_event_types()
+
+    manager = nova_sonic.BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
+    manager.bedrock_client = ReplayClient(replayer)
+    manager.recorder = recorder
+    # Decoded audio goes nowhere; count it instead of playing it
+    played = []
+    manager.audio_sink = _CountingSink(played)
+
+    replayer.start_clock()
+    await manager.initialize_stream()
+    await manager.send_audio_content_start_event()
+    for record in replayer.outbound:
+        # Session, prompt and content events are generated by the manager itself
+        if record.kind != AUDIO:
+            continue
+        await replayer.wait_until(record.timestamp_ns)
+        manager.add_audio_chunk(record.payload)
+        replayer.outbound_replayed += 1
+
+    await _wait_for_inbound(replayer)
+    await manager.close()
+    return {"audio_output_bytes": sum(played), "barge_in_flushes": manager.audio_sink.flushes,
+            "events_sent": manager.bedrock_client.stream.input_stream.events}
+
+
+class _CountingSink:
+    def __init__(self, played):
+        self.played = played
+        self.flushes = 0
+
+    def write(self, data):
+        self.played.append(len(data))
+
+    def flush(self):
+        self.flushes += 1
+
+
+async def _wait_for_inbound(replayer, grace=1.0):
+    """Wait until every recorded inbound event has been served, plus a grace period for the last handlers."""
+    while replayer.inbound_replayed < len(replayer.inbound):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(grace / replayer.speed)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or replay a Nova Sonic flight recorder log')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump', help='Print the records of a log')
+    dump_parser.add_argument('log')
+    replay_parser = subparsers.add_parser('replay', help='Re-drive nova_sonic.BedrockStreamManager from a log')
+    replay_parser.add_argument('log')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Replay speed-up factor (1 = original timing)')
+    replay_parser.add_argument('--record', default=None, help='Record the replayed session to this log for comparison')
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        dump(args.log)
+        return
+
+    replayer = FlightReplayer(read_log(args.log), speed=args.speed)
+    recorder = FlightRecorder(args.record) if args.record else None
+    try:
+        result = asyncio.run(replay_console(replayer, recorder))
+    finally:
+        if recorder:
+            recorder.close()
+    result.update(replayer.report())
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
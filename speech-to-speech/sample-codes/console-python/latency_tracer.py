@@ -0,0 +1,191 @@
+import json
+import time
+from array import array
+
+# Span codes recorded by the tracer
+STREAM_INIT_START = 0
+STREAM_INIT_END = 1
+FIRST_AUDIO_SENT = 2
+USER_SPEECH_END = 3
+FIRST_TEXT_OUTPUT = 4
+FIRST_AUDIO_OUTPUT = 5
+TOOL_START = 6
+TOOL_FINISH = 7
+BARGE_IN = 8
+
+SPAN_NAMES = [
+    "stream_init_start",
+    "stream_init_end",
+    "first_audio_sent",
+    "user_speech_end",
+    "first_text_output",
+    "first_audio_output",
+    "tool_start",
+    "tool_finish",
+    "barge_in",
+]
+
+# Latencies derived from pairs of spans within a turn: name -> (from span, to span)
+TURN_LATENCIES = {
+    "stream_init": (STREAM_INIT_START, STREAM_INIT_END),
+    "init_to_first_audio_sent": (STREAM_INIT_END, FIRST_AUDIO_SENT),
+    "speech_end_to_first_text": (USER_SPEECH_END, FIRST_TEXT_OUTPUT),
+    "speech_end_to_first_audio": (USER_SPEECH_END, FIRST_AUDIO_OUTPUT),
+    "tool_execution": (TOOL_START, TOOL_FINISH),
+    "first_audio_to_barge_in": (FIRST_AUDIO_OUTPUT, BARGE_IN),
+}
+
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of microsecond values with ~6% relative precision."""
+
+    SUB_BUCKET_BITS = 5
+    BUCKETS = 512
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * self.BUCKETS))
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        bits = value.bit_length()
+        if bits <= self.SUB_BUCKET_BITS:
+            return value
+        shift = bits - self.SUB_BUCKET_BITS
+        half = 1 << (self.SUB_BUCKET_BITS - 1)
+        return min((1 << self.SUB_BUCKET_BITS) + (shift - 1) * half + ((value >> shift) - half), self.BUCKETS - 1)
+
+    def _value(self, index):
+        """Midpoint value represented by a bucket index."""
+        size = 1 << self.SUB_BUCKET_BITS
+        if index < size:
+            return index
+        half = size >> 1
+        shift = (index - size) // half + 1
+        low = ((index - size) % half + half) << shift
+        return low + (1 << (shift - 1))
+
+    def record(self, value_us):
+        value_us = max(0, int(value_us))
+        self.counts[self._index(value_us)] += 1
+        self.total += 1
+        if self.min is None or value_us < self.min:
+            self.min = value_us
+        if value_us > self.max:
+            self.max = value_us
+
+    def percentile(self, pct):
+        if not self.total:
+            return 0
+        target = max(1, int(round(self.total * pct / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """Return count and percentiles in milliseconds."""
+        return {
+            "count": self.total,
+            "min_ms": (self.min or 0) / 1000,
+            "p50_ms": self.percentile(50) / 1000,
+            "p90_ms": self.percentile(90) / 1000,
+            "p99_ms": self.percentile(99) / 1000,
+            "max_ms": self.max / 1000,
+        }
+
+
+class LatencyTracer:
+    """Records per-turn spans with nanosecond timestamps into a preallocated buffer.
+
+    When `enabled` is False every recording call returns immediately, so the tracer
+    can stay wired into the hot paths permanently. Histograms are only built when
+    `report()` is called at the end of the session.
+    """
+
+    def __init__(self, enabled=False, capacity=65536):
+        self.enabled = enabled
+        self.capacity = capacity
+        # Parallel preallocated arrays: span code, turn number, timestamp
+        self._codes = array('B', bytes(capacity))
+        self._turns = array('L', bytes(4 * capacity))
+        self._timestamps = array('q', bytes(8 * capacity))
+        self._count = 0
+        self.overflowed = 0
+
+        self.turn = 0
+        # Bitmask of span codes already recorded in the current turn, for mark_first()
+        self._seen = 0
+        # Free-form durations recorded through time_it/time_it_async, keyed by label
+        self.durations = {}
+
+    def mark(self, code):
+        """Record a span at the current time."""
+        if not self.enabled:
+            return
+        index = self._count
+        if index >= self.capacity:
+            self.overflowed += 1
+            return
+        self._codes[index] = code
+        self._turns[index] = self.turn
+        self._timestamps[index] = time.perf_counter_ns()
+        self._count = index + 1
+        self._seen |= 1 << code
+
+    def mark_first(self, code):
+        """Record a span only the first time it happens in the current turn."""
+        if not self.enabled or self._seen & (1 << code):
+            return
+        self.mark(code)
+
+    def new_turn(self):
+        """Start a new turn; first-of-turn spans can be recorded again."""
+        if not self.enabled:
+            return
+        self.turn += 1
+        self._seen = 0
+
+    def record_duration(self, label, duration_ns):
+        """Record an arbitrary labelled duration (used by time_it)."""
+        if not self.enabled:
+            return
+        histogram = self.durations.get(label)
+        if histogram is None:
+            histogram = self.durations[label] = LatencyHistogram()
+        histogram.record(duration_ns // 1000)
+
+    def spans(self):
+        """Yield recorded (span name, turn, timestamp_ns) tuples."""
+        for index in range(self._count):
+            yield SPAN_NAMES[self._codes[index]], self._turns[index], self._timestamps[index]
+
+    def histograms(self):
+        """Build latency histograms from the recorded spans."""
+        histograms = {name: LatencyHistogram() for name in TURN_LATENCIES}
+        # Start timestamps per (latency, turn); tool spans can repeat within a turn so they queue up
+        started = {}
+        for index in range(self._count):
+            code = self._codes[index]
+            turn = self._turns[index]
+            timestamp = self._timestamps[index]
+            for name, (start_code, end_code) in TURN_LATENCIES.items():
+                if code == start_code:
+                    started.setdefault((name, turn), []).append(timestamp)
+                elif code == end_code:
+                    starts = started.get((name, turn))
+                    if starts:
+                        histograms[name].record((timestamp - starts.pop(0)) // 1000)
+        histograms.update(self.durations)
+        return histograms
+
+    def report(self):
+        """Return a JSON summary of all latency histograms."""
+        summary = {name: histogram.summary() for name, histogram in self.histograms().items() if histogram.total}
+        summary["turns"] = self.turn
+        summary["spans_recorded"] = self._count
+        summary["spans_dropped"] = self.overflowed
+        return json.dumps(summary, indent=2)
@@ -1,21 +1,26 @@
 import os
 import asyncio
-import base64
 import json
 import uuid
 import warnings
-import pyaudio
 import queue
 import datetime
 import time
-import inspect
-from rx.subject import Subject
-from rx import operators as ops
-from rx.scheduler.eventloop import AsyncIOScheduler
-from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
-from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
-from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
-from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
+import sys
+from event_decoder import EventDecoder
+from event_encoder import EventEncoder
+from latency_tracer import (LatencyTracer, STREAM_INIT_START, STREAM_INIT_END, FIRST_AUDIO_SENT, USER_SPEECH_END,
+                            FIRST_TEXT_OUTPUT, FIRST_AUDIO_OUTPUT, BARGE_IN)
+from audio_uplink import AudioUplink, DROP_OLDEST
+from startup_timeline import StartupTimeline
+from flight_recorder import FlightRecorder, OUTBOUND, INBOUND
+
+# pyaudio, rx and the Bedrock SDK are slow to import and are loaded on first use,
+# so device setup and the Bedrock handshake can start as early as possible
+pyaudio = None
+BedrockRuntimeClient = InvokeModelWithBidirectionalStreamOperationInput = None
+InvokeModelWithBidirectionalStreamInputChunk = BidirectionalInputPayloadPart = None
+Config = HTTPAuthSchemeResolver = SigV4AuthScheme = EnvironmentCredentialsResolver = None
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -23,38 +28,72 @@ warnings.filterwarnings("ignore")
 INPUT_SAMPLE_RATE = 16000
 OUTPUT_SAMPLE_RATE = 24000
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
+FORMAT = None  # pyaudio.paInt16, set by _load_pyaudio()
 CHUNK_SIZE = 512  # Number of frames per buffer
 
 # Debug mode flag
 DEBUG = False
 
+# Session latency tracer; recording calls return immediately unless enabled with --trace
+TRACER = LatencyTracer()
+
+# Milestones from launch to "speak now", printed with --debug or --trace
+STARTUP = StartupTimeline()
+
+def _load_pyaudio():
+    """Import PyAudio on first use."""
+    global pyaudio, FORMAT
+    if pyaudio is None:
+        import pyaudio as pyaudio_module
+        FORMAT = pyaudio_module.paInt16
+        pyaudio = pyaudio_module
+        STARTUP.mark("pyaudio imported")
+    return pyaudio
+
+def _load_bedrock_sdk():
+    """Import the Bedrock runtime SDK on first use."""
+    global BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
+    global InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
+    global Config, HTTPAuthSchemeResolver, SigV4AuthScheme, EnvironmentCredentialsResolver
+    if BedrockRuntimeClient is None:
+        from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
+        from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
+        from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
+        from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
+        STARTUP.mark("bedrock sdk imported")
+
 def debug_print(message):
     """Print only if debug mode is enabled"""
     if DEBUG:
-        functionName = inspect.stack()[1].function
+        # Walk the frame chain directly; inspect.stack() builds context for every frame on each call
+        frame = sys._getframe(1)
+        functionName = frame.f_code.co_name
         if  functionName == 'time_it' or functionName == 'time_it_async':
-            functionName = inspect.stack()[2].function
+            functionName = frame.f_back.f_code.co_name
         print('{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())[:-3] + ' ' + functionName + ' ' + message)
 
 def time_it(label, methodToRun):
-    start_time = time.perf_counter()
+    start_time = time.perf_counter_ns()
     result = methodToRun()
-    end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    elapsed = time.perf_counter_ns() - start_time
+    TRACER.record_duration(label, elapsed)
+    if DEBUG:
+        debug_print(f"Execution time for {label}: {elapsed / 1e9:.4f} seconds")
     return result
 
 async def time_it_async(label, methodToRun):
-    start_time = time.perf_counter()
+    start_time = time.perf_counter_ns()
     result = await methodToRun()
-    end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    elapsed = time.perf_counter_ns() - start_time
+    TRACER.record_duration(label, elapsed)
+    if DEBUG:
+        debug_print(f"Execution time for {label}: {elapsed / 1e9:.4f} seconds")
     return result
 
 class BedrockStreamManager:
     """Manages bidirectional streaming with AWS Bedrock using RxPy for event processing"""
     
-    # Event templates
+    # Once-per-session event templates; content and audio events are built by EventEncoder
     START_SESSION_EVENT = '''{
         "event": {
             "sessionStart": {
@@ -93,70 +132,6 @@ class BedrockStreamManager:
         }
     }'''
 
-    CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "type": "AUDIO",
-            "interactive": true,
-            "role": "USER",
-            "audioInputConfiguration": {
-                "mediaType": "audio/lpcm",
-                "sampleRateHertz": 16000,
-                "sampleSizeBits": 16,
-                "channelCount": 1,
-                "audioType": "SPEECH",
-                "encoding": "base64"
-                }
-            }
-        }
-    }'''
-
-    AUDIO_EVENT_TEMPLATE = '''{
-        "event": {
-            "audioInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
-    TEXT_CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "role": "%s",
-            "type": "TEXT",
-            "interactive": true,
-                "textInputConfiguration": {
-                    "mediaType": "text/plain"
-                }
-            }
-        }
-    }'''
-
-    TEXT_INPUT_EVENT = '''{
-        "event": {
-            "textInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
-    CONTENT_END_EVENT = '''{
-        "event": {
-            "contentEnd": {
-            "promptName": "%s",
-            "contentName": "%s"
-            }
-        }
-    }'''
-
     PROMPT_END_EVENT = '''{
         "event": {
             "promptEnd": {
@@ -171,15 +146,30 @@ class BedrockStreamManager:
         }
     }'''
 
-    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1'):
+    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', uplink_frame_ms=None, uplink_policy=DROP_OLDEST, tracer=None):
         """Initialize the stream manager."""
         self.model_id = model_id
         self.region = region
+        self.tracer = tracer or TRACER
+        from rx.subject import Subject
         self.input_subject = Subject()
         self.output_subject = Subject()
         self.audio_subject = Subject()
+
+        # Optional coalescing uplink: chunks go through a ring buffer drained by one sender task
+        self.audio_uplink = None
+        if uplink_frame_ms:
+            self.audio_uplink = AudioUplink(
+                self._send_audio_frame,
+                sample_rate=INPUT_SAMPLE_RATE,
+                channels=CHANNELS,
+                frame_ms=uplink_frame_ms,
+                policy=uplink_policy
+            )
         
         self.response_task = None
+        # Exception that ended the response loop, if any
+        self.response_error = None
         self.stream_response = None
         self.is_active = False
         self.barge_in = False
@@ -188,6 +178,10 @@ class BedrockStreamManager:
         
         # Audio playback components
         self.audio_output_queue = asyncio.Queue()
+        # When set (e.g. a PlaybackEngine), decoded audio is written here instead of the queue
+        self.audio_sink = None
+        # Optional FlightRecorder capturing every event sent and received
+        self.recorder = None
 
         # Text response components
         self.display_assistant_text = False
@@ -198,8 +192,20 @@ class BedrockStreamManager:
         self.content_name = str(uuid.uuid4())
         self.audio_content_name = str(uuid.uuid4())
 
+        # Output event decoding: handler table keyed by event name
+        self.decoder = EventDecoder()
+        # Compact input events with cached per-content prefixes
+        self.encoder = EventEncoder()
+        self.event_handlers = {
+            'contentStart': self._handle_content_start,
+            'contentEnd': self._handle_content_end,
+            'textOutput': self._handle_text_output,
+            'audioOutput': self._handle_audio_output,
+        }
+
     def _initialize_client(self):
         """Initialize the Bedrock client."""
+        _load_bedrock_sdk()
         config = Config(
             endpoint_uri=f"https://bedrock-runtime.{self.region}.amazonaws.com",
             region=self.region,
@@ -208,15 +214,21 @@ class BedrockStreamManager:
             http_auth_schemes={"aws.auth#sigv4": SigV4AuthScheme()}
         )
         self.bedrock_client = BedrockRuntimeClient(config=config)
+        STARTUP.mark("bedrock client created")
     
     async def initialize_stream(self):
         """Initialize the bidirectional stream with Bedrock."""
         if not self.bedrock_client:
-            self._initialize_client()
-        
+            # Off the event loop, so audio device setup running alongside is not held up
+            await asyncio.get_running_loop().run_in_executor(None, self._initialize_client)
+
+        from rx import operators as ops
+        from rx.scheduler.eventloop import AsyncIOScheduler
         self.scheduler = AsyncIOScheduler(asyncio.get_event_loop())      
         try:
+            self.tracer.mark(STREAM_INIT_START)
             self.stream_response = await time_it_async("invoke_model_with_bidirectional_stream", lambda : self.bedrock_client.invoke_model_with_bidirectional_stream( InvokeModelWithBidirectionalStreamOperationInput(model_id=self.model_id)))
+            STARTUP.mark("bidirectional stream opened")
 
 
             self.is_active = True
@@ -226,14 +238,16 @@ class BedrockStreamManager:
             
             # Send initialization events
             prompt_event = self.START_PROMPT_EVENT % self.prompt_name
-            text_content_start = self.TEXT_CONTENT_START_EVENT % (self.prompt_name, self.content_name, "SYSTEM")
-            text_content = self.TEXT_INPUT_EVENT % (self.prompt_name, self.content_name, default_system_prompt)
-            text_content_end = self.CONTENT_END_EVENT % (self.prompt_name, self.content_name)
+            text_content_start = self.encoder.content_start_text(self.prompt_name, self.content_name, "SYSTEM")
+            text_content = self.encoder.text_input(self.prompt_name, self.content_name, default_system_prompt)
+            text_content_end = self.encoder.content_end(self.prompt_name, self.content_name)
             
             init_events = [self.START_SESSION_EVENT, prompt_event, text_content_start, text_content, text_content_end]
             
             for event in init_events:
                 await self.send_raw_event(event)
+            self.tracer.mark(STREAM_INIT_END)
+            STARTUP.mark("session initialized")
             
             # Start listening for responses
             self.response_task = asyncio.create_task(self._process_responses())
@@ -246,13 +260,17 @@ class BedrockStreamManager:
                 on_error=lambda e: debug_print(f"Input stream error: {e}")
             )
             
-            # Set up subscription for audio chunks
-            self.audio_subject.pipe(
-                ops.subscribe_on(self.scheduler)
-            ).subscribe(
-                on_next=lambda audio_data: asyncio.create_task(self._handle_audio_input(audio_data)),
-                on_error=lambda e: debug_print(f"Audio stream error: {e}")
-            )
+            if self.audio_uplink:
+                # Single long-lived sender task drains the ring buffer
+                self.audio_uplink.start()
+            else:
+                # Set up subscription for audio chunks
+                self.audio_subject.pipe(
+                    ops.subscribe_on(self.scheduler)
+                ).subscribe(
+                    on_next=lambda audio_data: asyncio.create_task(self._handle_audio_input(audio_data)),
+                    on_error=lambda e: debug_print(f"Audio stream error: {e}")
+                )
             
             
             debug_print("Stream initialized successfully")
@@ -264,18 +282,21 @@ class BedrockStreamManager:
             traceback.print_exc()
             raise
     
-    async def send_raw_event(self, event_json):
+    async def send_raw_event(self, event_json, record=True):
         """Send a raw event JSON to the Bedrock stream."""
         if not self.stream_response or not self.is_active:
             debug_print("Stream not initialized or closed")
             return
         
         event = InvokeModelWithBidirectionalStreamInputChunk(
-            value=BidirectionalInputPayloadPart(bytes_=event_json.encode('utf-8'))
+            # EventEncoder output is already bytes
+            value=BidirectionalInputPayloadPart(bytes_=event_json if isinstance(event_json, bytes) else event_json.encode('utf-8'))
         )
         
         try:
             await self.stream_response.input_stream.send(event)
+            if self.recorder and record:
+                self.recorder.record_event(OUTBOUND, event_json)
             # For debugging large events, you might want to log just the type
             if DEBUG:
                 if len(event_json) > 200:
@@ -292,7 +313,7 @@ class BedrockStreamManager:
     
     async def send_audio_content_start_event(self):
         """Send a content start event to the Bedrock stream."""
-        content_start_event = self.CONTENT_START_EVENT % (self.prompt_name, self.audio_content_name)
+        content_start_event = self.encoder.content_start_audio(self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_start_event)
     
     async def _handle_audio_input(self, data):
@@ -306,20 +327,34 @@ class BedrockStreamManager:
             # Ensure the audio is properly formatted
             debug_print(f"Processing audio chunk of size {len(audio_bytes)} bytes")
             
-            # Base64 encode the audio data
-            blob = base64.b64encode(audio_bytes)
-            audio_event = self.AUDIO_EVENT_TEMPLATE % (self.prompt_name, self.audio_content_name, blob.decode('utf-8'))
+            # Base64 encode the audio straight into a compact audioInput event
+            audio_event = self.encoder.audio_input(self.prompt_name, self.audio_content_name, audio_bytes)
             
-            # Send the event directly
-            await self.send_raw_event(audio_event)
+            # Send the event directly; the recorder keeps the raw PCM instead of the base64 event
+            if self.recorder:
+                self.recorder.record_audio(audio_bytes)
+            await self.send_raw_event(audio_event, record=False)
+            self.tracer.mark_first(FIRST_AUDIO_SENT)
         except Exception as e:
             debug_print(f"Error processing audio: {e}")
             if DEBUG:
                 import traceback
                 traceback.print_exc()
     
+    async def _send_audio_frame(self, audio_bytes):
+        """Send one coalesced audio frame from the uplink."""
+        audio_event = self.encoder.audio_input(self.prompt_name, self.audio_content_name, audio_bytes)
+        if self.recorder:
+            self.recorder.record_audio(audio_bytes)
+        await self.send_raw_event(audio_event, record=False)
+        self.tracer.mark_first(FIRST_AUDIO_SENT)
+
     def add_audio_chunk(self, audio_bytes):
         """Add an audio chunk to the stream."""
+        if self.audio_uplink:
+            # Thread-safe copy into the ring buffer, no task or coroutine per chunk
+            self.audio_uplink.write(audio_bytes)
+            return
         self.audio_subject.on_next({
             'audio_bytes': audio_bytes,
             'prompt_name': self.prompt_name,
@@ -332,7 +367,7 @@ class BedrockStreamManager:
             debug_print("Stream is not active")
             return
         
-        content_end_event = self.CONTENT_END_EVENT % (self.prompt_name, self.audio_content_name)
+        content_end_event = self.encoder.content_end(self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_end_event)
         debug_print("Audio ended")
     
@@ -365,66 +400,90 @@ class BedrockStreamManager:
                     result = await output[1].receive()
                     
                     if result.value and result.value.bytes_:
+                        if self.recorder:
+                            self.recorder.record_event(INBOUND, result.value.bytes_)
                         try:
-                            response_data = result.value.bytes_.decode('utf-8')
-                            json_data = json.loads(response_data)
-                            # Handle different response types
-                            if 'event' in json_data:
-                                if 'contentStart' in json_data['event']:
-                                    debug_print("Content start detected")
-                                    content_start = json_data['event']['contentStart']
-                                    # set role
-                                    self.role = content_start['role']
-                                    # Check for speculative content
-                                    if 'additionalModelFields' in content_start:
-                                        try:
-                                            additional_fields = json.loads(content_start['additionalModelFields'])
-                                            if additional_fields.get('generationStage') == 'SPECULATIVE':
-                                                debug_print("Speculative content detected")
-                                                self.display_assistant_text = True
-                                            else:
-                                                self.display_assistant_text = False
-                                        except json.JSONDecodeError:
-                                            debug_print("Error parsing additionalModelFields")
-                                elif 'contentEnd' in json_data['event']:
-                                    debug_print("Content end detected")
-                                elif 'textOutput' in json_data['event']:
-                                    text_content = json_data['event']['textOutput']['content']
-                                    # Check if there is a barge-in
-                                    if '{ "interrupted" : true }' in text_content:
-                                        if DEBUG:
-                                            print("Barge-in detected. Stopping audio output.")
-                                        self.barge_in = True
-
-                                    if (self.role == "ASSISTANT" and self.display_assistant_text):
-                                        print(f"Assistant: {text_content}")
-                                    elif (self.role == "USER"):
-                                        print(f"User: {text_content}")
-                                elif 'contentEnd' in json_data['event']:
-                                    print (json_data)
-                                
-                                elif 'audioOutput' in json_data['event']:
-                                    audio_content = json_data['event']['audioOutput']['content']
-                                    audio_bytes = base64.b64decode(audio_content)
-                                    await self.audio_output_queue.put(audio_bytes)
-                            
-                            self.output_subject.on_next(json_data)
+                            event_name, body, json_data = self.decoder.decode(result.value.bytes_)
+                            # Dispatch on the event key through the handler table
+                            handler = self.event_handlers.get(event_name)
+                            if handler:
+                                await handler(body)
+
+                            if json_data is None and self.output_subject.observers:
+                                # Fast-path audio skipped the full parse, build it only for subscribers
+                                json_data = self.decoder.loads(result.value.bytes_)
+                            if json_data is not None:
+                                self.output_subject.on_next(json_data)
                         except json.JSONDecodeError:
-                            self.output_subject.on_next({"raw_data": response_data})
+                            self.output_subject.on_next({"raw_data": result.value.bytes_.decode('utf-8')})
                 except StopAsyncIteration:
                     # Stream has ended
                     break
                 except Exception as e:
                     debug_print(f"Error receiving response: {e}")
+                    self.response_error = e
                     self.output_subject.on_error(e)
                     break
         except Exception as e:
             debug_print(f"Response processing error: {e}")
+            self.response_error = e
             self.output_subject.on_error(e)
         finally:
             if self.is_active:  
                 self.output_subject.on_completed()
-    
+
+    async def _handle_content_start(self, content_start):
+        """Handle a contentStart event."""
+        debug_print("Content start detected")
+        # set role
+        self.role = content_start['role']
+        # Check for speculative content
+        if 'additionalModelFields' in content_start:
+            try:
+                if self.decoder.generation_stage(content_start) == 'SPECULATIVE':
+                    debug_print("Speculative content detected")
+                    self.display_assistant_text = True
+                else:
+                    self.display_assistant_text = False
+            except json.JSONDecodeError:
+                debug_print("Error parsing additionalModelFields")
+
+    async def _handle_content_end(self, content_end):
+        """Handle a contentEnd event."""
+        debug_print("Content end detected")
+        if self.role == "USER":
+            # End of the user's speech starts a new turn
+            self.tracer.new_turn()
+            self.tracer.mark(USER_SPEECH_END)
+
+    async def _handle_text_output(self, text_output):
+        """Handle a textOutput event."""
+        text_content = text_output['content']
+        # Check if there is a barge-in
+        if '{ "interrupted" : true }' in text_content:
+            if DEBUG:
+                print("Barge-in detected. Stopping audio output.")
+            self.tracer.mark(BARGE_IN)
+            self.barge_in = True
+            if self.audio_sink:
+                # Drop everything buffered for playback in one step
+                self.audio_sink.flush()
+                self.barge_in = False
+
+        if self.role == "ASSISTANT":
+            self.tracer.mark_first(FIRST_TEXT_OUTPUT)
+        if (self.role == "ASSISTANT" and self.display_assistant_text):
+            print(f"Assistant: {text_content}")
+        elif (self.role == "USER"):
+            print(f"User: {text_content}")
+
+    async def _handle_audio_output(self, audio_bytes):
+        """Handle an audioOutput event; the decoder has already base64-decoded the payload."""
+        self.tracer.mark_first(FIRST_AUDIO_OUTPUT)
+        if self.audio_sink:
+            self.audio_sink.write(audio_bytes)
+        else:
+            await self.audio_output_queue.put(audio_bytes)
     
     async def close(self):
         """Close the stream properly."""
@@ -435,6 +494,11 @@ class BedrockStreamManager:
         self.input_subject.on_completed()
         self.audio_subject.on_completed()
 
+        # Flush buffered audio before the audio content is closed
+        if self.audio_uplink:
+            await self.audio_uplink.stop()
+            debug_print(f"Audio uplink stats: {self.audio_uplink.stats()}")
+
         self.is_active = False
         if self.response_task and not self.response_task.done():
             self.response_task.cancel()
@@ -446,47 +510,94 @@ class BedrockStreamManager:
         if self.stream_response:
             await self.stream_response.input_stream.close()
 
+        if self.tracer.enabled:
+            print(f"Latency report: {self.tracer.report()}")
+
 class AudioStreamer:
     """Handles continuous microphone input and audio output using separate streams."""
     
-    def __init__(self, stream_manager):
+    def __init__(self, stream_manager, jitter_buffer_ms=None, loop=None, native_device_format=False):
         self.stream_manager = stream_manager
         self.is_streaming = False
-        self.loop = asyncio.get_event_loop()
+        # Pass the loop explicitly when constructing the streamer on a worker thread
+        self.loop = loop or asyncio.get_event_loop()
+        self.playback = None
+        # Converters between the device's native format and the Nova Sonic wire format (None when not needed)
+        self.capture_converter = None
+        self.playback_converter = None
 
         # Initialize PyAudio
         debug_print("AudioStreamer Initializing PyAudio...")
+        _load_pyaudio()
         self.p = time_it("AudioStreamerInitPyAudio", pyaudio.PyAudio)
+        STARTUP.mark("pyaudio initialized")
         debug_print("AudioStreamer PyAudio initialized")
 
+        input_rate, input_channels = INPUT_SAMPLE_RATE, CHANNELS
+        output_rate, output_channels = OUTPUT_SAMPLE_RATE, CHANNELS
+        if native_device_format:
+            # Open the devices at their own rate and channel count and convert in NumPy instead of in the host audio stack
+            from audio_adapter import CaptureConverter, PlaybackConverter, native_format
+            input_rate, input_channels = native_format(self.p, INPUT_SAMPLE_RATE, input=True)
+            output_rate, output_channels = native_format(self.p, OUTPUT_SAMPLE_RATE, input=False)
+            capture_converter = CaptureConverter(input_rate, input_channels)
+            playback_converter = PlaybackConverter(output_rate, output_channels)
+            self.capture_converter = None if capture_converter.identity else capture_converter
+            self.playback_converter = None if playback_converter.identity else playback_converter
+            debug_print(f"Device formats: input {input_rate} Hz x{input_channels}, output {output_rate} Hz x{output_channels}")
+
+        # Slice size for blocking writes, the same duration as CHUNK_SIZE bytes of wire-format audio
+        frame_bytes = 2 * output_channels
+        self.output_chunk_bytes = CHUNK_SIZE * output_rate // OUTPUT_SAMPLE_RATE // 2 * frame_bytes
+
         # Initialize separate streams for input and output
         # Input stream with callback for microphone
         debug_print("Opening input audio stream...")
         self.input_stream = time_it("AudioStreamerOpenAudio", lambda  : self.p.open(
             format=FORMAT,
-            channels=CHANNELS,
-            rate=INPUT_SAMPLE_RATE,
+            channels=input_channels,
+            rate=input_rate,
             input=True,
-            frames_per_buffer=CHUNK_SIZE,
+            frames_per_buffer=CHUNK_SIZE * input_rate // INPUT_SAMPLE_RATE,
             stream_callback=self.input_callback
         ))
         debug_print("input audio stream opened")
+        STARTUP.mark("input stream opened")
 
-        # Output stream for direct writing (no callback)
         debug_print("Opening output audio stream...")
-        self.output_stream = time_it("AudioStreamerOpenAudio", lambda  : self.p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=OUTPUT_SAMPLE_RATE,
-            output=True,
-            frames_per_buffer=CHUNK_SIZE
-        ))
+        if jitter_buffer_ms:
+            # Callback-mode output fed from a jitter buffer; the stream manager writes decoded audio into it
+            from audio_playback import PlaybackEngine
+            self.playback = PlaybackEngine(self.p, rate=output_rate, channels=output_channels,
+                                           frames_per_buffer=CHUNK_SIZE * output_rate // OUTPUT_SAMPLE_RATE,
+                                           target_depth_ms=jitter_buffer_ms)
+            self.output_stream = time_it("AudioStreamerOpenAudio", self.playback.open)
+            if self.playback_converter:
+                from audio_adapter import ConvertingSink
+                self.stream_manager.audio_sink = ConvertingSink(self.playback, self.playback_converter)
+            else:
+                self.stream_manager.audio_sink = self.playback
+        else:
+            # Output stream for direct writing (no callback)
+            self.output_stream = time_it("AudioStreamerOpenAudio", lambda  : self.p.open(
+                format=FORMAT,
+                channels=output_channels,
+                rate=output_rate,
+                output=True,
+                frames_per_buffer=CHUNK_SIZE
+            ))
 
         debug_print("output audio stream opened")
+        STARTUP.mark("output stream opened")
 
     def input_callback(self, in_data, frame_count, time_info, status):
         """Callback function that schedules audio processing in the asyncio event loop"""
-        if self.is_streaming and in_data:
+        if self.is_streaming and in_data and self.capture_converter:
+            in_data = self.capture_converter.convert(in_data)
+        if self.is_streaming and in_data and self.stream_manager.audio_uplink:
+            # The uplink ring buffer is thread-safe, hand the chunk over without touching the event loop
+            self.stream_manager.add_audio_chunk(in_data)
+        elif self.is_streaming and in_data:
             # Schedule the task in the event loop
             asyncio.run_coroutine_threadsafe(
                 self.process_input_audio(in_data), 
@@ -516,6 +627,8 @@ class AudioStreamer:
                         except asyncio.QueueEmpty:
                             break
                     self.stream_manager.barge_in = False
+                    if self.playback_converter:
+                        self.playback_converter.reset()
                     # Small sleep after clearing
                     await asyncio.sleep(0.05)
                     continue
@@ -527,8 +640,11 @@ class AudioStreamer:
                 )
                 
                 if audio_data and self.is_streaming:
+                    if self.playback_converter:
+                        audio_data = self.playback_converter.convert(audio_data)
+
                     # Write directly to the output stream in smaller chunks
-                    chunk_size = CHUNK_SIZE  # Use the same chunk size as the stream
+                    chunk_size = self.output_chunk_bytes  # Same duration as CHUNK_SIZE bytes of wire-format audio
                     
                     # Write the audio data in chunks to avoid blocking too long
                     for i in range(0, len(audio_data), chunk_size):
@@ -574,10 +690,19 @@ class AudioStreamer:
         # Start the input stream if not already started
         if not self.input_stream.is_active():
             self.input_stream.start_stream()
+
+        STARTUP.mark("speak now")
+        STARTUP.finish()
+        if DEBUG or TRACER.enabled:
+            print(STARTUP.report())
         
         # Start processing tasks
         #self.input_task = asyncio.create_task(self.process_input_audio())
-        self.output_task = asyncio.create_task(self.play_output_audio())
+        if self.playback:
+            # PortAudio pulls from the jitter buffer, no playback task needed
+            self.playback.start()
+        else:
+            self.output_task = asyncio.create_task(self.play_output_audio())
         
         # Wait for user to press Enter to stop
         await asyncio.get_event_loop().run_in_executor(None, input)
@@ -612,7 +737,10 @@ class AudioStreamer:
                 self.input_stream.stop_stream()
             self.input_stream.close()
         
-        if self.output_stream:
+        if self.playback:
+            debug_print(f"Playback stats: {self.playback.stats()}")
+            self.playback.close()
+        elif self.output_stream:
             if self.output_stream.is_active():
                 self.output_stream.stop_stream()
             self.output_stream.close()
@@ -623,19 +751,29 @@ class AudioStreamer:
         await self.stream_manager.close() 
 
 
-async def main(debug=False):
+async def main(debug=False, uplink_frame_ms=None, uplink_policy=DROP_OLDEST, jitter_buffer_ms=None, trace=False,
+               native_device_format=False, record=None):
     """Main function to run the application."""
     global DEBUG
     DEBUG = debug
+    TRACER.enabled = trace
 
-    # Create stream manager
-    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
-
-    # Create audio streamer
-    audio_streamer = AudioStreamer(stream_manager)
+    STARTUP.mark("main started")
 
-    # Initialize the stream
-    await time_it_async("initialize_stream", stream_manager.initialize_stream)
+    # Create stream manager
+    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1',
+                                          uplink_frame_ms=uplink_frame_ms, uplink_policy=uplink_policy)
+    if record:
+        stream_manager.recorder = FlightRecorder(record)
+
+    # Open the audio devices on a worker thread while the Bedrock client is built and the stream is opened
+    loop = asyncio.get_running_loop()
+    create_streamer = lambda: AudioStreamer(stream_manager, jitter_buffer_ms=jitter_buffer_ms, loop=loop,
+                                            native_device_format=native_device_format)
+    audio_streamer, _ = await asyncio.gather(
+        loop.run_in_executor(None, create_streamer),
+        time_it_async("initialize_stream", stream_manager.initialize_stream)
+    )
 
     try:
         # This will run until the user presses Enter
@@ -646,6 +784,9 @@ async def main(debug=False):
     finally:
         # Clean up
         await audio_streamer.stop_streaming()
+        if stream_manager.recorder:
+            stream_manager.recorder.close()
+            print(f"Session recorded: {stream_manager.recorder.stats()}")
         
 
 if __name__ == "__main__":
@@ -653,6 +794,17 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description='Nova Sonic Python Streaming')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--trace', action='store_true', help='Record per-turn latency spans and print histograms at session end')
+    parser.add_argument('--uplink-frame-ms', type=int, default=None,
+                        help='Coalesce microphone audio into frames of this duration (e.g. 64-200) and send them from a single task')
+    parser.add_argument('--uplink-policy', choices=['drop_oldest', 'drop_newest'], default=DROP_OLDEST,
+                        help='What to drop when the uplink buffer is full')
+    parser.add_argument('--jitter-buffer-ms', type=int, default=None,
+                        help='Play audio through a callback-driven jitter buffer of this target depth (e.g. 120)')
+    parser.add_argument('--native-device-format', action='store_true',
+                        help="Open audio devices at their native rate/channels and convert with NumPy")
+    parser.add_argument('--record', default=None,
+                        help='Record every event sent and received to this flight recorder log (see flight_recorder.py)')
     args = parser.parse_args()
     # Set your AWS credentials here or use environment variables
     # os.environ['AWS_ACCESS_KEY_ID'] = "AWS_ACCESS_KEY_ID"
@@ -661,7 +813,9 @@ if __name__ == "__main__":
 
     # Run the main function
     try:
-        asyncio.run(main(debug=args.debug))
+        asyncio.run(main(debug=args.debug, uplink_frame_ms=args.uplink_frame_ms, uplink_policy=args.uplink_policy,
+                         jitter_buffer_ms=args.jitter_buffer_ms, trace=args.trace,
+                         native_device_format=args.native_device_format, record=args.record))
     except Exception as e:
         print(f"Application error: {e}")
         if args.debug:
@@ -2,12 +2,15 @@ import os
 import asyncio
 import base64
 import json
+import queue
+import threading
 import uuid
 import pyaudio
 from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
 from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
 from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
 from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
+from event_encoder import EventEncoder
 
 # Audio configuration
 INPUT_SAMPLE_RATE = 16000
@@ -16,6 +19,39 @@ CHANNELS = 1
 FORMAT = pyaudio.paInt16
 CHUNK_SIZE = 1024
 
+class LoopStallDetector:
+    """Measures how late the event loop runs a periodic timer, i.e. how long something blocked it."""
+
+    def __init__(self, interval=0.02, threshold=0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_stall = 0.0
+        self.stalls = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def report(self):
+        return (f"Event loop: longest stall {self.max_stall * 1000:.0f} ms, "
+                f"{self.stalls} stall(s) over {self.threshold * 1000:.0f} ms")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            stall = loop.time() - expected
+            if stall > self.max_stall:
+                self.max_stall = stall
+            if stall > self.threshold:
+                self.stalls += 1
+
 class SimpleNovaSonic:
     def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1'):
         self.model_id = model_id
@@ -28,8 +64,14 @@ class SimpleNovaSonic:
         self.content_name = str(uuid.uuid4())
         self.audio_content_name = str(uuid.uuid4())
         self.audio_queue = asyncio.Queue()
+        # Microphone chunks handed over from the PortAudio callback thread
+        self.input_queue = asyncio.Queue()
+        # Audio waiting for the playback thread
+        self.playback_queue = queue.Queue()
         self.role = None
         self.display_assistant_text = False
+        # Builds compact audioInput frames without template whitespace
+        self.encoder = EventEncoder()
         
     def _initialize_client(self):
         """Initialize the Bedrock client."""
@@ -45,7 +87,7 @@ class SimpleNovaSonic:
     async def send_event(self, event_json):
         """Send an event to the stream."""
         event = InvokeModelWithBidirectionalStreamInputChunk(
-            value=BidirectionalInputPayloadPart(bytes_=event_json.encode('utf-8'))
+            value=BidirectionalInputPayloadPart(bytes_=event_json if isinstance(event_json, bytes) else event_json.encode('utf-8'))
         )
         await self.stream.input_stream.send(event)
     
@@ -183,18 +225,7 @@ class SimpleNovaSonic:
         if not self.is_active:
             return
             
-        blob = base64.b64encode(audio_bytes)
-        audio_event = f'''
-        {{
-            "event": {{
-                "audioInput": {{
-                    "promptName": "{self.prompt_name}",
-                    "contentName": "{self.audio_content_name}",
-                    "content": "{blob.decode('utf-8')}"
-                }}
-            }}
-        }}
-        '''
+        audio_event = self.encoder.audio_input(self.prompt_name, self.audio_content_name, audio_bytes)
         await self.send_event(audio_event)
     
     async def end_audio_input(self):
@@ -280,6 +311,14 @@ class SimpleNovaSonic:
         except Exception as e:
             print(f"Error processing responses: {e}")
     
+    def _playback_worker(self, stream):
+        """Write audio to the speaker on a dedicated thread; stream.write blocks until played."""
+        while True:
+            audio_data = self.playback_queue.get()
+            if audio_data is None:
+                break
+            stream.write(audio_data)
+
     async def play_audio(self):
         """Play audio responses."""
         p = pyaudio.PyAudio()
@@ -289,14 +328,26 @@ class SimpleNovaSonic:
             rate=OUTPUT_SAMPLE_RATE,
             output=True
         )
+        writer = threading.Thread(target=self._playback_worker, args=(stream,), daemon=True)
+        writer.start()
         
         try:
             while self.is_active:
                 audio_data = await self.audio_queue.get()
-                stream.write(audio_data)
+                self.playback_queue.put_nowait(audio_data)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             print(f"Error playing audio: {e}")
         finally:
+            # Drop what has not been played yet and let the writer thread finish
+            while not self.playback_queue.empty():
+                try:
+                    self.playback_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.playback_queue.put_nowait(None)
+            await asyncio.get_running_loop().run_in_executor(None, writer.join)
             stream.stop_stream()
             stream.close()
             p.terminate()
@@ -304,13 +355,21 @@ class SimpleNovaSonic:
 
     async def capture_audio(self):
         """Capture audio from microphone and send to Nova Sonic."""
+        loop = asyncio.get_running_loop()
+
+        def callback(in_data, frame_count, time_info, status):
+            # Runs on the PortAudio thread: hand the chunk to the event loop without blocking either side
+            loop.call_soon_threadsafe(self.input_queue.put_nowait, in_data)
+            return (None, pyaudio.paContinue)
+
         p = pyaudio.PyAudio()
         stream = p.open(
             format=FORMAT,
             channels=CHANNELS,
             rate=INPUT_SAMPLE_RATE,
             input=True,
-            frames_per_buffer=CHUNK_SIZE
+            frames_per_buffer=CHUNK_SIZE,
+            stream_callback=callback
         )
         
         print("Starting audio capture. Speak into your microphone...")
@@ -320,9 +379,10 @@ class SimpleNovaSonic:
         
         try:
             while self.is_active:
-                audio_data = stream.read(CHUNK_SIZE, exception_on_overflow=False)
+                audio_data = await self.input_queue.get()
                 await self.send_audio_chunk(audio_data)
-                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             print(f"Error capturing audio: {e}")
         finally:
@@ -333,6 +393,10 @@ class SimpleNovaSonic:
             await self.end_audio_input()
 
 async def main():
+    # Report how long the event loop was ever blocked
+    stall_detector = LoopStallDetector()
+    stall_detector.start()
+
     # Create Nova Sonic client
     nova_client = SimpleNovaSonic()
     
@@ -369,6 +433,9 @@ async def main():
     await nova_client.end_session()
     print("Session ended")
 
+    await stall_detector.stop()
+    print(stall_detector.report())
+
 if __name__ == "__main__":
     # Set AWS credentials if not using environment variables
     # os.environ['AWS_ACCESS_KEY_ID'] = "your-access-key"
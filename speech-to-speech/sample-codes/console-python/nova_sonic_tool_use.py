@@ -1,20 +1,28 @@
 import os
 import asyncio
-import base64
 import json
 import uuid
 import warnings
-import pyaudio
 import pytz
 import random
 import hashlib
 import datetime
 import time
-import inspect
-from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
-from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
-from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
-from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
+import sys
+from event_decoder import EventDecoder
+from event_encoder import EventEncoder
+from tool_runner import ToolRunner
+from tool_cache import ToolResultCache
+from latency_tracer import (LatencyTracer, STREAM_INIT_START, STREAM_INIT_END, FIRST_AUDIO_SENT, USER_SPEECH_END,
+                            FIRST_TEXT_OUTPUT, FIRST_AUDIO_OUTPUT, TOOL_START, TOOL_FINISH, BARGE_IN)
+from startup_timeline import StartupTimeline
+
+# pyaudio and the Bedrock SDK are slow to import and are loaded on first use,
+# so device setup and the Bedrock handshake can start as early as possible
+pyaudio = None
+BedrockRuntimeClient = InvokeModelWithBidirectionalStreamOperationInput = None
+InvokeModelWithBidirectionalStreamInputChunk = BidirectionalInputPayloadPart = None
+Config = HTTPAuthSchemeResolver = SigV4AuthScheme = EnvironmentCredentialsResolver = None
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -23,38 +31,72 @@ warnings.filterwarnings("ignore")
 INPUT_SAMPLE_RATE = 16000
 OUTPUT_SAMPLE_RATE = 24000
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
+FORMAT = None  # pyaudio.paInt16, set by _load_pyaudio()
 CHUNK_SIZE = 1024  # Number of frames per buffer
 
 # Debug mode flag
 DEBUG = False
 
+# Session latency tracer; recording calls return immediately unless enabled with --trace
+TRACER = LatencyTracer()
+
+# Milestones from launch to "speak now", printed with --debug or --trace
+STARTUP = StartupTimeline()
+
+def _load_pyaudio():
+    """Import PyAudio on first use."""
+    global pyaudio, FORMAT
+    if pyaudio is None:
+        import pyaudio as pyaudio_module
+        FORMAT = pyaudio_module.paInt16
+        pyaudio = pyaudio_module
+        STARTUP.mark("pyaudio imported")
+    return pyaudio
+
+def _load_bedrock_sdk():
+    """Import the Bedrock runtime SDK on first use."""
+    global BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
+    global InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
+    global Config, HTTPAuthSchemeResolver, SigV4AuthScheme, EnvironmentCredentialsResolver
+    if BedrockRuntimeClient is None:
+        from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
+        from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
+        from aws_sdk_bedrock_runtime.config import Config, HTTPAuthSchemeResolver, SigV4AuthScheme
+        from smithy_aws_core.credentials_resolvers.environment import EnvironmentCredentialsResolver
+        STARTUP.mark("bedrock sdk imported")
+
 def debug_print(message):
     """Print only if debug mode is enabled"""
     if DEBUG:
-        functionName = inspect.stack()[1].function
+        # Walk the frame chain directly; inspect.stack() builds context for every frame on each call
+        frame = sys._getframe(1)
+        functionName = frame.f_code.co_name
         if  functionName == 'time_it' or functionName == 'time_it_async':
-            functionName = inspect.stack()[2].function
+            functionName = frame.f_back.f_code.co_name
         print('{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())[:-3] + ' ' + functionName + ' ' + message)
 
 def time_it(label, methodToRun):
-    start_time = time.perf_counter()
+    start_time = time.perf_counter_ns()
     result = methodToRun()
-    end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    elapsed = time.perf_counter_ns() - start_time
+    TRACER.record_duration(label, elapsed)
+    if DEBUG:
+        debug_print(f"Execution time for {label}: {elapsed / 1e9:.4f} seconds")
     return result
 
 async def time_it_async(label, methodToRun):
-    start_time = time.perf_counter()
+    start_time = time.perf_counter_ns()
     result = await methodToRun()
-    end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    elapsed = time.perf_counter_ns() - start_time
+    TRACER.record_duration(label, elapsed)
+    if DEBUG:
+        debug_print(f"Execution time for {label}: {elapsed / 1e9:.4f} seconds")
     return result
 
 class BedrockStreamManager:
     """Manages bidirectional streaming with AWS Bedrock using asyncio"""
     
-    # Event templates
+    # Once-per-session event templates; content and audio events are built by EventEncoder
     START_SESSION_EVENT = '''{
         "event": {
             "sessionStart": {
@@ -67,89 +109,6 @@ class BedrockStreamManager:
         }
     }'''
 
-    CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "type": "AUDIO",
-            "interactive": true,
-            "role": "USER",
-            "audioInputConfiguration": {
-                "mediaType": "audio/lpcm",
-                "sampleRateHertz": 16000,
-                "sampleSizeBits": 16,
-                "channelCount": 1,
-                "audioType": "SPEECH",
-                "encoding": "base64"
-                }
-            }
-        }
-    }'''
-
-    AUDIO_EVENT_TEMPLATE = '''{
-        "event": {
-            "audioInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
-    TEXT_CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "type": "TEXT",
-            "role": "%s",
-            "interactive": true,
-                "textInputConfiguration": {
-                    "mediaType": "text/plain"
-                }
-            }
-        }
-    }'''
-
-    TEXT_INPUT_EVENT = '''{
-        "event": {
-            "textInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
-    TOOL_CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-                "promptName": "%s",
-                "contentName": "%s",
-                "interactive": false,
-                "type": "TOOL",
-                "role": "TOOL",
-                "toolResultInputConfiguration": {
-                    "toolUseId": "%s",
-                    "type": "TEXT",
-                    "textInputConfiguration": {
-                        "mediaType": "text/plain"
-                    }
-                }
-            }
-        }
-    }'''
-
-    CONTENT_END_EVENT = '''{
-        "event": {
-            "contentEnd": {
-            "promptName": "%s",
-            "contentName": "%s"
-            }
-        }
-    }'''
-
     PROMPT_END_EVENT = '''{
         "event": {
             "promptEnd": {
@@ -163,6 +122,15 @@ class BedrockStreamManager:
             "sessionEnd": {}
         }
     }'''
+
+    # Per-tool timeouts in seconds; other tools use the ToolRunner default
+    TOOL_TIMEOUTS = {
+        "getDateAndTimeTool": 2.0,
+        "trackOrderTool": 5.0,
+    }
+
+    # Tools without side effects; with speculative_tools enabled they start at the toolUse event
+    IDEMPOTENT_TOOLS = {"getdateandtimetool", "trackordertool"}
     
     def start_prompt(self):
         """Create a promptStart event"""
@@ -188,6 +156,10 @@ class BedrockStreamManager:
             "required": ["orderId"]
         })
 
+        # Result cache policies for the tools below: date/time answers hold for a minute,
+        # order tracking is deterministic per orderId
+        self.tool_cache.set_policy("getDateAndTimeTool", ttl=60, max_entries=1)
+        self.tool_cache.set_policy("trackOrderTool", ttl=300, max_entries=64)
         
         prompt_start_event = {
             "event": {
@@ -238,27 +210,14 @@ class BedrockStreamManager:
     
     def tool_result_event(self, content_name, content, role):
         """Create a tool result event"""
-
-        if isinstance(content, dict):
-            content_json_string = json.dumps(content)
-        else:
-            content_json_string = content
-            
-        tool_result_event = {
-            "event": {
-                "toolResult": {
-                    "promptName": self.prompt_name,
-                    "contentName": content_name,
-                    "content": content_json_string
-                }
-            }
-        }
-        return json.dumps(tool_result_event)
+        return self.encoder.tool_result(self.prompt_name, content_name, content)
    
-    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1'):
+    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', tracer=None, speculative_tools=False):
         """Initialize the stream manager."""
         self.model_id = model_id
         self.region = region
+        self.tracer = tracer or TRACER
+        self.speculative_tools = speculative_tools
         
         # Replace RxPy subjects with asyncio queues
         self.audio_input_queue = asyncio.Queue()
@@ -266,6 +225,8 @@ class BedrockStreamManager:
         self.output_queue = asyncio.Queue()
         
         self.response_task = None
+        # Exception that ended the response loop, if any
+        self.response_error = None
         self.stream_response = None
         self.is_active = False
         self.barge_in = False
@@ -285,9 +246,31 @@ class BedrockStreamManager:
         self.toolUseContent = ""
         self.toolUseId = ""
         self.toolName = ""
+        # toolUse events waiting for their contentEnd, keyed by contentId
+        self.pending_tool_uses = {}
+        # Tools run outside the response loop so audio keeps flowing while they execute
+        self.tool_runner = ToolRunner(self._execute_tool, self._send_tool_result, timeouts=self.TOOL_TIMEOUTS)
+        # toolUse IDs started speculatively whose contentEnd has not arrived yet
+        self.speculative_tool_ids = set()
+        # Tool results keyed by normalized arguments; policies are set in start_prompt
+        self.tool_cache = ToolResultCache()
+
+        # Output event decoding: handler table keyed by event name
+        self.decoder = EventDecoder()
+        # Compact input events with cached per-content prefixes
+        self.encoder = EventEncoder()
+        self.event_handlers = {
+            'contentStart': self._handle_content_start,
+            'contentEnd': self._handle_content_end,
+            'textOutput': self._handle_text_output,
+            'audioOutput': self._handle_audio_output,
+            'toolUse': self._handle_tool_use,
+            'completionEnd': self._handle_completion_end,
+        }
 
     def _initialize_client(self):
         """Initialize the Bedrock client."""
+        _load_bedrock_sdk()
         config = Config(
             endpoint_uri=f"https://bedrock-runtime.{self.region}.amazonaws.com",
             region=self.region,
@@ -296,23 +279,27 @@ class BedrockStreamManager:
             http_auth_schemes={"aws.auth#sigv4": SigV4AuthScheme()}
         )
         self.bedrock_client = BedrockRuntimeClient(config=config)
+        STARTUP.mark("bedrock client created")
     
     async def initialize_stream(self):
         """Initialize the bidirectional stream with Bedrock."""
         if not self.bedrock_client:
-            self._initialize_client()
+            # Off the event loop, so audio device setup running alongside is not held up
+            await asyncio.get_running_loop().run_in_executor(None, self._initialize_client)
         
         try:
+            self.tracer.mark(STREAM_INIT_START)
             self.stream_response = await time_it_async("invoke_model_with_bidirectional_stream", lambda : self.bedrock_client.invoke_model_with_bidirectional_stream( InvokeModelWithBidirectionalStreamOperationInput(model_id=self.model_id)))
+            STARTUP.mark("bidirectional stream opened")
             self.is_active = True
             default_system_prompt = "You are a friend. The user and you will engage in a spoken dialog exchanging the transcripts of a natural real-time conversation." \
             "When reading order numbers, please read each digit individually, separated by pauses. For example, order #1234 should be read as 'order number one-two-three-four' rather than 'order number one thousand two hundred thirty-four'."
             
             # Send initialization events
             prompt_event = self.start_prompt()
-            text_content_start = self.TEXT_CONTENT_START_EVENT % (self.prompt_name, self.content_name, "SYSTEM")
-            text_content = self.TEXT_INPUT_EVENT % (self.prompt_name, self.content_name, default_system_prompt)
-            text_content_end = self.CONTENT_END_EVENT % (self.prompt_name, self.content_name)
+            text_content_start = self.encoder.content_start_text(self.prompt_name, self.content_name, "SYSTEM")
+            text_content = self.encoder.text_input(self.prompt_name, self.content_name, default_system_prompt)
+            text_content_end = self.encoder.content_end(self.prompt_name, self.content_name)
             
             init_events = [self.START_SESSION_EVENT, prompt_event, text_content_start, text_content, text_content_end]
             
@@ -320,6 +307,8 @@ class BedrockStreamManager:
                 await self.send_raw_event(event)
                 # Small delay between init events
                 await asyncio.sleep(0.1)
+            self.tracer.mark(STREAM_INIT_END)
+            STARTUP.mark("session initialized")
             
             # Start listening for responses
             self.response_task = asyncio.create_task(self._process_responses())
@@ -344,7 +333,8 @@ class BedrockStreamManager:
             return
        
         event = InvokeModelWithBidirectionalStreamInputChunk(
-            value=BidirectionalInputPayloadPart(bytes_=event_json.encode('utf-8'))
+            # EventEncoder output is already bytes
+            value=BidirectionalInputPayloadPart(bytes_=event_json if isinstance(event_json, bytes) else event_json.encode('utf-8'))
         )
         
         try:
@@ -364,7 +354,7 @@ class BedrockStreamManager:
     
     async def send_audio_content_start_event(self):
         """Send a content start event to the Bedrock stream."""
-        content_start_event = self.CONTENT_START_EVENT % (self.prompt_name, self.audio_content_name)
+        content_start_event = self.encoder.content_start_audio(self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_start_event)
     
     async def _process_audio_input(self):
@@ -379,16 +369,12 @@ class BedrockStreamManager:
                     debug_print("No audio bytes received")
                     continue
                 
-                # Base64 encode the audio data
-                blob = base64.b64encode(audio_bytes)
-                audio_event = self.AUDIO_EVENT_TEMPLATE % (
-                    self.prompt_name, 
-                    self.audio_content_name, 
-                    blob.decode('utf-8')
-                )
+                # Base64 encode the audio straight into a compact audioInput event
+                audio_event = self.encoder.audio_input(self.prompt_name, self.audio_content_name, audio_bytes)
                 
                 # Send the event
                 await self.send_raw_event(audio_event)
+                self.tracer.mark_first(FIRST_AUDIO_SENT)
                 
             except asyncio.CancelledError:
                 break
@@ -412,13 +398,13 @@ class BedrockStreamManager:
             debug_print("Stream is not active")
             return
         
-        content_end_event = self.CONTENT_END_EVENT % (self.prompt_name, self.audio_content_name)
+        content_end_event = self.encoder.content_end(self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_end_event)
         debug_print("Audio ended")
     
-    async def send_tool_start_event(self, content_name):
+    async def send_tool_start_event(self, content_name, tool_use_id=None):
         """Send a tool content start event to the Bedrock stream."""
-        content_start_event = self.TOOL_CONTENT_START_EVENT % (self.prompt_name, content_name, self.toolUseId)
+        content_start_event = self.encoder.content_start_tool(self.prompt_name, content_name, tool_use_id or self.toolUseId)
         debug_print(f"Sending tool start event: {content_start_event}")  
         await self.send_raw_event(content_start_event)
 
@@ -431,7 +417,7 @@ class BedrockStreamManager:
     
     async def send_tool_content_end_event(self, content_name):
         """Send a tool content end event to the Bedrock stream."""
-        tool_content_end_event = self.CONTENT_END_EVENT % (self.prompt_name, content_name)
+        tool_content_end_event = self.encoder.content_end(self.prompt_name, content_name)
         debug_print(f"Sending tool content event: {tool_content_end_event}")
         await self.send_raw_event(tool_content_end_event)
     
@@ -464,69 +450,23 @@ class BedrockStreamManager:
                     result = await output[1].receive()
                     if result.value and result.value.bytes_:
                         try:
-                            response_data = result.value.bytes_.decode('utf-8')
-                            json_data = json.loads(response_data)
-                            
-                            # Handle different response types
-                            if 'event' in json_data:
-                                if 'contentStart' in json_data['event']:
-                                    debug_print("Content start detected")
-                                    content_start = json_data['event']['contentStart']
-                                    # set role
-                                    self.role = content_start['role']
-                                    # Check for speculative content
-                                    if 'additionalModelFields' in content_start:
-                                        try:
-                                            additional_fields = json.loads(content_start['additionalModelFields'])
-                                            if additional_fields.get('generationStage') == 'SPECULATIVE':
-                                                debug_print("Speculative content detected")
-                                                self.display_assistant_text = True
-                                            else:
-                                                self.display_assistant_text = False
-                                        except json.JSONDecodeError:
-                                            debug_print("Error parsing additionalModelFields")
-                                elif 'textOutput' in json_data['event']:
-                                    text_content = json_data['event']['textOutput']['content']
-                                    role = json_data['event']['textOutput']['role']
-                                    # Check if there is a barge-in
-                                    if '{ "interrupted" : true }' in text_content:
-                                        debug_print("Barge-in detected. Stopping audio output.")
-                                        self.barge_in = True
-
-                                    if (self.role == "ASSISTANT" and self.display_assistant_text):
-                                        print(f"Assistant: {text_content}")
-                                    elif (self.role == "USER"):
-                                        print(f"User: {text_content}")
-
-                                elif 'audioOutput' in json_data['event']:
-                                    audio_content = json_data['event']['audioOutput']['content']
-                                    audio_bytes = base64.b64decode(audio_content)
-                                    await self.audio_output_queue.put(audio_bytes)
-                                elif 'toolUse' in json_data['event']:
-                                    self.toolUseContent = json_data['event']['toolUse']
-                                    self.toolName = json_data['event']['toolUse']['toolName']
-                                    self.toolUseId = json_data['event']['toolUse']['toolUseId']
-                                    debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
-                                elif 'contentEnd' in json_data['event'] and json_data['event'].get('contentEnd', {}).get('type') == 'TOOL':
-                                    debug_print("Processing tool use and sending result")
-                                    toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
-                                    toolContent = str(uuid.uuid4())
-                                    await self.send_tool_start_event(toolContent)
-                                    await self.send_tool_result_event(toolContent, toolResult)
-                                    await self.send_tool_content_end_event(toolContent)
-                                
-                                elif 'completionEnd' in json_data['event']:
-                                    # Handle end of conversation, no more response will be generated
-                                    print("End of response sequence")
+                            event_name, body, json_data = self.decoder.decode(result.value.bytes_)
+                            # Dispatch on the event key through the handler table
+                            handler = self.event_handlers.get(event_name)
+                            if handler:
+                                await handler(body)
                             
-                            # Put the response in the output queue for other components
-                            await self.output_queue.put(json_data)
+                            # Put the response in the output queue for other components;
+                            # fast-path audio is only delivered through audio_output_queue
+                            if json_data is not None:
+                                await self.output_queue.put(json_data)
                         except json.JSONDecodeError:
-                            await self.output_queue.put({"raw_data": response_data})
+                            await self.output_queue.put({"raw_data": result.value.bytes_.decode('utf-8')})
                 except StopAsyncIteration:
                     # Stream has ended
                     break
                 except Exception as e:
+                    self.response_error = e
                    # Handle ValidationException properly
                     if "ValidationException" in str(e):
                         error_message = str(e)
@@ -536,10 +476,113 @@ class BedrockStreamManager:
                     break
                     
         except Exception as e:
+            self.response_error = e
             print(f"Response processing error: {e}")
         finally:
             self.is_active = False
 
+    async def _handle_content_start(self, content_start):
+        """Handle a contentStart event."""
+        debug_print("Content start detected")
+        # set role
+        self.role = content_start['role']
+        # Check for speculative content
+        if 'additionalModelFields' in content_start:
+            try:
+                if self.decoder.generation_stage(content_start) == 'SPECULATIVE':
+                    debug_print("Speculative content detected")
+                    self.display_assistant_text = True
+                else:
+                    self.display_assistant_text = False
+            except json.JSONDecodeError:
+                debug_print("Error parsing additionalModelFields")
+
+    async def _handle_text_output(self, text_output):
+        """Handle a textOutput event."""
+        text_content = text_output['content']
+        # Check if there is a barge-in
+        if '{ "interrupted" : true }' in text_content:
+            debug_print("Barge-in detected. Stopping audio output.")
+            self.tracer.mark(BARGE_IN)
+            self.barge_in = True
+            self._abandon_speculative_tools()
+
+        if self.role == "ASSISTANT":
+            self.tracer.mark_first(FIRST_TEXT_OUTPUT)
+        if (self.role == "ASSISTANT" and self.display_assistant_text):
+            print(f"Assistant: {text_content}")
+        elif (self.role == "USER"):
+            print(f"User: {text_content}")
+
+    async def _handle_audio_output(self, audio_bytes):
+        """Handle an audioOutput event; the decoder has already base64-decoded the payload."""
+        self.tracer.mark_first(FIRST_AUDIO_OUTPUT)
+        await self.audio_output_queue.put(audio_bytes)
+
+    async def _handle_tool_use(self, tool_use):
+        """Handle a toolUse event."""
+        self.toolUseContent = tool_use
+        self.toolName = tool_use['toolName']
+        self.toolUseId = tool_use['toolUseId']
+        self.pending_tool_uses[tool_use.get('contentId')] = tool_use
+        debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
+
+        # Start idempotent tools now and hold the result until the tool contentEnd arrives
+        if self.speculative_tools and self.toolName.lower() in self.IDEMPOTENT_TOOLS:
+            debug_print(f"Starting {self.toolName} ({self.toolUseId}) speculatively")
+            self.speculative_tool_ids.add(self.toolUseId)
+            self.tool_runner.submit(self.toolUseId, self.toolName, tool_use, hold=True)
+
+    async def _handle_content_end(self, content_end):
+        """Handle a contentEnd event."""
+        if content_end.get('type') == 'TOOL':
+            tool_use = self.pending_tool_uses.pop(content_end.get('contentId'), None) or self.toolUseContent
+            tool_use_id = tool_use['toolUseId']
+            self.speculative_tool_ids.discard(tool_use_id)
+            if self.tool_runner.release(tool_use_id):
+                debug_print(f"Releasing speculative result for {tool_use['toolName']} ({tool_use_id})")
+                return
+            debug_print(f"Running tool {tool_use['toolName']} ({tool_use_id}) in the background")
+            self.tool_runner.submit(tool_use_id, tool_use['toolName'], tool_use)
+        elif self.role == "USER":
+            # End of the user's speech starts a new turn
+            self.tracer.new_turn()
+            self.tracer.mark(USER_SPEECH_END)
+
+    async def _handle_completion_end(self, completion_end):
+        """Handle a completionEnd event."""
+        # Handle end of conversation, no more response will be generated
+        print("End of response sequence")
+
+    def _abandon_speculative_tools(self):
+        """Cancel speculative tool calls whose result was never requested (the turn was interrupted)."""
+        for tool_use_id in self.speculative_tool_ids:
+            debug_print(f"Abandoning speculative tool use {tool_use_id}")
+            self.tool_runner.cancel(tool_use_id)
+        self.speculative_tool_ids.clear()
+
+    async def _execute_tool(self, toolName, toolUseContent):
+        """Run one tool call for the ToolRunner, answering from the result cache when possible."""
+        self.tracer.mark(TOOL_START)
+        try:
+            hit, result = self.tool_cache.get(toolName, toolUseContent)
+            if hit:
+                debug_print(f"Tool cache hit for {toolName}")
+                return result
+            result = await self.processToolUse(toolName, toolUseContent)
+            self.tool_cache.put(toolName, toolUseContent, result)
+            return result
+        finally:
+            self.tracer.mark(TOOL_FINISH)
+
+    async def _send_tool_result(self, tool_use_id, toolResult):
+        """Send a finished tool result back to Bedrock, tagged with its toolUseId."""
+        debug_print(f"Sending result for tool use {tool_use_id}")
+        toolContent = str(uuid.uuid4())
+        await self.send_tool_start_event(toolContent, tool_use_id)
+        await self.send_tool_result_event(toolContent, toolResult)
+        await self.send_tool_content_end_event(toolContent)
+
     async def processToolUse(self, toolName, toolUseContent):
         """Return the tool result"""
         tool = toolName.lower()
@@ -658,6 +701,9 @@ class BedrockStreamManager:
         if self.response_task and not self.response_task.done():
             self.response_task.cancel()
 
+        # Abandon tool calls that are still running
+        await self.tool_runner.shutdown()
+
         await self.send_audio_content_end_event()
         await self.send_prompt_end_event()
         await self.send_session_end_event()
@@ -665,17 +711,24 @@ class BedrockStreamManager:
         if self.stream_response:
             await self.stream_response.input_stream.close()
 
+        if self.tracer.enabled:
+            print(f"Latency report: {self.tracer.report()}")
+        debug_print(f"Tool cache: {self.tool_cache.stats()}")
+
 class AudioStreamer:
     """Handles continuous microphone input and audio output using separate streams."""
     
-    def __init__(self, stream_manager):
+    def __init__(self, stream_manager, loop=None):
         self.stream_manager = stream_manager
         self.is_streaming = False
-        self.loop = asyncio.get_event_loop()
+        # Pass the loop explicitly when constructing the streamer on a worker thread
+        self.loop = loop or asyncio.get_event_loop()
 
         # Initialize PyAudio
         debug_print("AudioStreamer Initializing PyAudio...")
+        _load_pyaudio()
         self.p = time_it("AudioStreamerInitPyAudio", pyaudio.PyAudio)
+        STARTUP.mark("pyaudio initialized")
         debug_print("AudioStreamer PyAudio initialized")
 
         # Initialize separate streams for input and output
@@ -690,6 +743,7 @@ class AudioStreamer:
             stream_callback=self.input_callback
         ))
         debug_print("input audio stream opened")
+        STARTUP.mark("input stream opened")
 
         # Output stream for direct writing (no callback)
         debug_print("Opening output audio stream...")
@@ -702,6 +756,7 @@ class AudioStreamer:
         ))
 
         debug_print("output audio stream opened")
+        STARTUP.mark("output stream opened")
 
     def input_callback(self, in_data, frame_count, time_info, status):
         """Callback function that schedules audio processing in the asyncio event loop"""
@@ -793,6 +848,11 @@ class AudioStreamer:
         # Start the input stream if not already started
         if not self.input_stream.is_active():
             self.input_stream.start_stream()
+
+        STARTUP.mark("speak now")
+        STARTUP.finish()
+        if DEBUG or TRACER.enabled:
+            print(STARTUP.report())
         
         # Start processing tasks
         #self.input_task = asyncio.create_task(self.process_input_audio())
@@ -836,19 +896,23 @@ class AudioStreamer:
         await self.stream_manager.close() 
 
 
-async def main(debug=False):
+async def main(debug=False, trace=False, speculative_tools=False):
     """Main function to run the application."""
     global DEBUG
     DEBUG = debug
+    TRACER.enabled = trace
 
-    # Create stream manager
-    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
+    STARTUP.mark("main started")
 
-    # Create audio streamer
-    audio_streamer = AudioStreamer(stream_manager)
+    # Create stream manager
+    stream_manager = BedrockStreamManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1', speculative_tools=speculative_tools)
 
-    # Initialize the stream
-    await time_it_async("initialize_stream", stream_manager.initialize_stream)
+    # Open the audio devices on a worker thread while the Bedrock client is built and the stream is opened
+    loop = asyncio.get_running_loop()
+    audio_streamer, _ = await asyncio.gather(
+        loop.run_in_executor(None, lambda: AudioStreamer(stream_manager, loop=loop)),
+        time_it_async("initialize_stream", stream_manager.initialize_stream)
+    )
 
     try:
         # This will run until the user presses Enter
@@ -866,6 +930,8 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description='Nova Sonic Python Streaming')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--trace', action='store_true', help='Record per-turn latency spans and print histograms at session end')
+    parser.add_argument('--speculative-tools', action='store_true', help='Start idempotent tools as soon as the toolUse event arrives')
     args = parser.parse_args()
     # Set your AWS credentials here or use environment variables
     # os.environ['AWS_ACCESS_KEY_ID'] = "AWS_ACCESS_KEY_ID"
@@ -874,7 +940,7 @@ if __name__ == "__main__":
 
     # Run the main function
     try:
-        asyncio.run(main(debug=args.debug))
+        asyncio.run(main(debug=args.debug, trace=args.trace, speculative_tools=args.speculative_tools))
     except Exception as e:
         print(f"Application error: {e}")
         if args.debug:
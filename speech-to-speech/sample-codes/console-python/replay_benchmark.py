@@ -0,0 +1,437 @@
+"""Offline replay benchmark for BedrockStreamManager.
+
+Feeds recorded 16 kHz mono WAV files (or synthetic audio) through
+`BedrockStreamManager.add_audio_chunk` and answers from a local stand-in for
+`invoke_model_with_bidirectional_stream` that emits scripted contentStart /
+textOutput / audioOutput / toolUse events. No microphone, speakers or AWS
+credentials are needed.
+
+    python replay_benchmark.py recordings/*.wav --speed 4 --sessions 8
+
+Reports encode and decode CPU per second of audio, event-loop lag and an
+estimate of how many real-time sessions one core can carry. The scripted
+output events are serialized once up front, so the stand-in adds little CPU of
+its own to the totals.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import math
+import struct
+import time
+import uuid
+import wave
+
+import nova_sonic
+from audio_uplink import DROP_OLDEST
+from latency_tracer import LatencyHistogram
+
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+# Frames per add_audio_chunk call, as delivered by the PyAudio callback
+CHUNK_FRAMES = nova_sonic.CHUNK_SIZE
+# Duration of each scripted audioOutput event
+OUTPUT_CHUNK_MS = 80
+
+
+class _PayloadPart:
+    """Minimal stand-in for BidirectionalInputPayloadPart when the Bedrock SDK is not installed."""
+
+    def __init__(self, bytes_):
+        self.bytes_ = bytes_
+
+
+class _InputChunk:
+    """Minimal stand-in for InvokeModelWithBidirectionalStreamInputChunk when the Bedrock SDK is not installed."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _OperationInput:
+    """Minimal stand-in for InvokeModelWithBidirectionalStreamOperationInput when the Bedrock SDK is not installed."""
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+
+
+def ensure_event_types():
+    """Use the SDK event types when available; the mock stream only needs `.value.bytes_`."""
+    try:
+        nova_sonic._load_bedrock_sdk()
+    except ImportError:
+        nova_sonic.InvokeModelWithBidirectionalStreamOperationInput = _OperationInput
+        nova_sonic.InvokeModelWithBidirectionalStreamInputChunk = _InputChunk
+        nova_sonic.BidirectionalInputPayloadPart = _PayloadPart
+
+
+def load_wav(path):
+    """Return the PCM bytes of a 16 kHz, mono, 16-bit WAV file."""
+    with wave.open(path, 'rb') as wav:
+        if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (INPUT_SAMPLE_RATE, 1, SAMPLE_WIDTH):
+            raise ValueError(f"{path}: expected 16 kHz mono 16-bit PCM, got "
+                             f"{wav.getframerate()} Hz, {wav.getnchannels()} channel(s), {8 * wav.getsampwidth()}-bit")
+        return wav.readframes(wav.getnframes())
+
+
+def synthetic_pcm(seconds, rate, frequency=220.0):
+    """A quiet tone, for runs without recordings."""
+    frames = int(seconds * rate)
+    samples = (int(3000 * math.sin(2 * math.pi * frequency * i / rate)) for i in range(frames))
+    return struct.pack(f'<{frames}h', *samples)
+
+
+def _event(name, body):
+    return json.dumps({"event": {name: body}}).encode('utf-8')
+
+
+class _Received:
+    """Result object shaped like the SDK's output receive() result."""
+
+    def __init__(self, data):
+        self.value = _PayloadPart(data)
+
+
+class MockInputStream:
+    """Accepts client events, counting them without a full JSON parse."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.events = 0
+        self.bytes = 0
+        self.audio_events = 0
+        self.closed = False
+
+    async def send(self, chunk):
+        data = chunk.value.bytes_
+        self.events += 1
+        self.bytes += len(data)
+        # The event name sits near the start of every event; no need to parse
+        if data.find(b'"audioInput"', 0, 80) >= 0:
+            self.audio_events += 1
+
+    async def close(self):
+        self.closed = True
+        self.stream.finish()
+
+
+class MockBidirectionalStream:
+    """Scripted stand-in for the object returned by invoke_model_with_bidirectional_stream."""
+
+    def __init__(self, script, speed):
+        self.script = script
+        self.speed = speed
+        self.input_stream = MockInputStream(self)
+        self._outputs = asyncio.Queue()
+        self._responders = []
+        self.output_events = 0
+        self.output_audio_bytes = 0
+
+    async def await_output(self):
+        return None, self
+
+    async def receive(self):
+        data = await self._outputs.get()
+        if data is None:
+            raise StopAsyncIteration
+        self.output_events += 1
+        return _Received(data)
+
+    def end_of_turn(self, turn):
+        """Called by the driver when the user's audio for a turn has been sent."""
+        self._responders.append(asyncio.create_task(self._respond(turn)))
+
+    async def wait_responses(self):
+        if self._responders:
+            await asyncio.gather(*self._responders)
+
+    def finish(self):
+        for task in self._responders:
+            task.cancel()
+        self._outputs.put_nowait(None)
+
+    async def _sleep(self, seconds):
+        await asyncio.sleep(seconds / self.speed if self.speed else 0)
+
+    async def _respond(self, turn):
+        script = self.script
+        emit = self._outputs.put_nowait
+        await self._sleep(script.response_delay)
+
+        # Final transcript of the user turn
+        for event in script.user_turn_events:
+            emit(event)
+
+        # Speculative assistant text
+        for event in script.speculative_text_events:
+            emit(event)
+
+        if script.tool_every and turn % script.tool_every == script.tool_every - 1:
+            for event in script.tool_events():
+                emit(event)
+            await self._sleep(script.tool_delay)
+
+        # Assistant audio at the scripted pace
+        emit(script.audio_start_event)
+        interval = OUTPUT_CHUNK_MS / 1000 / script.generation_speedup
+        for _ in range(script.audio_chunks):
+            emit(script.audio_event)
+            self.output_audio_bytes += script.audio_chunk_bytes
+            await self._sleep(interval)
+        emit(script.audio_end_event)
+
+        # Final assistant text
+        for event in script.final_text_events:
+            emit(event)
+
+
+class ResponseScript:
+    """Pre-serialized output events for one scripted assistant response."""
+
+    def __init__(self, prompt_name, response_seconds=3.0, response_delay=0.4, generation_speedup=1.5,
+                 tool_every=0, tool_delay=0.2):
+        self.prompt_name = prompt_name
+        self.response_delay = response_delay
+        self.generation_speedup = generation_speedup
+        self.tool_every = tool_every
+        self.tool_delay = tool_delay
+
+        self.audio_chunk_bytes = int(OUTPUT_SAMPLE_RATE * OUTPUT_CHUNK_MS / 1000) * SAMPLE_WIDTH
+        self.audio_chunks = max(1, int(response_seconds * 1000 / OUTPUT_CHUNK_MS))
+        audio = base64.b64encode(synthetic_pcm(OUTPUT_CHUNK_MS / 1000, OUTPUT_SAMPLE_RATE, 330.0)).decode('ascii')
+
+        speculative = json.dumps({"generationStage": "SPECULATIVE"})
+        final = json.dumps({"generationStage": "FINAL"})
+        reply = "Sure, your order shipped yesterday and should arrive on Thursday."
+
+        self.user_turn_events = self._text_block("USER", "Hi, can you tell me where my order is?", final)
+        self.speculative_text_events = self._text_block("ASSISTANT", reply, speculative)
+        self.final_text_events = self._text_block("ASSISTANT", reply, final)
+
+        audio_content_id = str(uuid.uuid4())
+        self.audio_start_event = _event("contentStart", {
+            "promptName": prompt_name, "contentId": audio_content_id, "type": "AUDIO", "role": "ASSISTANT",
+            "additionalModelFields": final})
+        self.audio_event = _event("audioOutput", {
+            "promptName": prompt_name, "contentId": audio_content_id, "role": "ASSISTANT", "content": audio})
+        self.audio_end_event = _event("contentEnd", {
+            "promptName": prompt_name, "contentId": audio_content_id, "type": "AUDIO", "stopReason": "END_TURN"})
+
+    def _text_block(self, role, text, stage):
+        content_id = str(uuid.uuid4())
+        return [
+            _event("contentStart", {"promptName": self.prompt_name, "contentId": content_id, "type": "TEXT",
+                                    "role": role, "additionalModelFields": stage}),
+            _event("textOutput", {"promptName": self.prompt_name, "contentId": content_id, "role": role,
+                                  "content": text}),
+            _event("contentEnd", {"promptName": self.prompt_name, "contentId": content_id, "type": "TEXT",
+                                  "stopReason": "PARTIAL_TURN"}),
+        ]
+
+    def tool_events(self):
+        content_id = str(uuid.uuid4())
+        return [
+            _event("contentStart", {"promptName": self.prompt_name, "contentId": content_id, "type": "TOOL",
+                                    "role": "TOOL"}),
+            _event("toolUse", {"promptName": self.prompt_name, "contentId": content_id, "toolName": "trackOrderTool",
+                               "toolUseId": str(uuid.uuid4()), "content": json.dumps({"orderId": "1234"})}),
+            _event("contentEnd", {"promptName": self.prompt_name, "contentId": content_id, "type": "TOOL",
+                                  "stopReason": "TOOL_USE"}),
+        ]
+
+
+class MockBedrockClient:
+    """Stand-in for BedrockRuntimeClient that hands out scripted streams."""
+
+    def __init__(self, speed, **script_options):
+        self.speed = speed
+        self.script_options = script_options
+        self.streams = []
+
+    async def invoke_model_with_bidirectional_stream(self, operation_input):
+        stream = MockBidirectionalStream(ResponseScript(str(uuid.uuid4()), **self.script_options), self.speed)
+        self.streams.append(stream)
+        return stream
+
+
+class CpuMeter:
+    """Accumulates event-loop thread CPU time spent inside wrapped calls."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds += time.thread_time() - start
+                self.calls += 1
+        return timed
+
+    def wrap_async(self, function):
+        # The wrapped coroutines do not suspend against the mock stream, so thread time
+        # between start and finish belongs to them
+        async def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.seconds += time.thread_time() - start
+                self.calls += 1
+        return timed
+
+
+class AudioSink:
+    """Counts decoded output audio in place of the speaker."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.flushes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+async def monitor_loop_lag(histogram, interval=0.005):
+    """Measure how late the event loop wakes a sleeping task."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        histogram.record((loop.time() - expected) * 1e6)
+
+
+async def run_session(turns, speed, encode, decode, uplink_frame_ms, script_options):
+    """Drive one BedrockStreamManager through all turns and return its counters."""
+    manager = nova_sonic.BedrockStreamManager(uplink_frame_ms=uplink_frame_ms, uplink_policy=DROP_OLDEST)
+    client = MockBedrockClient(speed, **script_options)
+    manager.bedrock_client = client
+    sink = AudioSink()
+    manager.audio_sink = sink
+
+    # Encode: base64 + event templating on the audio input path
+    if manager.audio_uplink:
+        manager.audio_uplink.send_frame = encode.wrap_async(manager.audio_uplink.send_frame)
+    else:
+        manager._handle_audio_input = encode.wrap_async(manager._handle_audio_input)
+    # Decode: event parsing and handler dispatch on the output path
+    manager.decoder.decode = decode.wrap(manager.decoder.decode)
+    manager.event_handlers = {name: decode.wrap_async(handler) for name, handler in manager.event_handlers.items()}
+
+    await manager.initialize_stream()
+    stream = client.streams[0]
+    await manager.send_audio_content_start_event()
+
+    chunk_bytes = CHUNK_FRAMES * SAMPLE_WIDTH
+    chunk_seconds = CHUNK_FRAMES / INPUT_SAMPLE_RATE
+    started = time.perf_counter()
+    sent_seconds = 0.0
+    for turn, pcm in enumerate(turns):
+        for offset in range(0, len(pcm), chunk_bytes):
+            manager.add_audio_chunk(pcm[offset:offset + chunk_bytes])
+            sent_seconds += chunk_seconds
+            if speed:
+                # Pace against the wall clock so slow iterations do not accumulate drift
+                delay = started + sent_seconds / speed - time.perf_counter()
+                await asyncio.sleep(max(0.0, delay))
+            else:
+                await asyncio.sleep(0)
+        stream.end_of_turn(turn)
+        await stream.wait_responses()
+
+    # Let the response task drain what the script emitted
+    while not stream._outputs.empty():
+        await asyncio.sleep(0.001)
+    await manager.close()
+    return {
+        "input_audio_seconds": sum(len(pcm) for pcm in turns) / (INPUT_SAMPLE_RATE * SAMPLE_WIDTH),
+        "output_audio_seconds": sink.bytes / (OUTPUT_SAMPLE_RATE * SAMPLE_WIDTH),
+        "events_sent": stream.input_stream.events,
+        "audio_events_sent": stream.input_stream.audio_events,
+        "events_received": stream.output_events,
+    }
+
+
+async def run_benchmark(turns, sessions=1, speed=1.0, uplink_frame_ms=None, **script_options):
+    """Run `sessions` concurrent sessions over the same turns and return the report dict."""
+    ensure_event_types()
+    encode = CpuMeter()
+    decode = CpuMeter()
+    lag = LatencyHistogram()
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    results = await asyncio.gather(*(
+        run_session(turns, speed, encode, decode, uplink_frame_ms, script_options) for _ in range(sessions)))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    monitor.cancel()
+
+    input_seconds = sum(result["input_audio_seconds"] for result in results)
+    output_seconds = sum(result["output_audio_seconds"] for result in results)
+    # A real-time session lasts about as long as the user and assistant audio together,
+    # so CPU per second of that audio is the share of a core one live session needs
+    conversation_seconds = input_seconds + output_seconds
+    per_session_second = cpu / conversation_seconds if conversation_seconds else 0.0
+
+    return {
+        "sessions": sessions,
+        "speed": speed or "max",
+        "uplink_frame_ms": uplink_frame_ms,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "input_audio_seconds": round(input_seconds, 2),
+        "input_events_audio": sum(result["audio_events_sent"] for result in results),
+        "output_audio_seconds": round(output_seconds, 2),
+        "events_sent": sum(result["events_sent"] for result in results),
+        "events_received": sum(result["events_received"] for result in results),
+        "encode_cpu_ms_per_audio_second": round(encode.seconds * 1000 / input_seconds, 3) if input_seconds else 0.0,
+        "decode_cpu_ms_per_audio_second": round(decode.seconds * 1000 / output_seconds, 3) if output_seconds else 0.0,
+        "loop_lag_ms": lag.summary(),
+        "cpu_per_session_second": round(per_session_second, 5),
+        "max_sessions_per_core": int(1 / per_session_second) if per_session_second else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline replay benchmark for the Nova Sonic console client')
+    parser.add_argument('wav_files', nargs='*', help='16 kHz mono 16-bit WAV files, one user turn each')
+    parser.add_argument('--synthetic-turns', type=int, default=3, help='Turns of synthetic audio when no WAV files are given')
+    parser.add_argument('--turn-seconds', type=float, default=4.0, help='Length of each synthetic user turn')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed: 1 is real time, 4 is four times faster, 0 is as fast as possible')
+    parser.add_argument('--sessions', type=int, default=1, help='Concurrent sessions on one event loop')
+    parser.add_argument('--uplink-frame-ms', type=int, default=None, help='Benchmark the coalescing uplink with this frame size')
+    parser.add_argument('--response-seconds', type=float, default=3.0, help='Length of each scripted assistant response')
+    parser.add_argument('--tool-every', type=int, default=0, help='Emit a toolUse event every N turns')
+    parser.add_argument('--show-transcripts', action='store_true', help="Keep the client's User/Assistant console output")
+    args = parser.parse_args()
+
+    if args.wav_files:
+        turns = [load_wav(path) for path in args.wav_files]
+    else:
+        turns = [synthetic_pcm(args.turn_seconds, INPUT_SAMPLE_RATE) for _ in range(args.synthetic_turns)]
+    # Trailing silence, as the speaker pauses before the model answers
+    silence = bytes(int(0.5 * INPUT_SAMPLE_RATE) * SAMPLE_WIDTH)
+    turns = [pcm + silence for pcm in turns]
+
+    benchmark = run_benchmark(turns, sessions=args.sessions, speed=args.speed, uplink_frame_ms=args.uplink_frame_ms,
+                              response_seconds=args.response_seconds, tool_every=args.tool_every)
+    output = contextlib.nullcontext() if args.show_transcripts else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        report = asyncio.run(benchmark)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class StartupTimeline:
+    """Records named startup milestones, from any thread, relative to when the timeline was created.
+
+    Marks made after `finish()` are ignored, so code that also runs later in the
+    session (e.g. reconnecting) does not pollute the startup report.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.marks = []
+        self.finished = False
+
+    def mark(self, label):
+        """Record a milestone reached on the calling thread."""
+        if self.finished:
+            return
+        self.marks.append((time.perf_counter_ns() - self.origin, threading.current_thread().name, label))
+
+    def finish(self):
+        """Stop recording milestones."""
+        self.finished = True
+
+    def report(self):
+        """Return the timeline as printable lines, ordered by time."""
+        lines = ["Startup timeline:"]
+        for elapsed, thread_name, label in sorted(self.marks):
+            lines.append(f"  +{elapsed / 1e6:8.1f} ms  [{thread_name}] {label}")
+        return "\n".join(lines)
@@ -0,0 +1,106 @@
+import json
+import time
+from collections import OrderedDict
+
+
+class ToolResultCache:
+    """Per-tool result cache with TTL expiry and LRU eviction.
+
+    Only tools with a policy set through `set_policy()` are cached. Entries are keyed
+    by a canonical form of the JSON in toolUseContent['content'], so the same
+    arguments in a different key order or with extra whitespace hit the same entry.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # tool name (lowercase) -> (ttl seconds, max entries)
+        self.policies = {}
+        # tool name (lowercase) -> OrderedDict of key -> (expires_at, result), oldest first
+        self._entries = {}
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def set_policy(self, tool_name, ttl, max_entries=128):
+        """Cache results of `tool_name` for `ttl` seconds, keeping at most `max_entries` of them."""
+        tool = tool_name.lower()
+        self.policies[tool] = (ttl, max_entries)
+        self._entries.setdefault(tool, OrderedDict())
+
+    def get(self, tool_name, tool_use_content):
+        """Return (hit, result) for a tool call."""
+        tool = tool_name.lower()
+        entries = self._entries.get(tool)
+        if entries is None:
+            return False, None
+
+        key = self.make_key(tool_use_content)
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, result = entry
+        if self.clock() >= expires_at:
+            del entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+
+        entries.move_to_end(key)
+        self.hits += 1
+        return True, result
+
+    def put(self, tool_name, tool_use_content, result):
+        """Store a tool result if the tool has a cache policy. Error results are not cached."""
+        tool = tool_name.lower()
+        policy = self.policies.get(tool)
+        if policy is None or (isinstance(result, dict) and "error" in result):
+            return
+
+        ttl, max_entries = policy
+        entries = self._entries[tool]
+        key = self.make_key(tool_use_content)
+        entries[key] = (self.clock() + ttl, result)
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    @staticmethod
+    def make_key(tool_use_content):
+        """Canonical key for the JSON arguments in toolUseContent['content']."""
+        content = tool_use_content.get("content") if isinstance(tool_use_content, dict) else tool_use_content
+        if not content:
+            return ""
+        try:
+            arguments = json.loads(content) if isinstance(content, str) else content
+        except json.JSONDecodeError:
+            return content.strip()
+        return json.dumps(_normalize(arguments), sort_keys=True, separators=(",", ":"))
+
+
+def _normalize(value):
+    """Strip surrounding whitespace from strings so ' 1234' and '1234' share an entry."""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
@@ -0,0 +1,129 @@
+import asyncio
+
+
+class ToolRunner:
+    """Runs tool calls as supervised background tasks so the response loop keeps reading the stream.
+
+    Each call runs under its own timeout, several toolUse IDs can be in flight at
+    once, and results are handed to `send_result` in completion order, tagged with
+    the toolUseId they answer. Sending is serialized so the contentStart/toolResult/
+    contentEnd events of two results never interleave.
+
+    A call submitted with `hold=True` runs right away but keeps its result until
+    `release()` is called, so a tool can be started speculatively and answered as
+    soon as the model is ready for the result.
+    """
+
+    def __init__(self, execute, send_result, timeouts=None, default_timeout=10.0, max_concurrency=8):
+        # execute(tool_name, tool_use_content) -> result
+        self.execute = execute
+        # send_result(tool_use_id, result)
+        self.send_result = send_result
+        self.timeouts = {name.lower(): timeout for name, timeout in (timeouts or {}).items()}
+        self.default_timeout = default_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._send_lock = asyncio.Lock()
+        self._tasks = {}
+        # toolUse ID -> asyncio.Event gating the result of a held call
+        self._held = {}
+
+        # Counters
+        self.started = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.released = 0
+
+    @property
+    def in_flight(self):
+        """toolUse IDs that are still running or waiting to send their result."""
+        return list(self._tasks)
+
+    def submit(self, tool_use_id, tool_name, tool_use_content, hold=False):
+        """Start a tool call in the background and return its task.
+
+        With hold=True the result is only sent once release(tool_use_id) is called.
+        """
+        if hold:
+            self._held[tool_use_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(tool_use_id, tool_name, tool_use_content))
+        self._tasks[tool_use_id] = task
+        task.add_done_callback(lambda _: self._finished(tool_use_id))
+        self.started += 1
+        return task
+
+    def release(self, tool_use_id):
+        """Let a held call send its result. Returns False if no such call is still in flight."""
+        event = self._held.get(tool_use_id)
+        if event is None:
+            return False
+        event.set()
+        self.released += 1
+        return True
+
+    def is_held(self, tool_use_id):
+        """True if the call is in flight and still waiting for release()."""
+        event = self._held.get(tool_use_id)
+        return event is not None and not event.is_set()
+
+    def cancel(self, tool_use_id):
+        """Abandon an in-flight tool call."""
+        task = self._tasks.get(tool_use_id)
+        if task and not task.done():
+            task.cancel()
+
+    async def shutdown(self):
+        """Cancel every in-flight tool call and wait for them to finish."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        """Return a snapshot of the runner counters."""
+        return {
+            "in_flight": len(self._tasks),
+            "started": self.started,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "released": self.released,
+        }
+
+    def _finished(self, tool_use_id):
+        self._tasks.pop(tool_use_id, None)
+        self._held.pop(tool_use_id, None)
+
+    async def _run(self, tool_use_id, tool_name, tool_use_content):
+        timeout = self.timeouts.get(tool_name.lower(), self.default_timeout)
+        try:
+            async with self._semaphore:
+                try:
+                    result = await asyncio.wait_for(self.execute(tool_name, tool_use_content), timeout)
+                    self.completed += 1
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    print(f"Tool {tool_name} ({tool_use_id}) timed out after {timeout}s")
+                    result = {"error": f"The {tool_name} tool did not respond in time."}
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Tool {tool_name} ({tool_use_id}) failed: {e}")
+                    result = {"error": f"The {tool_name} tool failed."}
+
+            # Speculative calls wait here, outside the semaphore, until the model asks for the result
+            held = self._held.get(tool_use_id)
+            if held is not None:
+                await held.wait()
+
+            async with self._send_lock:
+                await self.send_result(tool_use_id, result)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            print(f"Error sending result for tool {tool_name} ({tool_use_id}): {e}")
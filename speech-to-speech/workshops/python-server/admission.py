@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import Counter, deque
+
+
+class AdmissionController:
+    """Decides whether a new voice session may start, given the load of this process.
+
+    Three signals are checked: live sessions against `max_sessions`, event
+    loop lag against `max_loop_lag` seconds, and the fullest session output
+    queue against `max_output_fill` (a fraction of its size). If all are
+    under their thresholds the session is admitted at once. Otherwise it
+    waits in a FIFO of at most `max_queue` sessions for up to `max_wait`
+    seconds, and `on_queued(position, estimated_wait)` is awaited so the
+    client can be told. Sessions that cannot be queued or wait too long are
+    rejected, and the caller closes them with a retryable code.
+    A threshold of 0 disables that check.
+    """
+
+    def __init__(self, max_sessions=0, max_loop_lag=0.2, max_output_fill=0.8, max_queue=8, max_wait=15.0,
+                 poll_interval=0.25, default_session_seconds=120.0):
+        self.max_sessions = max_sessions
+        self.max_loop_lag = max_loop_lag
+        self.max_output_fill = max_output_fill
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        # Moving average of session length, used for the wait estimate
+        self.avg_session_seconds = default_session_seconds
+        self.loop_lag = 0.0
+        # key -> [start time, session manager or None]
+        self._sessions = {}
+        self._waiting = deque()
+
+        # Counters
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = Counter()
+
+    @property
+    def active(self):
+        """Number of admitted sessions that have not been released."""
+        return len(self._sessions)
+
+    @property
+    def waiting(self):
+        """Number of sessions waiting for admission."""
+        return len(self._waiting)
+
+    def session_managers(self):
+        """Session managers of the admitted sessions that have one."""
+        return [manager for _, manager in self._sessions.values() if manager]
+
+    def observe_loop_lag(self, lag):
+        """Record the latest event loop lag measurement, in seconds."""
+        self.loop_lag = lag
+
+    def output_fill(self):
+        """Fill fraction of the fullest session output queue."""
+        return max((manager.output_queue.qsize() / manager.output_queue.maxsize
+                    for manager in self.session_managers() if manager.output_queue.maxsize),
+                   default=0.0)
+
+    def overload_reason(self):
+        """Name of the first threshold that is crossed, or None."""
+        if self.max_sessions and self.active >= self.max_sessions:
+            return "sessions"
+        if self.max_loop_lag and self.loop_lag > self.max_loop_lag:
+            return "loop_lag"
+        if self.max_output_fill and self.output_fill() > self.max_output_fill:
+            return "output_queue"
+        return None
+
+    def estimated_wait(self, position):
+        """Seconds until `position` sessions have ended, at the average session length."""
+        return position * self.avg_session_seconds / max(self.active, 1)
+
+    async def admit(self, key, on_queued=None):
+        """Admit the session identified by key, queueing it if needed. Returns (admitted, reason)."""
+        reason = self.overload_reason()
+        if reason is None and not self._waiting:
+            self._start(key)
+            return True, None
+        if len(self._waiting) >= self.max_queue:
+            return self._reject(reason or "queue_full")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        self._waiting.append(key)
+        self.queued += 1
+        try:
+            if on_queued:
+                position = len(self._waiting)
+                await on_queued(position, round(min(self.estimated_wait(position), self.max_wait), 1))
+            while True:
+                reason = self.overload_reason()
+                if reason is None and self._waiting[0] is key:
+                    self._start(key)
+                    return True, None
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return self._reject("wait_timeout")
+                await asyncio.sleep(min(self.poll_interval, remaining))
+        finally:
+            self._waiting.remove(key)
+
+    def attach(self, key, stream_manager):
+        """Associate an admitted session with its manager, so its output queue counts toward the load."""
+        if key in self._sessions:
+            self._sessions[key][1] = stream_manager
+
+    def release(self, key):
+        """Mark an admitted session as finished."""
+        session = self._sessions.pop(key, None)
+        if session:
+            self.avg_session_seconds += 0.2 * (time.monotonic() - session[0] - self.avg_session_seconds)
+
+    def _start(self, key):
+        self._sessions[key] = [time.monotonic(), None]
+        self.admitted += 1
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return False, reason
+
+    def stats(self):
+        """Return current load, thresholds and decision counters."""
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "output_fill": round(self.output_fill(), 3),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "thresholds": {
+                "max_sessions": self.max_sessions,
+                "max_loop_lag_ms": round(self.max_loop_lag * 1000, 1),
+                "max_output_fill": self.max_output_fill,
+                "max_queue": self.max_queue,
+                "max_wait_seconds": self.max_wait,
+            },
+        }
@@ -1,9 +1,14 @@
 import json
 import boto3
 import os
+from kb_retriever import AsyncKbRetriever
+from semantic_cache import BedrockEmbedder, HashingEmbedder, SemanticCache
 
 KB_ID = os.environ.get('KB_ID')
 KB_REGION = os.environ.get('KB_REGION', 'us-east-1')
+# Semantic query cache: "bedrock" (Titan embeddings), "local" (deterministic hashing embedder) or unset (off)
+KB_SEMANTIC_CACHE = os.environ.get('KB_SEMANTIC_CACHE')
+KB_SEMANTIC_THRESHOLD = float(os.environ.get('KB_SEMANTIC_THRESHOLD', '0.9'))
 bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=KB_REGION) 
 
 def retrieve_kb(query):
@@ -27,6 +32,19 @@ def retrieve_kb(query):
             results.append(r["content"]["text"])
     return results
 
+def create_embedder(kind):
+    """Query embedder for the semantic cache, or None when it is disabled."""
+    if kind == "bedrock":
+        return BedrockEmbedder(boto3.client('bedrock-runtime', region_name=KB_REGION))
+    if kind == "local":
+        return HashingEmbedder()
+    return None
+
+# Async, single-flight, cached retrieve_kb for use on the event loop
+embedder = create_embedder(KB_SEMANTIC_CACHE)
+retriever = AsyncKbRetriever(retrieve_kb, embedder=embedder,
+                             semantic_cache=SemanticCache(embedder.dim, KB_SEMANTIC_THRESHOLD) if embedder else None)
+
 def retrieve_and_generation(query):
     results = []
     custom_prompt = """
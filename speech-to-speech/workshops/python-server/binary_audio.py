@@ -0,0 +1,84 @@
+import binascii
+import struct
+
+# WebSocket subprotocol a client offers to switch audio to binary frames
+BINARY_SUBPROTOCOL = "nova-s2s-binary.v1"
+
+# Frame header: <u8 frame type> <u8 version> <u16 slot>, followed by raw 16-bit PCM
+FRAME_HEADER = struct.Struct("<BBH")
+FRAME_VERSION = 1
+AUDIO_INPUT = 1    # client -> server, 16 kHz mono
+AUDIO_OUTPUT = 2   # server -> client, 24 kHz mono
+
+
+class BinaryAudioChannel:
+    """Maps binary audio frames to Nova Sonic content blocks for one WebSocket connection.
+
+    Control events (sessionStart, promptStart, contentStart, ...) stay JSON. Audio
+    goes as raw PCM behind a 4-byte header whose slot number names the content
+    block, so prompt and content names are negotiated once per block instead of
+    being sent with every frame. Slots are not sent explicitly: each side numbers
+    AUDIO content blocks in the order their JSON contentStart events were sent,
+    starting at 1, separately for input (client contentStart) and output (the
+    model's contentStart forwarded to the client).
+    """
+
+    def __init__(self):
+        # Input slot -> (promptName, contentName)
+        self.input_slots = {}
+        # Output contentId -> slot
+        self.output_slots = {}
+        self._next_output_slot = 1
+
+        # Counters
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def register_input(self, content_start):
+        """Assign the next input slot to a client AUDIO contentStart."""
+        slot = len(self.input_slots) + 1
+        self.input_slots[slot] = (content_start['promptName'], content_start['contentName'])
+        return slot
+
+    def register_output(self, content_start):
+        """Assign the next output slot to a model AUDIO contentStart; returns the slot."""
+        slot = self._next_output_slot
+        self._next_output_slot += 1
+        self.output_slots[content_start.get('contentId')] = slot
+        return slot
+
+    def decode_input(self, frame):
+        """Return (prompt_name, content_name, pcm) for a binary audioInput frame."""
+        if len(frame) < FRAME_HEADER.size:
+            raise ValueError("binary frame shorter than its header")
+        frame_type, version, slot = FRAME_HEADER.unpack_from(frame)
+        if frame_type != AUDIO_INPUT or version != FRAME_VERSION:
+            raise ValueError(f"unsupported binary frame type {frame_type} version {version}")
+        names = self.input_slots.get(slot)
+        if names is None:
+            raise ValueError(f"binary audio for unknown slot {slot}; send the AUDIO contentStart first")
+        pcm = memoryview(frame)[FRAME_HEADER.size:]
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+        return names[0], names[1], pcm
+
+    def encode_output(self, audio_output):
+        """Binary frame for an audioOutput event body, or None if its content block was never announced."""
+        return self.encode_output_pcm(audio_output.get('contentId'), binascii.a2b_base64(audio_output['content']))
+
+    def encode_output_pcm(self, content_id, pcm):
+        """Binary frame for decoded output audio of a content block, or None if the block was never announced."""
+        slot = self.output_slots.get(content_id)
+        if slot is None:
+            return None
+        frame = FRAME_HEADER.pack(AUDIO_OUTPUT, FRAME_VERSION, slot) + pcm
+        self.frames_out += 1
+        self.bytes_out += len(frame)
+        return frame
+
+    def stats(self):
+        """Return the frame counters."""
+        return {"frames_in": self.frames_in, "frames_out": self.frames_out,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
@@ -0,0 +1,196 @@
+import asyncio
+import binascii
+import time
+
+
+class OverloadBreaker:
+    """Ends a session whose queues stay over budget.
+
+    Queues report every overflow (a dropped or merged item, a timed out put)
+    and every recovery (draining back to half their size). If overflows keep
+    coming for `budget_seconds` without a recovery in between, or a queue
+    reports a fatal overflow, `on_trip()` is called once.
+    """
+
+    def __init__(self, budget_seconds, on_trip):
+        self.budget_seconds = budget_seconds
+        self.on_trip = on_trip
+        self.tripped = False
+        self._since = None
+
+        # Counters
+        self.overflows = 0
+        self.recoveries = 0
+
+    def overflow(self, fatal=False):
+        """Record an overflow; trips the breaker if the session has been over budget too long."""
+        self.overflows += 1
+        now = time.monotonic()
+        if self._since is None:
+            self._since = now
+        if not self.tripped and (fatal or now - self._since >= self.budget_seconds):
+            self.tripped = True
+            self.on_trip()
+
+    def recover(self):
+        """Record that a queue drained back under budget."""
+        if self._since is not None:
+            self._since = None
+            self.recoveries += 1
+
+    def stats(self):
+        """Return the breaker state."""
+        return {
+            "tripped": self.tripped,
+            "over_budget_seconds": round(time.monotonic() - self._since, 3) if self._since is not None else 0,
+            "overflows": self.overflows,
+            "recoveries": self.recoveries,
+        }
+
+
+class _TimedQueue(asyncio.Queue):
+    """asyncio.Queue that measures how long items wait and reports to an OverloadBreaker."""
+
+    def __init__(self, maxsize, breaker=None):
+        super().__init__(maxsize)
+        self.breaker = breaker
+
+        # Counters
+        self.puts = 0
+        self.gets = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _put(self, item):
+        self._queue.append((time.monotonic(), item))
+        self.puts += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+
+    def _get(self):
+        queued, item = self._queue.popleft()
+        wait = time.monotonic() - queued
+        self.gets += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if self.breaker and len(self._queue) <= self.maxsize // 2:
+            self.breaker.recover()
+        return item
+
+    def _overflow(self, fatal=False):
+        if self.breaker:
+            self.breaker.overflow(fatal)
+
+    def stats(self):
+        """Return depth and wait time counters."""
+        return {
+            "depth": self.qsize(),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "puts": self.puts,
+            "avg_wait_ms": round(self.total_wait / self.gets * 1000, 2) if self.gets else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class OutputQueue(_TimedQueue):
+    """Bounded queue of OutputEvents from Bedrock to the client.
+
+    Audio is drop-oldest: when the queue is full, the oldest queued audioOutput
+    is discarded, since audio that has waited that long would only play late.
+    Control events (everything else) are never dropped: `put` waits up to
+    `control_timeout` seconds for space, and a client that cannot take a
+    control event in that time trips the breaker.
+    """
+
+    def __init__(self, maxsize=256, control_timeout=2.0, breaker=None):
+        super().__init__(maxsize, breaker)
+        self.control_timeout = control_timeout
+
+        # Counters
+        self.dropped_audio = 0
+        self.control_timeouts = 0
+
+    async def put(self, event):
+        """Queue an event, applying the audio or control policy when full."""
+        if self.full() and not (event.name == 'audioOutput' and self._drop_oldest_audio()):
+            try:
+                await asyncio.wait_for(super().put(event), self.control_timeout)
+            except asyncio.TimeoutError:
+                self.control_timeouts += 1
+                self._overflow(fatal=True)
+            return
+        self.put_nowait(event)
+
+    def _drop_oldest_audio(self):
+        for index, (_, queued) in enumerate(self._queue):
+            if queued.name == 'audioOutput':
+                del self._queue[index]
+                self.dropped_audio += 1
+                self._overflow()
+                return True
+        return False
+
+    def purge(self, predicate):
+        """Remove queued events matching predicate(event); returns how many were removed."""
+        kept = [entry for entry in self._queue if not predicate(entry[1])]
+        removed = len(self._queue) - len(kept)
+        if removed:
+            self._queue.clear()
+            self._queue.extend(kept)
+            # Wake putters waiting for space
+            self._wakeup_next(self._putters)
+        return removed
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(dropped_audio=self.dropped_audio, control_timeouts=self.control_timeouts)
+        return stats
+
+
+class AudioInputQueue(_TimedQueue):
+    """Bounded queue of client audio chunks on their way to Bedrock.
+
+    `put_nowait` never blocks the WebSocket reader. When the queue is full, the
+    new chunk is merged into the last queued chunk of the same content block, so
+    speech reaches the model in fewer, larger audioInput events instead of being
+    lost. A merged chunk is capped at `max_chunk_bytes` of PCM; past that the
+    oldest queued chunk is dropped.
+    """
+
+    def __init__(self, maxsize=64, max_chunk_bytes=32000, breaker=None):
+        super().__init__(maxsize, breaker)
+        self.max_chunk_bytes = max_chunk_bytes
+
+        # Counters
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put_nowait(self, chunk):
+        """Queue an audio chunk, coalescing or dropping the oldest when full."""
+        if self.full():
+            queued, last = self._queue[-1]
+            if (last['prompt_name'], last['content_name']) == (chunk['prompt_name'], chunk['content_name']):
+                pcm = _pcm(last) + _pcm(chunk)
+                if len(pcm) <= self.max_chunk_bytes:
+                    self._queue[-1] = (queued, {'prompt_name': chunk['prompt_name'],
+                                                'content_name': chunk['content_name'], 'pcm': pcm})
+                    self.coalesced += 1
+                    self._overflow()
+                    return
+            self._queue.popleft()
+            self.dropped += 1
+            self._overflow()
+        super().put_nowait(chunk)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(coalesced=self.coalesced, dropped=self.dropped)
+        return stats
+
+
+def _pcm(chunk):
+    pcm = chunk.get('pcm')
+    if pcm is None:
+        return binascii.a2b_base64(chunk['audio_bytes'])
+    return bytes(pcm)
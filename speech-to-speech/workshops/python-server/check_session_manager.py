@@ -0,0 +1,115 @@
+"""Feeds scripted Bedrock output events through S2sSessionManager._process_responses.
+
+Checks that assistant audio reaches the output queue, that barge-in purges and
+suppresses the interrupted block, and that a TOOL contentEnd starts the tool.
+Runs without AWS access: the Bedrock stream is a scripted stand-in, and SDK
+modules that are not installed are replaced by placeholders, since only the
+response loop is exercised.
+
+    python check_session_manager.py
+"""
+import asyncio
+import importlib
+import json
+import sys
+import types
+
+SDK_MODULES = {
+    "boto3": ["client"],
+    "aws_sdk_bedrock_runtime": [],
+    "aws_sdk_bedrock_runtime.client": ["BedrockRuntimeClient", "InvokeModelWithBidirectionalStreamOperationInput"],
+    "aws_sdk_bedrock_runtime.models": ["InvokeModelWithBidirectionalStreamInputChunk", "BidirectionalInputPayloadPart"],
+    "aws_sdk_bedrock_runtime.config": ["Config", "HTTPAuthSchemeResolver", "SigV4AuthScheme"],
+    "smithy_aws_core": [],
+    "smithy_aws_core.credentials_resolvers": [],
+    "smithy_aws_core.credentials_resolvers.environment": ["EnvironmentCredentialsResolver"],
+}
+
+
+def ensure_sdk_modules():
+    """Install placeholders for SDK modules that are not available here."""
+    for name, attributes in SDK_MODULES.items():
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            module = sys.modules[name] = types.ModuleType(name)
+            for attribute in attributes:
+                setattr(module, attribute, lambda *args, **kwargs: types.SimpleNamespace(**kwargs))
+
+
+def event(name, body):
+    return json.dumps({"event": {name: body}}).encode('utf-8')
+
+
+class ScriptedStream:
+    """Bedrock stream stand-in: returns the scripted events, then waits forever."""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.sent = []
+        self.input_stream = self
+
+    async def await_output(self):
+        if not self.events:
+            await asyncio.Event().wait()
+        return None, self
+
+    async def receive(self):
+        payload = types.SimpleNamespace(bytes_=self.events.pop(0))
+        return types.SimpleNamespace(value=payload)
+
+    async def send(self, chunk):
+        self.sent.append(chunk)
+
+    async def close(self):
+        pass
+
+
+async def run(manager, events):
+    """Run the response loop over events and return the names queued for the client."""
+    manager.stream = ScriptedStream(events)
+    manager.is_active = True
+    task = asyncio.create_task(manager._process_responses())
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if not manager.stream.events:
+            break
+    assert not task.done(), f"response loop exited: {task.exception() if task.done() else ''}"
+    task.cancel()
+    names = []
+    while not manager.output_queue.empty():
+        names.append(manager.output_queue.get_nowait().name)
+    return names
+
+
+async def main():
+    ensure_sdk_modules()
+    from s2s_session_manager import S2sSessionManager
+
+    manager = S2sSessionManager()
+    manager.prompt_name = "prompt"
+    audio_start = event("contentStart", {"contentId": "a1", "type": "AUDIO", "role": "ASSISTANT"})
+    audio = event("audioOutput", {"contentId": "a1", "content": "AAAA"})
+
+    names = await run(manager, [audio_start, audio, audio])
+    assert names == ["contentStart", "audioOutput", "audioOutput"], names
+    assert manager.audio_output_content_id == "a1"
+    print("audio: ok")
+
+    interrupted = event("textOutput", {"contentId": "t1", "content": '{ "interrupted" : true }'})
+    names = await run(manager, [audio_start, audio, interrupted, audio,
+                                event("contentEnd", {"contentId": "a1", "type": "AUDIO"})])
+    assert names == ["contentStart", "bargeIn", "textOutput", "contentEnd"], names
+    assert manager.suppressed_audio == 1
+    print("barge-in: ok")
+
+    tool_use = event("toolUse", {"contentId": "u1", "toolName": "getDateTool", "toolUseId": "tool-1", "content": "{}"})
+    names = await run(manager, [tool_use, event("contentEnd", {"contentId": "u1", "type": "TOOL"})])
+    assert names == ["toolUse", "contentEnd"], names
+    assert manager.tool_runner.started == 1
+    await manager.tool_runner.shutdown()
+    print("tool use: ok")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
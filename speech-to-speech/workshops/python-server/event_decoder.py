@@ -0,0 +1,85 @@
+import binascii
+import json
+
+# Use orjson when it is installed (pip install orjson); it parses Sonic events several times faster
+try:
+    import orjson
+    DEFAULT_LOADS = orjson.loads
+except ImportError:
+    orjson = None
+    DEFAULT_LOADS = json.loads
+
+AUDIO_OUTPUT_KEY = b'"audioOutput"'
+CONTENT_FIELD = b'"content":'
+
+
+class EventDecoder:
+    """Decodes Nova Sonic output events for dispatch through a handler table keyed by event name.
+
+    `audioOutput` events, which make up most of the inbound traffic, take a fast path:
+    the base64 payload is located in the raw bytes and decoded directly, without
+    building the JSON dict. Anything the fast path does not recognise falls back to
+    the pluggable `loads` function.
+    """
+
+    def __init__(self, loads=None):
+        self.loads = loads or DEFAULT_LOADS
+        self.fast_path_events = 0
+        self.parsed_events = 0
+
+    def decode(self, raw):
+        """Decode one raw event.
+
+        Returns (event_name, body, json_data). For audioOutput the body is the decoded
+        PCM bytes and json_data is None when the fast path was taken. For all other
+        events the body is the inner event dict.
+        """
+        audio = self.decode_audio(raw)
+        if audio is not None:
+            self.fast_path_events += 1
+            return 'audioOutput', audio, None
+
+        self.parsed_events += 1
+        json_data = self.loads(raw)
+        event = json_data.get('event') if isinstance(json_data, dict) else None
+        if not event:
+            return None, None, json_data
+
+        event_name = next(iter(event))
+        body = event[event_name]
+        if event_name == 'audioOutput':
+            body = binascii.a2b_base64(body['content'])
+        return event_name, body, json_data
+
+    def decode_audio(self, raw):
+        """Fast path: return the decoded PCM of an audioOutput event, or None if raw is not one."""
+        # The event key sits right after '{"event":{', no need to scan the whole payload
+        key = raw.find(AUDIO_OUTPUT_KEY, 0, 48)
+        if key < 0:
+            return None
+        start = raw.find(CONTENT_FIELD, key)
+        if start < 0:
+            return None
+        start += len(CONTENT_FIELD)
+        # Allow whitespace between the colon and the opening quote
+        while raw[start:start + 1] in (b' ', b'\t', b'\n', b'\r'):
+            start += 1
+        if raw[start:start + 1] != b'"':
+            return None
+        start += 1
+        end = raw.find(b'"', start)
+        # Escaped characters (e.g. '\/') need the full JSON parser
+        if end < 0 or raw.find(b'\\', start, end) >= 0:
+            return None
+        return binascii.a2b_base64(memoryview(raw)[start:end])
+
+    def generation_stage(self, content_start):
+        """Return the generationStage from contentStart.additionalModelFields without a second full parse where possible."""
+        fields = content_start.get('additionalModelFields')
+        if not fields:
+            return None
+        if '"SPECULATIVE"' in fields:
+            return 'SPECULATIVE'
+        if '"FINAL"' in fields:
+            return 'FINAL'
+        return self.loads(fields).get('generationStage')
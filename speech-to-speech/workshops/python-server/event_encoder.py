@@ -0,0 +1,140 @@
+import binascii
+import json
+import re
+
+EVENT_PREFIX = b'{"event":{"'
+# Closes "content":"...", the event body, the event and the envelope
+STRING_CONTENT_SUFFIX = b'"}}}'
+# Base64 content that can be placed between quotes without escaping
+_BASE64 = re.compile(rb'[A-Za-z0-9+/]*={0,2}')
+
+
+def _compact(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+class EventEncoder:
+    """Byte-level encoder for Nova Sonic input events.
+
+    Produces compact JSON (no template whitespace) ready for `send_raw_event`.
+    For `audioInput`, `textInput` and `toolResult` the constant part of the event
+    up to the content field is serialized once per (event, prompt, content) and
+    cached, so each frame costs a base64 encode and one join. Content starts and
+    ends are cached whole, since they never change for a given content name.
+    """
+
+    def __init__(self, max_cached=256):
+        self.max_cached = max_cached
+        self._cache = {}
+
+    def _cached(self, key, build):
+        value = self._cache.get(key)
+        if value is None:
+            if len(self._cache) >= self.max_cached:
+                # Content names are per turn; old ones are never needed again
+                self._cache.clear()
+            value = self._cache[key] = build()
+        return value
+
+    def _content_prefix(self, event_name, prompt_name, content_name):
+        return self._cached((event_name, prompt_name, content_name), lambda: (
+            EVENT_PREFIX + event_name.encode() + b'":{"promptName":' + _compact(prompt_name).encode()
+            + b',"contentName":' + _compact(content_name).encode() + b',"content":'))
+
+    def audio_input(self, prompt_name, content_name, audio_bytes):
+        """audioInput event for raw PCM; the audio is base64 encoded straight into the frame."""
+        return b''.join((self._content_prefix('audioInput', prompt_name, content_name), b'"',
+                         binascii.b2a_base64(audio_bytes, newline=False), STRING_CONTENT_SUFFIX))
+
+    def audio_input_base64(self, prompt_name, content_name, content):
+        """audioInput event for audio that is already base64 encoded (str or bytes).
+
+        Content from clients is checked to be plain base64; anything else is
+        JSON-escaped instead of spliced in, and left for Bedrock to reject.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        prefix = self._content_prefix('audioInput', prompt_name, content_name)
+        if not _BASE64.fullmatch(content):
+            return b''.join((prefix, _compact(content.decode('utf-8', 'replace')).encode('utf-8'), b'}}}'))
+        return b''.join((prefix, b'"', content, STRING_CONTENT_SUFFIX))
+
+    def text_input(self, prompt_name, content_name, text):
+        """textInput event; the text is JSON-escaped."""
+        return b''.join((self._content_prefix('textInput', prompt_name, content_name),
+                         _compact(text).encode('utf-8'), b'}}}'))
+
+    def tool_result(self, prompt_name, content_name, content):
+        """toolResult event; dict results are serialized to a JSON string first."""
+        if not isinstance(content, str):
+            content = _compact(content)
+        return b''.join((self._content_prefix('toolResult', prompt_name, content_name),
+                         _compact(content).encode('utf-8'), b'}}}'))
+
+    def content_start_audio(self, prompt_name, content_name, sample_rate=16000):
+        """contentStart for user audio input."""
+        return self._cached(('contentStart', prompt_name, content_name, 'AUDIO'), lambda: self.encode({
+            "event": {"contentStart": {
+                "promptName": prompt_name,
+                "contentName": content_name,
+                "type": "AUDIO",
+                "interactive": True,
+                "role": "USER",
+                "audioInputConfiguration": {
+                    "mediaType": "audio/lpcm",
+                    "sampleRateHertz": sample_rate,
+                    "sampleSizeBits": 16,
+                    "channelCount": 1,
+                    "audioType": "SPEECH",
+                    "encoding": "base64"
+                }
+            }}
+        }))
+
+    def content_start_text(self, prompt_name, content_name, role="SYSTEM", interactive=True):
+        """contentStart for text input."""
+        return self._cached(('contentStart', prompt_name, content_name, role), lambda: self.encode({
+            "event": {"contentStart": {
+                "promptName": prompt_name,
+                "contentName": content_name,
+                "role": role,
+                "type": "TEXT",
+                "interactive": interactive,
+                "textInputConfiguration": {"mediaType": "text/plain"}
+            }}
+        }))
+
+    def content_start_tool(self, prompt_name, content_name, tool_use_id):
+        """contentStart for a tool result."""
+        return self.encode({
+            "event": {"contentStart": {
+                "promptName": prompt_name,
+                "contentName": content_name,
+                "interactive": False,
+                "type": "TOOL",
+                "role": "TOOL",
+                "toolResultInputConfiguration": {
+                    "toolUseId": tool_use_id,
+                    "type": "TEXT",
+                    "textInputConfiguration": {"mediaType": "text/plain"}
+                }
+            }}
+        })
+
+    def content_end(self, prompt_name, content_name):
+        """contentEnd for any content."""
+        return self._cached(('contentEnd', prompt_name, content_name), lambda: self.encode(
+            {"event": {"contentEnd": {"promptName": prompt_name, "contentName": content_name}}}))
+
+    @staticmethod
+    def encode(event):
+        """Compact UTF-8 JSON for any other event dict."""
+        return _compact(event).encode('utf-8')
+
+    @staticmethod
+    def event_name(raw):
+        """Event key of an encoded event, read without parsing the whole payload."""
+        if raw.startswith(EVENT_PREFIX):
+            start = len(EVENT_PREFIX)
+            return raw[start:raw.index(b'"', start)].decode()
+        return next(iter(json.loads(raw)["event"]))
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Cache key for a query: the text of a {"query": ...} tool input, case-folded, whitespace collapsed."""
+    try:
+        parsed = json.loads(query)
+        if isinstance(parsed, dict) and len(parsed) == 1:
+            query = str(next(iter(parsed.values())))
+    except (TypeError, ValueError):
+        pass
+    return _SPACES.sub(" ", str(query)).strip().rstrip("?!.").casefold()
+
+
+class AsyncKbRetriever:
+    """Runs a blocking Knowledge Base retrieve function without blocking the event loop.
+
+    Calls run on a small dedicated thread pool. Identical queries (after
+    `normalize_query`) that arrive while one is already running wait for that
+    request instead of starting their own (single-flight), and results are
+    cached for `ttl` seconds. Each caller waits at most `timeout` seconds and
+    gets an empty result on timeout or error, which the tool turns into "no
+    result found"; the request itself keeps running and still fills the cache.
+    At most `max_pending` distinct queries are in flight; beyond that callers
+    get the empty result straight away.
+
+    With an `embedder` and a `semantic_cache` (see semantic_cache.py), a query
+    that misses the exact cache is embedded and answered from the result of a
+    similar earlier query when there is one, so rephrasings of a question
+    skip the round trip too.
+    """
+
+    def __init__(self, retrieve, max_workers=4, max_pending=32, timeout=5.0, ttl=300.0, max_entries=256,
+                 embedder=None, semantic_cache=None):
+        self.retrieve_fn = retrieve
+        self.embedder = embedder
+        self.semantic_cache = semantic_cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-retrieve")
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Normalized query -> (expiry, result), oldest first
+        self._cache = OrderedDict()
+        # Normalized query -> future of the running request
+        self._in_flight = {}
+
+        # Counters
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+
+    async def retrieve(self, query):
+        """Retrieval results for query, or [] if none arrived within the timeout."""
+        self.requests += 1
+        key = normalize_query(query)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached[1]
+            del self._cache[key]
+
+        vector = None
+        if self.semantic_cache and key not in self._in_flight:
+            vector = await self._embed(query)
+            if vector is not None:
+                result = self.semantic_cache.lookup(vector)
+                if result is not None:
+                    return result
+
+        # Checked after embedding, which may have let an identical query start
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        elif len(self._in_flight) >= self.max_pending:
+            self.rejected += 1
+            print(f"Knowledge Base retrieval skipped, {len(self._in_flight)} queries already in flight")
+            return []
+        else:
+            started = time.monotonic()
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.retrieve_fn, query)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done, vector, time.monotonic() - started))
+
+        try:
+            # Shielded: a caller giving up does not cancel the request other callers share
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"Knowledge Base retrieval timed out after {self.timeout}s")
+        except Exception as e:
+            self.errors += 1
+            print(f"Knowledge Base retrieval failed: {e}")
+        return []
+
+    async def _embed(self, query):
+        """Embedding of the normalized query, or None if the embedder failed."""
+        text = normalize_query(query)
+        try:
+            if not self.embedder.blocking:
+                return self.embedder.embed(text)
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(self.executor, self.embedder.embed, text), self.timeout)
+        except Exception as e:
+            print(f"Query embedding failed, skipping the semantic cache: {e}")
+            return None
+
+    def _finished(self, key, future, vector=None, seconds=0.0):
+        self._in_flight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        if vector is not None and future.result():
+            self.semantic_cache.store(vector, future.result(), seconds)
+        self._cache[key] = (time.monotonic() + self.ttl, future.result())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        """Return the retrieval counters."""
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "in_flight": len(self._in_flight),
+            "cached": len(self._cache),
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache else None,
+        }
@@ -0,0 +1,124 @@
+import bisect
+import time
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram; observe() is a bisect and two additions."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        """(name, labels, value) samples in Prometheus histogram form."""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield f"{name}_bucket", labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),), total
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, total
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels) + "}"
+
+
+class ServerMetrics:
+    """Process-wide metrics for the S2S server, rendered in Prometheus text format.
+
+    Hot-path instrumentation only touches plain dicts and lists: counting an
+    event is one dict lookup and two integer additions, and no lock is taken
+    since everything runs on the event loop. Rates (events or bytes per second)
+    come from Prometheus `rate()` over the counters. Values that already live
+    elsewhere, like session counts and queue depths, are registered with
+    `add_gauge` and only read when /metrics is scraped.
+    """
+
+    def __init__(self):
+        # (direction, event type) -> [events, bytes]
+        self.events = {}
+        # Tool name -> Histogram
+        self.tool_latency = {}
+        self.time_to_first_audio = Histogram()
+        # Error class -> count
+        self.bedrock_errors = {}
+        # (name, kind, help, fn) where fn() returns a number or {label tuple: number}
+        self._gauges = []
+        # Constant labels added to every sample, e.g. the worker index
+        self.labels = ()
+        self.started = time.time()
+
+    def count_event(self, direction, event_type, size):
+        """Count one event of `size` bytes sent to ("outbound") or received from ("inbound") Bedrock."""
+        counter = self.events.get((direction, event_type))
+        if counter is None:
+            counter = self.events[(direction, event_type)] = [0, 0]
+        counter[0] += 1
+        counter[1] += size
+
+    def observe_tool_latency(self, tool_name, seconds):
+        """Record how long a tool call took."""
+        histogram = self.tool_latency.get(tool_name)
+        if histogram is None:
+            histogram = self.tool_latency[tool_name] = Histogram()
+        histogram.observe(seconds)
+
+    def count_bedrock_error(self, error_class):
+        """Count a Bedrock stream error by class name."""
+        self.bedrock_errors[error_class] = self.bedrock_errors.get(error_class, 0) + 1
+
+    def add_gauge(self, name, help_text, fn, kind="gauge"):
+        """Register a gauge (or a counter kept elsewhere, with kind="counter") read from fn() at scrape time."""
+        self._gauges.append((name, kind, help_text, fn))
+
+    def _families(self):
+        yield "s2s_events_total", "counter", "Events exchanged with Bedrock", [
+            ("s2s_events_total", (("direction", direction), ("type", event_type)), counter[0])
+            for (direction, event_type), counter in self.events.items()]
+        yield "s2s_event_bytes_total", "counter", "Bytes of events exchanged with Bedrock", [
+            ("s2s_event_bytes_total", (("direction", direction), ("type", event_type)), counter[1])
+            for (direction, event_type), counter in self.events.items()]
+        yield "s2s_time_to_first_audio_seconds", "histogram", \
+            "Time from the start of a user turn to the first assistant audio", \
+            list(self.time_to_first_audio.samples("s2s_time_to_first_audio_seconds", ()))
+        yield "s2s_tool_latency_seconds", "histogram", "Tool call duration", [
+            sample for tool_name, histogram in self.tool_latency.items()
+            for sample in histogram.samples("s2s_tool_latency_seconds", (("tool", tool_name),))]
+        yield "s2s_bedrock_errors_total", "counter", "Bedrock stream errors by class", [
+            ("s2s_bedrock_errors_total", (("class", error_class),), count)
+            for error_class, count in self.bedrock_errors.items()]
+        for name, kind, help_text, fn in self._gauges:
+            value = fn()
+            if isinstance(value, dict):
+                samples = [(name, labels, sample) for labels, sample in value.items()]
+            else:
+                samples = [(name, (), value)]
+            yield name, kind, help_text, samples
+        yield "s2s_process_start_time_seconds", "gauge", "Start time of the process since the epoch", [
+            ("s2s_process_start_time_seconds", (), self.started)]
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        lines = []
+        for family, kind, help_text, samples in self._families():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(self.labels + tuple(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = ServerMetrics()
@@ -0,0 +1,150 @@
+import asyncio
+import json
+from collections import namedtuple
+from event_decoder import EventDecoder
+
+# An output event as received from Bedrock: event name (None if unrecognised), original bytes, ms since epoch
+OutputEvent = namedtuple("OutputEvent", "name raw timestamp")
+
+CONTENT_ID_KEY = b'"contentId"'
+
+
+def content_id(raw):
+    """contentId of a raw event, found without parsing it."""
+    key = raw.find(CONTENT_ID_KEY)
+    if key < 0:
+        return None
+    # Opening quote of the value, after the colon and any whitespace
+    start = raw.find(b'"', key + len(CONTENT_ID_KEY)) + 1
+    return raw[start:raw.find(b'"', start)]
+
+
+def envelope(raw, timestamp):
+    """The event with a "timestamp" field spliced in before its closing brace, without re-serializing it."""
+    raw = raw.rstrip()
+    return b''.join((raw[:-1], b',"timestamp":', str(timestamp).encode(), b'}'))
+
+
+class OutputForwarder:
+    """Forwards Bedrock output events to a WebSocket client without decoding and re-encoding them.
+
+    JSON events go out as the original bytes with the timestamp spliced in.
+    Consecutive audioOutput events of one content block that are already queued
+    (or arrive within `coalesce_ms`) are merged into one message of at most
+    `coalesce_bytes`: a single PCM frame for binary clients, a JSON array of the
+    events for JSON clients that opted in. With `drop_speculative`, SPECULATIVE
+    text blocks are dropped and only their FINAL repeat is forwarded.
+    """
+
+    def __init__(self, websocket, binary_audio=None, coalesce_audio=False, coalesce_ms=0, coalesce_bytes=32768,
+                 drop_speculative=False):
+        self.websocket = websocket
+        self.binary_audio = binary_audio
+        self.coalesce_audio = coalesce_audio
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.coalesce_bytes = coalesce_bytes
+        self.drop_speculative = drop_speculative
+        self.decoder = EventDecoder()
+        self._speculative_ids = set()
+        self._carry = None
+
+        # Counters
+        self.events = 0
+        self.messages = 0
+        self.audio_events_coalesced = 0
+        self.dropped_speculative = 0
+
+    async def run(self, output_queue):
+        """Forward events from the queue until cancelled."""
+        while True:
+            event = self._carry or await output_queue.get()
+            self._carry = None
+            self.events += 1
+
+            if event.name == 'audioOutput':
+                batch = [event]
+                if self.coalesce_audio:
+                    await self._collect_audio(output_queue, batch)
+                await self._send_audio(batch)
+            elif not (self.drop_speculative and self._is_speculative(event)):
+                await self._send_event(event)
+
+    async def _collect_audio(self, output_queue, batch):
+        """Add queued audioOutput events of the same content block to the batch, within the size/time budget."""
+        block = content_id(batch[0].raw)
+        size = len(batch[0].raw)
+        deadline = asyncio.get_running_loop().time() + self.coalesce_seconds
+        while size < self.coalesce_bytes:
+            try:
+                event = output_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return
+                try:
+                    event = await asyncio.wait_for(output_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return
+            if event.name != 'audioOutput' or content_id(event.raw) != block:
+                # Goes out after this batch
+                self._carry = event
+                return
+            self.events += 1
+            self.audio_events_coalesced += 1
+            batch.append(event)
+            size += len(event.raw)
+
+    async def _send_audio(self, batch):
+        if self.binary_audio:
+            pcm = [self.decoder.decode_audio(event.raw) for event in batch]
+            if None not in pcm:
+                frame = self.binary_audio.encode_output_pcm(content_id(batch[0].raw).decode(), b''.join(pcm))
+                if frame is not None:
+                    self.messages += 1
+                    await self.websocket.send(frame)
+                    return
+        if len(batch) == 1:
+            await self._send_event(batch[0])
+            return
+        self.messages += 1
+        await self.websocket.send(b'[' + b','.join(envelope(event.raw, event.timestamp) for event in batch) + b']',
+                                  text=True)
+
+    async def _send_event(self, event):
+        if event.name is None:
+            message = json.dumps({"raw_data": event.raw.decode('utf-8', errors='replace')}).encode()
+        else:
+            if self.binary_audio and event.name == 'contentStart' and b'AUDIO' in event.raw:
+                content_start = json.loads(event.raw)['event']['contentStart']
+                if content_start.get('type') == 'AUDIO':
+                    self.binary_audio.register_output(content_start)
+            message = envelope(event.raw, event.timestamp)
+        self.messages += 1
+        await self.websocket.send(message, text=True)
+
+    def _is_speculative(self, event):
+        """True for the contentStart, textOutput and contentEnd events of a SPECULATIVE text block."""
+        if event.name == 'contentStart':
+            if b'SPECULATIVE' in event.raw:
+                self._speculative_ids.add(content_id(event.raw))
+                self.dropped_speculative += 1
+                return True
+            return False
+        if event.name in ('textOutput', 'contentEnd') and self._speculative_ids:
+            block = content_id(event.raw)
+            # Barge-in markers are always forwarded
+            if block in self._speculative_ids and b'interrupted' not in event.raw:
+                if event.name == 'contentEnd':
+                    self._speculative_ids.discard(block)
+                self.dropped_speculative += 1
+                return True
+        return False
+
+    def stats(self):
+        """Return the forwarding counters."""
+        return {
+            "events": self.events,
+            "messages": self.messages,
+            "audio_events_coalesced": self.audio_events_coalesced,
+            "dropped_speculative": self.dropped_speculative,
+        }
@@ -3,7 +3,12 @@ import json
 import base64
 import warnings
 import uuid
-from s2s_events import S2sEvent
+from event_encoder import EventEncoder
+from output_forwarder import OutputEvent, content_id
+from bounded_queues import AudioInputQueue, OutputQueue, OverloadBreaker
+from metrics import METRICS
+from tool_runner import ToolRunner
+from flight_recorder import OUTBOUND, INBOUND
 import bedrock_knowledge_bases as kb
 import time
 from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
@@ -25,15 +30,40 @@ def debug_print(message):
 
 class S2sSessionManager:
     """Manages bidirectional streaming with AWS Bedrock using asyncio"""
+
+    # Per-tool timeouts in seconds; other tools use the ToolRunner default
+    TOOL_TIMEOUTS = {
+        "getDateTool": 2.0,
+        "getKbTool": 8.0,
+        "locationMcpTool": 20.0,
+    }
+
+    # Queue bounds: events/chunks queued per direction, how long a control event may
+    # wait for space, and how long the queues may stay over budget before the session ends
+    OUTPUT_QUEUE_SIZE = 256
+    AUDIO_INPUT_QUEUE_SIZE = 64
+    CONTROL_PUT_TIMEOUT = 2.0
+    OVERLOAD_BUDGET_SECONDS = 10.0
     
-    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', mcp_client=None, strands_agent=None):
+    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', mcp_client=None, strands_agent=None, recorder=None):
         """Initialize the stream manager."""
         self.model_id = model_id
         self.region = region
         
-        # Audio and output queues
-        self.audio_input_queue = asyncio.Queue()
-        self.output_queue = asyncio.Queue()
+        # Audio and output queues, bounded; a session that keeps them over budget is ended
+        self.breaker = OverloadBreaker(self.OVERLOAD_BUDGET_SECONDS, self._overloaded)
+        self.audio_input_queue = AudioInputQueue(self.AUDIO_INPUT_QUEUE_SIZE, breaker=self.breaker)
+        self.output_queue = OutputQueue(self.OUTPUT_QUEUE_SIZE, self.CONTROL_PUT_TIMEOUT, breaker=self.breaker)
+        # Called when the breaker ends the session, e.g. to close the client connection
+        self.on_overload = None
+        # Barge-in: contentId of the assistant audio block being generated, and whether it was interrupted
+        self.audio_output_content_id = None
+        self.barge_in_active = False
+        self.barge_ins = 0
+        self.purged_audio = 0
+        self.suppressed_audio = 0
+        # Start of the current user turn, for the time-to-first-audio metric
+        self.turn_started = None
         
         self.response_task = None
         self.stream = None
@@ -49,6 +79,14 @@ class S2sSessionManager:
         self.toolName = ""
         self.mcp_loc_client = mcp_client
         self.strands_agent = strands_agent
+        # toolUse events waiting for their contentEnd, keyed by contentId
+        self.pending_tool_uses = {}
+        # Tools run outside the response loop so events keep being forwarded while they execute
+        self.tool_runner = ToolRunner(self.processToolUse, self._send_tool_result, timeouts=self.TOOL_TIMEOUTS)
+        # Optional FlightRecorder capturing every event sent and received
+        self.recorder = recorder
+        # Pre-serialized audioInput and tool result frames
+        self.encoder = EventEncoder()
 
     def _initialize_client(self):
         """Initialize the Bedrock client."""
@@ -84,9 +122,6 @@ class S2sSessionManager:
             # Start processing audio input
             asyncio.create_task(self._process_audio_input())
             
-            # Wait a bit to ensure everything is set up
-            await asyncio.sleep(0.1)
-            
             debug_print("Stream initialized successfully")
             return self
         except Exception as e:
@@ -96,24 +131,32 @@ class S2sSessionManager:
     
     async def send_raw_event(self, event_data):
         try:
-            """Send a raw event to the Bedrock stream."""
+            """Send a raw event to the Bedrock stream (an event dict, or bytes already built by EventEncoder)."""
             if not self.stream or not self.is_active:
                 debug_print("Stream not initialized or closed")
                 return
             
-            event_json = json.dumps(event_data)
-            #if "audioInput" not in event_data["event"]:
-            #    print(event_json)
+            if isinstance(event_data, bytes):
+                event_bytes = event_data
+                event_name = EventEncoder.event_name(event_data)
+            else:
+                event_bytes = EventEncoder.encode(event_data)
+                event_name = next(iter(event_data["event"]))
             event = InvokeModelWithBidirectionalStreamInputChunk(
-                value=BidirectionalInputPayloadPart(bytes_=event_json.encode('utf-8'))
+                value=BidirectionalInputPayloadPart(bytes_=event_bytes)
             )
             await self.stream.input_stream.send(event)
+            METRICS.count_event("outbound", event_name, len(event_bytes))
+            # Audio is recorded as raw PCM when it arrives, see add_audio_chunk
+            if self.recorder and event_name != "audioInput":
+                self.recorder.record_event(OUTBOUND, event_bytes)
 
             # Close session
-            if "sessionEnd" in event_data["event"]:
+            if event_name == "sessionEnd":
                 self.close()
             
         except Exception as e:
+            METRICS.count_bedrock_error(type(e).__name__)
             debug_print(f"Error sending event: {str(e)}")
     
     async def _process_audio_input(self):
@@ -127,13 +170,18 @@ class S2sSessionManager:
                 prompt_name = data.get('prompt_name')
                 content_name = data.get('content_name')
                 audio_bytes = data.get('audio_bytes')
+                pcm = data.get('pcm')
                 
-                if not audio_bytes or not prompt_name or not content_name:
+                if not (audio_bytes or pcm) or not prompt_name or not content_name:
                     debug_print("Missing required audio data properties")
                     continue
 
-                # Create the audio input event
-                audio_event = S2sEvent.audio_input(prompt_name, content_name, audio_bytes.decode('utf-8') if isinstance(audio_bytes, bytes) else audio_bytes)
+                if pcm is not None:
+                    # Raw PCM from a binary frame is base64 encoded straight into the event
+                    audio_event = self.encoder.audio_input(prompt_name, content_name, pcm)
+                else:
+                    # Create the audio input event; the frontend's base64 goes straight into the frame
+                    audio_event = self.encoder.audio_input_base64(prompt_name, content_name, audio_bytes)
                 
                 # Send the event
                 await self.send_raw_event(audio_event)
@@ -149,11 +197,23 @@ class S2sSessionManager:
     def add_audio_chunk(self, prompt_name, content_name, audio_data):
         """Add an audio chunk to the queue."""
         # The audio_data is already a base64 string from the frontend
+        if self.recorder:
+            self.recorder.record_audio_base64(audio_data)
         self.audio_input_queue.put_nowait({
             'prompt_name': prompt_name,
             'content_name': content_name,
             'audio_bytes': audio_data
         })
+
+    def add_audio_pcm(self, prompt_name, content_name, pcm):
+        """Add a raw PCM chunk (from a binary WebSocket frame) to the queue."""
+        if self.recorder:
+            self.recorder.record_audio(pcm)
+        self.audio_input_queue.put_nowait({
+            'prompt_name': prompt_name,
+            'content_name': content_name,
+            'pcm': pcm
+        })
     
     async def _process_responses(self):
         """Process incoming responses from Bedrock."""
@@ -163,77 +223,126 @@ class S2sSessionManager:
                 result = await output[1].receive()
                 
                 if result.value and result.value.bytes_:
-                    response_data = result.value.bytes_.decode('utf-8')
-                    
-                    json_data = json.loads(response_data)
-                    json_data["timestamp"] = int(time.time() * 1000)  # Milliseconds since epoch
-                    
-                    event_name = None
-                    if 'event' in json_data:
-                        event_name = list(json_data["event"].keys())[0]
-                        # if event_name == "audioOutput":
-                        #     print(json_data)
+                    raw = result.value.bytes_
+                    if self.recorder:
+                        self.recorder.record_event(INBOUND, raw)
+                    timestamp = int(time.time() * 1000)  # Milliseconds since epoch
+
+                    # Only the event name is read; the bytes are forwarded to the frontend untouched
+                    try:
+                        event_name = EventEncoder.event_name(raw)
+                    except (ValueError, KeyError, StopIteration):
+                        event_name = None
+                    METRICS.count_event("inbound", event_name, len(raw))
+
+                    # Time to first audio: from the user's transcript block to the next assistant audio
+                    if event_name == 'audioOutput':
+                        if self.turn_started is not None:
+                            METRICS.time_to_first_audio.observe(time.monotonic() - self.turn_started)
+                            self.turn_started = None
+                    elif event_name == 'contentStart' and self.turn_started is None and b'"USER"' in raw:
+                        self.turn_started = time.monotonic()
+
+                    # Drop audio for an interrupted block instead of sending it to a client that will discard it
+                    if event_name == 'audioOutput' and self.barge_in_active:
+                        self.suppressed_audio += 1
+                        continue
+                    if event_name == 'contentStart' and b'"AUDIO"' in raw:
+                        block = content_id(raw)
+                        self.audio_output_content_id = block.decode() if block else None
+                        self.barge_in_active = False
+                    elif event_name == 'textOutput' and b'interrupted' in raw and self._is_interruption(raw):
+                        await self._barge_in(timestamp)
+
+                    # Tool events are the only ones the server itself needs to parse
+                    if event_name == 'toolUse' or (event_name == 'contentEnd' and b'TOOL' in raw):
+                        json_data = json.loads(raw)
                         
                         # Handle tool use detection
                         if event_name == 'toolUse':
                             self.toolUseContent = json_data['event']['toolUse']
                             self.toolName = json_data['event']['toolUse']['toolName']
                             self.toolUseId = json_data['event']['toolUse']['toolUseId']
+                            self.pending_tool_uses[self.toolUseContent.get('contentId')] = self.toolUseContent
                             debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}, "+ json.dumps(json_data['event']))
 
-                        # Process tool use when content ends
+                        # Process tool use when content ends, in the background
                         elif event_name == 'contentEnd' and json_data['event'][event_name].get('type') == 'TOOL':
-                            prompt_name = json_data['event']['contentEnd'].get("promptName")
-                            debug_print("Processing tool use and sending result")
-                            toolResult = await self.processToolUse(self.toolName, self.toolUseContent)
-                                
-                            # Send tool start event
-                            toolContent = str(uuid.uuid4())
-                            tool_start_event = S2sEvent.content_start_tool(prompt_name, toolContent, self.toolUseId)
-                            await self.send_raw_event(tool_start_event)
-                            
-                            # Send tool result event
-                            if isinstance(toolResult, dict):
-                                content_json_string = json.dumps(toolResult)
-                            else:
-                                content_json_string = toolResult
-
-                            tool_result_event = S2sEvent.text_input_tool(prompt_name, toolContent, content_json_string)
-                            print("Tool result", tool_result_event)
-                            await self.send_raw_event(tool_result_event)
-
-                            # Send tool content end event
-                            tool_content_end_event = S2sEvent.content_end(prompt_name, toolContent)
-                            await self.send_raw_event(tool_content_end_event)
+                            tool_content_id = json_data['event']['contentEnd'].get('contentId')
+                            tool_use = self.pending_tool_uses.pop(tool_content_id, None) or self.toolUseContent
+                            debug_print(f"Running tool {tool_use['toolName']} ({tool_use['toolUseId']}) in the background")
+                            self.tool_runner.submit(tool_use['toolUseId'], tool_use['toolName'], tool_use)
                     
                     # Put the response in the output queue for forwarding to the frontend
-                    await self.output_queue.put(json_data)
-
+                    await self.output_queue.put(OutputEvent(event_name, raw, timestamp))
 
             except json.JSONDecodeError as ex:
+                METRICS.count_bedrock_error(type(ex).__name__)
                 print(ex)
-                await self.output_queue.put({"raw_data": response_data})
             except StopAsyncIteration as ex:
                 # Stream has ended
                 print(ex)
             except Exception as e:
                 # Handle ValidationException properly
                 if "ValidationException" in str(e):
+                    METRICS.count_bedrock_error("ValidationException")
                     error_message = str(e)
                     print(f"Validation error: {error_message}")
                 else:
+                    METRICS.count_bedrock_error(type(e).__name__)
                     print(f"Error receiving response: {e}")
                 break
 
         self.is_active = False
         self.close()
 
+    @staticmethod
+    def _is_interruption(raw):
+        """True for the textOutput Sonic sends when the user barges in: { "interrupted" : true }."""
+        try:
+            content = json.loads(raw)['event']['textOutput']['content']
+            return content.startswith('{') and json.loads(content).get('interrupted') is True
+        except (ValueError, KeyError, AttributeError):
+            return False
+
+    async def _barge_in(self, timestamp):
+        """Purge queued assistant audio, suppress the rest of the block and tell the client."""
+        purged = self.output_queue.purge(lambda event: event.name == 'audioOutput')
+        self.barge_in_active = True
+        self.barge_ins += 1
+        self.purged_audio += purged
+        debug_print(f"Barge-in: purged {purged} queued audioOutput events")
+        await self.output_queue.put(OutputEvent('bargeIn', EventEncoder.encode({"event": {"bargeIn": {
+            "promptName": self.prompt_name,
+            "contentId": self.audio_output_content_id,
+            "purgedEvents": purged,
+        }}}), timestamp))
+
+    async def _send_tool_result(self, tool_use_id, toolResult):
+        """Send a finished tool result back to Bedrock, tagged with its toolUseId."""
+        prompt_name = self.prompt_name
+
+        # Send tool start event
+        toolContent = str(uuid.uuid4())
+        tool_start_event = self.encoder.content_start_tool(prompt_name, toolContent, tool_use_id)
+        await self.send_raw_event(tool_start_event)
+
+        # Send tool result event
+        tool_result_event = self.encoder.tool_result(prompt_name, toolContent, toolResult)
+        print("Tool result", tool_result_event.decode("utf-8"))
+        await self.send_raw_event(tool_result_event)
+
+        # Send tool content end event
+        tool_content_end_event = self.encoder.content_end(prompt_name, toolContent)
+        await self.send_raw_event(tool_content_end_event)
+
     async def processToolUse(self, toolName, toolUseContent):
         """Return the tool result"""
         print(f"Tool Use Content: {toolUseContent}")
 
         toolName = toolName.lower()
         content, result = None, None
+        started = time.monotonic()
         try:
             if toolUseContent.get("content"):
                 # Parse the JSON string in the content field
@@ -245,7 +354,8 @@ class S2sSessionManager:
             if toolName == "getkbtool":
                 if not content:
                     content = "amazon community policy"
-                result = kb.retrieve_kb(content)
+                # Runs off the event loop; identical in-flight queries share one request
+                result = await kb.retriever.retrieve(content)
                 
             if toolName == "getdatetool":
                 from datetime import datetime, timezone
@@ -264,6 +374,26 @@ class S2sSessionManager:
         except Exception as ex:
             print(ex)
             return {"result": "An error occurred while attempting to retrieve information related to the toolUse event."}
+        finally:
+            # Also runs when the ToolRunner cancels the call at its timeout
+            METRICS.observe_tool_latency(toolName, time.monotonic() - started)
+    
+    def _overloaded(self):
+        print(f"Ending session over its queue budget: {self.queue_stats()}")
+        if self.on_overload:
+            self.on_overload()
+        else:
+            asyncio.get_running_loop().create_task(self.close())
+
+    def queue_stats(self):
+        """Return depth, wait time and overflow counters for both queues."""
+        return {
+            "audio_input": self.audio_input_queue.stats(),
+            "output": self.output_queue.stats(),
+            "breaker": self.breaker.stats(),
+            "barge_in": {"count": self.barge_ins, "purged_audio": self.purged_audio,
+                         "suppressed_audio": self.suppressed_audio},
+        }
     
     async def close(self):
         """Close the stream properly."""
@@ -271,6 +401,9 @@ class S2sSessionManager:
             return
             
         self.is_active = False
+
+        # Abandon tool calls that are still running
+        await self.tool_runner.shutdown()
         
         if self.stream:
             await self.stream.input_stream.close()
@@ -0,0 +1,130 @@
+import json
+import re
+import time
+import zlib
+import numpy as np
+
+_WORDS = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Deterministic local embedder: hashed word and character trigram features.
+
+    Needs no model or network, gives the same vector for the same text in every
+    process, and scores rephrasings that share most of their words close
+    together. A stand-in for tests and local runs; it matches wording, not
+    meaning.
+    """
+
+    # Cheap enough to run on the event loop
+    blocking = False
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def embed(self, text):
+        """Unit-length float32 vector for text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = _WORDS.findall(text.casefold())
+        for word in words:
+            vector[zlib.crc32(word.encode()) % self.dim] += 2.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode()) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class BedrockEmbedder:
+    """Embeds text with a Bedrock embedding model (Titan Text Embeddings V2 by default)."""
+
+    # Makes a network call; run it off the event loop
+    blocking = True
+
+    def __init__(self, client, model_id="amazon.titan-embed-text-v2:0", dim=256):
+        self.client = client
+        self.model_id = model_id
+        self.dim = dim
+
+    def embed(self, text):
+        """Unit-length float32 vector for text."""
+        response = self.client.invoke_model(modelId=self.model_id, body=json.dumps(
+            {"inputText": text, "dimensions": self.dim, "normalize": True}))
+        vector = np.asarray(json.loads(response["body"].read())["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Retrieval results keyed by query embedding, matched by cosine similarity.
+
+    Embeddings are unit vectors kept in one preallocated (max_entries, dim)
+    matrix, so a lookup is a single matrix-vector product and an argmax. A
+    lookup hits when the closest stored query scores at least `threshold` and
+    its entry is younger than `ttl` seconds; expired rows never match. When
+    the matrix is full, an expired row or else the least recently used one
+    is overwritten. Every entry remembers how long
+    its retrieval took, which is the latency a hit on it saves.
+    """
+
+    def __init__(self, dim, threshold=0.9, max_entries=512, ttl=600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._last_used = np.zeros(max_entries)
+        self._expires = np.zeros(max_entries)
+        # Per row: (result, retrieval seconds)
+        self._entries = [None] * max_entries
+        self._size = 0
+
+        # Counters
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.latency_saved = 0.0
+
+    def lookup(self, vector):
+        """Cached result for the most similar stored query, or None."""
+        self.lookups += 1
+        if not self._size:
+            return None
+        now = time.monotonic()
+        scores = self._vectors[:self._size] @ vector
+        # Expired rows must not shadow a live match that scores lower
+        scores[self._expires[:self._size] <= now] = -np.inf
+        row = int(np.argmax(scores))
+        if scores[row] < self.threshold:
+            return None
+        self._last_used[row] = now
+        result, seconds = self._entries[row]
+        self.hits += 1
+        self.latency_saved += seconds
+        return result
+
+    def store(self, vector, result, seconds):
+        """Add a retrieval result for a query embedding that took `seconds` to retrieve."""
+        now = time.monotonic()
+        if self._size < self.max_entries:
+            row = self._size
+            self._size += 1
+        else:
+            # Expired rows sort first, so they are reused before a live entry is evicted
+            row = int(np.argmin(np.where(self._expires > now, self._last_used, -np.inf)))
+            if self._expires[row] > now:
+                self.evictions += 1
+        self._vectors[row] = vector
+        self._last_used[row] = now
+        self._expires[row] = now + self.ttl
+        self._entries[row] = (result, seconds)
+
+    def stats(self):
+        """Return the hit rate, latency saved and occupancy."""
+        return {
+            "entries": self._size,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "evictions": self.evictions,
+        }
@@ -8,9 +8,19 @@ import argparse
 import http.server
 import threading
 import os
+import uuid
 from http import HTTPStatus
+from urllib.parse import urlparse, parse_qs
 from mcp_client import McpLocationClient
 from strands_agent import StrandsAgent
+from flight_recorder import FlightRecorder
+from binary_audio import BinaryAudioChannel, BINARY_SUBPROTOCOL
+from output_forwarder import OutputForwarder
+from stream_pool import StreamPool
+from worker_pool import WorkerStatus, Supervisor
+from admission import AdmissionController
+from metrics import METRICS
+import bedrock_knowledge_bases as kb
 
 # Configure logging
 LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
@@ -29,6 +39,22 @@ def debug_print(message):
 
 MCP_CLIENT = None
 STRANDS_AGENT = None
+# When set, each session is recorded to a flight recorder log in this directory
+RECORD_DIR = None
+# Output audio coalescing budget: how long to wait for more audioOutput events, and the batch size cap
+AUDIO_COALESCE_MS = 0
+AUDIO_COALESCE_BYTES = 32768
+# Pre-initialized Bedrock streams waiting for new connections, see --warm-pool
+STREAM_POOL = None
+# Per-worker session cap (0: unlimited) and the shared status the health check reads
+MAX_SESSIONS = 0
+WORKER_STATUS = None
+# Admission thresholds besides MAX_SESSIONS, see AdmissionController; 0 disables a check
+MAX_LOOP_LAG_MS = 200
+MAX_OUTPUT_FILL = 0.8
+ADMISSION_QUEUE = 8
+ADMISSION_MAX_WAIT = 15.0
+ADMISSION = None
 
 class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
@@ -38,11 +64,18 @@ class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
         )
 
         if self.path == "/health" or self.path == "/":
-            logger.info(f"Responding with 200 OK to health check from {client_ip}")
-            self.send_response(HTTPStatus.OK)
+            # Unhealthy when no worker is alive or every worker is at its session cap
+            healthy, status = WORKER_STATUS.health() if WORKER_STATUS else (True, {"status": "healthy"})
+            code = HTTPStatus.OK if healthy else HTTPStatus.SERVICE_UNAVAILABLE
+            logger.info(f"Responding with {code.value} to health check from {client_ip}")
+            self.send_response(code)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
-            response = json.dumps({"status": "healthy"})
+            if STREAM_POOL:
+                status["stream_pool"] = STREAM_POOL.stats()
+            if ADMISSION:
+                status["admission"] = ADMISSION.stats()
+            response = json.dumps(status)
             self.wfile.write(response.encode("utf-8"))
             logger.info(f"Health check response sent: {response}")
         else:
@@ -96,11 +129,96 @@ def start_health_check_server(health_host, health_port):
         logger.error(f"Failed to start health check server: {e}", exc_info=True)
 
 
+def process_request(connection, request):
+    """Answer GET /metrics with Prometheus metrics; any other path continues as a WebSocket handshake."""
+    if request.path == "/metrics":
+        return connection.respond(HTTPStatus.OK, METRICS.render())
+
+
+def register_metrics():
+    """Gauges read from the server's state when /metrics is scraped."""
+    METRICS.add_gauge("s2s_active_sessions", "Admitted voice sessions", lambda: ADMISSION.active)
+    METRICS.add_gauge("s2s_waiting_sessions", "Sessions waiting for admission", lambda: ADMISSION.waiting)
+    METRICS.add_gauge("s2s_event_loop_lag_seconds", "Event loop lag at the last sample", lambda: ADMISSION.loop_lag)
+    METRICS.add_gauge("s2s_queue_depth", "Items queued across all sessions", lambda: {
+        (("queue", "output"),): sum(m.output_queue.qsize() for m in ADMISSION.session_managers()),
+        (("queue", "audio_input"),): sum(m.audio_input_queue.qsize() for m in ADMISSION.session_managers()),
+    })
+    METRICS.add_gauge("s2s_queue_max_depth", "Items queued in the fullest session queue", lambda: {
+        (("queue", "output"),): max((m.output_queue.qsize() for m in ADMISSION.session_managers()), default=0),
+        (("queue", "audio_input"),): max((m.audio_input_queue.qsize() for m in ADMISSION.session_managers()), default=0),
+    })
+    METRICS.add_gauge("s2s_admission_decisions_total", "Admission outcomes for new sessions", lambda: {
+        (("outcome", "admitted"), ("reason", "")): ADMISSION.admitted,
+        (("outcome", "queued"), ("reason", "")): ADMISSION.queued,
+        **{(("outcome", "rejected"), ("reason", reason)): count for reason, count in ADMISSION.rejected.items()},
+    }, kind="counter")
+    METRICS.add_gauge("s2s_admission_threshold", "Configured admission thresholds (0: check disabled)", lambda: {
+        (("threshold", "max_sessions"),): ADMISSION.max_sessions,
+        (("threshold", "max_loop_lag_seconds"),): ADMISSION.max_loop_lag,
+        (("threshold", "max_output_fill"),): ADMISSION.max_output_fill,
+        (("threshold", "max_queue"),): ADMISSION.max_queue,
+        (("threshold", "max_wait_seconds"),): ADMISSION.max_wait,
+    })
+    METRICS.add_gauge("s2s_kb_retrievals_total", "Knowledge Base lookups by how they were answered", lambda: {
+        (("result", name),): kb.retriever.stats()[name]
+        for name in ("requests", "cache_hits", "coalesced", "timeouts", "errors", "rejected")
+    }, kind="counter")
+    if kb.retriever.semantic_cache:
+        cache = kb.retriever.semantic_cache
+        METRICS.add_gauge("s2s_kb_semantic_cache_lookups_total", "Semantic cache lookups by result", lambda: {
+            (("result", "hit"),): cache.hits,
+            (("result", "miss"),): cache.lookups - cache.hits,
+        }, kind="counter")
+        METRICS.add_gauge("s2s_kb_semantic_cache_latency_saved_seconds_total",
+                          "Retrieval time of the cached results served by the semantic cache",
+                          lambda: cache.latency_saved, kind="counter")
+    if STREAM_POOL:
+        METRICS.add_gauge("s2s_stream_pool_idle", "Pre-initialized Bedrock streams waiting", lambda: STREAM_POOL.stats()["idle"])
+        METRICS.add_gauge("s2s_stream_pool_acquired_total", "Sessions that took a stream from the pool", lambda: {
+            (("result", "hit"),): STREAM_POOL.hits,
+            (("result", "miss"),): STREAM_POOL.misses,
+        }, kind="counter")
+
+
+async def notify_queued(websocket, position, estimated_wait):
+    """Tell a waiting client where it is in the admission queue."""
+    await websocket.send(json.dumps({"event": {"admissionQueued": {
+        "position": position, "estimatedWaitSeconds": estimated_wait}}}))
+
+
 async def websocket_handler(websocket):
+    # Start a session only if this process can serve it; otherwise wait in line or get turned away
+    try:
+        admitted, reason = await ADMISSION.admit(
+            websocket, lambda position, wait: notify_queued(websocket, position, wait))
+    except websockets.exceptions.ConnectionClosed:
+        return
+    if not admitted:
+        # 1013 (try again later) tells the client to retry, which may land on another worker
+        logger.info(f"Session rejected: {reason}")
+        await websocket.close(1013, f"Server busy ({reason})")
+        return
     stream_manager = None
+    # Clients that negotiated the binary subprotocol send and receive audio as raw PCM frames
+    binary_audio = BinaryAudioChannel() if websocket.subprotocol == BINARY_SUBPROTOCOL else None
+    # Output options the client opts in to on the connection URL, e.g. ws://host:port/?coalesce=1&dropSpeculative=1
+    options = parse_qs(urlparse(websocket.request.path).query)
+    forwarder = OutputForwarder(websocket, binary_audio,
+                                coalesce_audio=binary_audio is not None or options.get('coalesce') == ['1'],
+                                coalesce_ms=AUDIO_COALESCE_MS, coalesce_bytes=AUDIO_COALESCE_BYTES,
+                                drop_speculative=options.get('dropSpeculative') == ['1'])
     try:
         async for message in websocket:
             try:
+                if isinstance(message, bytes):
+                    if binary_audio is None or stream_manager is None:
+                        print("Unexpected binary WebSocket message")
+                        continue
+                    prompt_name, content_name, pcm = binary_audio.decode_input(message)
+                    stream_manager.add_audio_pcm(prompt_name, content_name, pcm)
+                    continue
+
                 data = json.loads(message)
                 if 'body' in data:
                     data = json.loads(data["body"])
@@ -109,19 +227,31 @@ async def websocket_handler(websocket):
 
                         """Handle WebSocket connections from the frontend."""
                         # Create a new stream manager for this connection
-                        stream_manager = S2sSessionManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1', mcp_client=MCP_CLIENT, strands_agent=STRANDS_AGENT)
+                        recorder = FlightRecorder(os.path.join(RECORD_DIR, f"session-{uuid.uuid4()}.sfr")) if RECORD_DIR else None
+                        if STREAM_POOL:
+                            # Take a stream that has already done the Bedrock handshake
+                            stream_manager = await STREAM_POOL.acquire()
+                            stream_manager.recorder = recorder
+                        else:
+                            stream_manager = create_session_manager(recorder)
+                            
+                            # Initialize the Bedrock stream
+                            await stream_manager.initialize_stream()
                         
-                        # Initialize the Bedrock stream
-                        await stream_manager.initialize_stream()
+                        ADMISSION.attach(websocket, stream_manager)
+
+                        # Close the connection with 1013 (try again later) if the session's queues stay over budget
+                        stream_manager.on_overload = lambda: asyncio.create_task(
+                            websocket.close(1013, "Session exceeded its queue budget"))
                         
                         # Start a task to forward responses from Bedrock to the WebSocket
-                        forward_task = asyncio.create_task(forward_responses(websocket, stream_manager))
+                        forward_task = asyncio.create_task(forward_responses(websocket, stream_manager, forwarder))
 
-                        event_type = list(data['event'].keys())[0]
-                        if event_type == "audioInput":
-                            debug_print(message[0:180])
-                        else:
-                            debug_print(message)
+                    event_type = list(data['event'].keys())[0]
+                    if event_type == "audioInput":
+                        debug_print(message[0:180])
+                    else:
+                        debug_print(message)
                             
                     if event_type:
                         # Store prompt name and content names if provided
@@ -129,6 +259,8 @@ async def websocket_handler(websocket):
                             stream_manager.prompt_name = data['event']['promptStart']['promptName']
                         elif event_type == 'contentStart' and data['event']['contentStart'].get('type') == 'AUDIO':
                             stream_manager.audio_content_name = data['event']['contentStart']['contentName']
+                            if binary_audio:
+                                binary_audio.register_input(data['event']['contentStart'])
                         
                         # Handle audio input separately
                         if event_type == 'audioInput':
@@ -152,28 +284,35 @@ async def websocket_handler(websocket):
     except websockets.exceptions.ConnectionClosed:
         print("WebSocket connection closed")
     finally:
+        ADMISSION.release(websocket)
         # Clean up
         await stream_manager.close()
         forward_task.cancel()
+        debug_print(f"Output forwarding stats: {forwarder.stats()}")
+        debug_print(f"Queue stats: {stream_manager.queue_stats()}")
+        if binary_audio:
+            debug_print(f"Binary audio stats: {binary_audio.stats()}")
+        if stream_manager.recorder:
+            # Joins the writer thread, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, stream_manager.recorder.close)
+            logger.info(f"Session recorded: {stream_manager.recorder.stats()}")
         if websocket:
             websocket.close()
         if MCP_CLIENT:
             MCP_CLIENT.cleanup()
 
 
-async def forward_responses(websocket, stream_manager):
+def create_session_manager(recorder=None):
+    """New, uninitialized session manager for one client connection."""
+    return S2sSessionManager(model_id='amazon.nova-sonic-v1:0', region='us-east-1', mcp_client=MCP_CLIENT, strands_agent=STRANDS_AGENT, recorder=recorder)
+
+
+async def forward_responses(websocket, stream_manager, forwarder):
     """Forward responses from Bedrock to the WebSocket."""
     try:
-        while True:
-            # Get next response from the output queue
-            response = await stream_manager.output_queue.get()
-            
-            # Send to WebSocket
-            try:
-                event = json.dumps(response)
-                await websocket.send(event)
-            except websockets.exceptions.ConnectionClosed:
-                break
+        await forwarder.run(stream_manager.output_queue)
+    except websockets.exceptions.ConnectionClosed:
+        pass
     except asyncio.CancelledError:
         # Task was cancelled
         pass
@@ -184,7 +323,27 @@ async def forward_responses(websocket, stream_manager):
         stream_manager.close()
 
 
-async def main(host, port, health_port, enable_mcp=False, enable_strands_agent=False):
+async def report_worker_status(worker_index, interval=1.0):
+    """Publish this worker's session count and event loop lag for the health check."""
+    loop = asyncio.get_running_loop()
+    WORKER_STATUS.update(worker_index, ADMISSION.active, 0.0)
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        # How late the loop woke us up is how long every session's events were waiting too
+        lag = max(0.0, loop.time() - start - interval)
+        ADMISSION.observe_loop_lag(lag)
+        WORKER_STATUS.update(worker_index, ADMISSION.active, lag)
+
+
+async def main(host, port, health_port, enable_mcp=False, enable_strands_agent=False, warm_pool_size=0, warm_pool_max_idle=30.0,
+               worker_index=0, reuse_port=False):
+
+    global WORKER_STATUS, ADMISSION
+    if WORKER_STATUS is None:
+        WORKER_STATUS = WorkerStatus(1, MAX_SESSIONS)
+    ADMISSION = AdmissionController(MAX_SESSIONS, MAX_LOOP_LAG_MS / 1000, MAX_OUTPUT_FILL, ADMISSION_QUEUE, ADMISSION_MAX_WAIT)
+    status_task = asyncio.create_task(report_worker_status(worker_index))
 
     if health_port:
         try:
@@ -211,16 +370,48 @@ async def main(host, port, health_port, enable_mcp=False, enable_strands_agent=F
         except Exception as ex:
             print("Failed to start MCP client",ex)
 
+    # Open Bedrock streams ahead of the first connections
+    if warm_pool_size:
+        global STREAM_POOL
+        STREAM_POOL = StreamPool(create_session_manager, size=warm_pool_size, max_idle=warm_pool_max_idle)
+        await STREAM_POOL.start()
+        print(f"Warm stream pool enabled, size {warm_pool_size}")
+
     """Main function to run the WebSocket server."""
     try:
         # Start WebSocket server
-        async with websockets.serve(websocket_handler, host, port):
+        # Clients may opt in to binary audio frames; everything else stays JSON
+        register_metrics()
+        if reuse_port:
+            METRICS.labels = (("worker", worker_index),)
+        # With reuse_port, every worker process listens on the same port and the kernel spreads connections
+        async with websockets.serve(websocket_handler, host, port, subprotocols=[BINARY_SUBPROTOCOL], reuse_port=reuse_port,
+                                    process_request=process_request):
             print(f"WebSocket server started at host:{host}, port:{port}")
             
             # Keep the server running forever
             await asyncio.Future()
     except Exception as ex:
         print("Failed to start websocket service",ex)
+    finally:
+        status_task.cancel()
+        if STREAM_POOL:
+            await STREAM_POOL.close()
+
+
+def run_worker(worker_index, status, settings, main_args):
+    """Entry point of a worker process in --workers mode."""
+    global WORKER_STATUS
+    # Module settings parsed by the supervisor, e.g. RECORD_DIR and MAX_SESSIONS
+    globals().update(settings)
+    WORKER_STATUS = status
+    try:
+        asyncio.run(main(*main_args, worker_index=worker_index, reuse_port=True))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if MCP_CLIENT:
+            MCP_CLIENT.cleanup()
 
 if __name__ == "__main__":
     import argparse
@@ -228,7 +419,39 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Nova S2S WebSocket Server')
     parser.add_argument('--agent', type=str, help='Agent intergation "mcp" or "strands".')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--record-dir', type=str, default=None,
+                        help='Record each session to a flight recorder log in this directory (see flight_recorder.py)')
+    parser.add_argument('--audio-coalesce-ms', type=int, default=0,
+                        help='Wait up to this long to merge output audio events into one message (default: only merge events already queued)')
+    parser.add_argument('--audio-coalesce-bytes', type=int, default=32768,
+                        help='Size cap for a merged output audio message')
+    parser.add_argument('--warm-pool', type=int, default=0,
+                        help='Keep this many Bedrock streams initialized ahead of new connections (default: 0, open on connect)')
+    parser.add_argument('--warm-pool-max-idle', type=float, default=30.0,
+                        help='Seconds a pre-initialized stream may wait for a connection before it is replaced')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Serve from this many processes sharing the WebSocket port (SO_REUSEPORT), restarted if they exit')
+    parser.add_argument('--max-sessions', type=int, default=0,
+                        help='Per-worker cap on concurrent sessions; extra connections wait or are closed with 1013 (default: no cap)')
+    parser.add_argument('--max-loop-lag-ms', type=float, default=200,
+                        help='Queue new sessions while event loop lag is above this (0: no check)')
+    parser.add_argument('--max-output-fill', type=float, default=0.8,
+                        help='Queue new sessions while any session output queue is fuller than this fraction (0: no check)')
+    parser.add_argument('--admission-queue', type=int, default=8,
+                        help='How many sessions may wait for admission before new ones are rejected with 1013')
+    parser.add_argument('--admission-max-wait', type=float, default=15.0,
+                        help='Seconds a session may wait for admission before it is rejected with 1013')
     args = parser.parse_args()
+    MAX_SESSIONS = args.max_sessions
+    MAX_LOOP_LAG_MS = args.max_loop_lag_ms
+    MAX_OUTPUT_FILL = args.max_output_fill
+    ADMISSION_QUEUE = args.admission_queue
+    ADMISSION_MAX_WAIT = args.admission_max_wait
+    AUDIO_COALESCE_MS = args.audio_coalesce_ms
+    AUDIO_COALESCE_BYTES = args.audio_coalesce_bytes
+    if args.record_dir:
+        os.makedirs(args.record_dir, exist_ok=True)
+        RECORD_DIR = args.record_dir
 
     host, port, health_port = None, None, None
     if os.getenv("HOST"):
@@ -243,9 +466,23 @@ if __name__ == "__main__":
 
     if not host or not port:
         print(f"HOST and PORT are required. Received HOST: {host}, PORT: {port}")
+    elif args.workers > 1:
+        # The supervisor serves the aggregated health check; the workers serve WebSockets
+        WORKER_STATUS = WorkerStatus(args.workers, MAX_SESSIONS)
+        if health_port:
+            start_health_check_server(host, health_port)
+        settings = {"RECORD_DIR": RECORD_DIR, "AUDIO_COALESCE_MS": AUDIO_COALESCE_MS,
+                    "AUDIO_COALESCE_BYTES": AUDIO_COALESCE_BYTES, "MAX_SESSIONS": MAX_SESSIONS,
+                    "MAX_LOOP_LAG_MS": MAX_LOOP_LAG_MS, "MAX_OUTPUT_FILL": MAX_OUTPUT_FILL,
+                    "ADMISSION_QUEUE": ADMISSION_QUEUE, "ADMISSION_MAX_WAIT": ADMISSION_MAX_WAIT}
+        main_args = (host, port, None, enable_mcp, enable_strands, args.warm_pool, args.warm_pool_max_idle)
+        try:
+            Supervisor(run_worker, (WORKER_STATUS, settings, main_args), args.workers, WORKER_STATUS).run()
+        except KeyboardInterrupt:
+            print("Server stopped by user")
     else:
         try:
-            asyncio.run(main(host, port, health_port, enable_mcp, enable_strands))
+            asyncio.run(main(host, port, health_port, enable_mcp, enable_strands, args.warm_pool, args.warm_pool_max_idle))
         except KeyboardInterrupt:
             print("Server stopped by user")
         except Exception as e:
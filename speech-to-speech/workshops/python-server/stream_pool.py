@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import deque
+
+
+class StreamPool:
+    """Keeps Bedrock bidirectional streams open and ready before clients connect.
+
+    `factory()` returns a new, uninitialized S2sSessionManager. The pool calls its
+    `initialize_stream()` in the background, so the client construction and the
+    stream handshake are done by the time a WebSocket sends its first event, and
+    the stream just waits for sessionStart. `acquire()` hands out the oldest warm
+    stream, or opens one on the spot when the pool is empty (a miss). Streams
+    idle longer than `max_idle` seconds are closed and replaced, so a client never
+    gets a stream the service may already have timed out. Failed refills back off
+    up to `max_backoff` seconds.
+    """
+
+    def __init__(self, factory, size=2, max_idle=30.0, max_backoff=30.0):
+        self.factory = factory
+        self.size = size
+        self.max_idle = max_idle
+        self.max_backoff = max_backoff
+        # (ready time, session manager), oldest first
+        self._idle = deque()
+        self._wake = asyncio.Event()
+        self._refill_task = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+        self.failed = 0
+
+    async def start(self):
+        """Start filling the pool in the background."""
+        if self._refill_task is None:
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def acquire(self):
+        """Return an initialized session manager, warm from the pool if one is ready."""
+        now = time.monotonic()
+        while self._idle:
+            ready, manager = self._idle.popleft()
+            if manager.is_active and now - ready < self.max_idle:
+                self.hits += 1
+                self._wake.set()
+                return manager
+            await self._discard(manager)
+        self.misses += 1
+        self._wake.set()
+        return await self.factory().initialize_stream()
+
+    async def close(self):
+        """Stop refilling and close the idle streams."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+        while self._idle:
+            await self._discard(self._idle.popleft()[1], expired=False)
+
+    async def _refill(self):
+        backoff = 1.0
+        while True:
+            self._wake.clear()
+            await self._expire()
+            if len(self._idle) < self.size:
+                try:
+                    manager = await self.factory().initialize_stream()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Failed to pre-initialize a Bedrock stream, retrying in {backoff:.0f}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = 1.0
+                self.created += 1
+                self._idle.append((time.monotonic(), manager))
+                continue
+
+            # Full: sleep until the oldest stream expires or one is acquired
+            timeout = self._idle[0][0] + self.max_idle - time.monotonic() if self._idle else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self):
+        """Close idle streams that are past max_idle or were closed by the service."""
+        now = time.monotonic()
+        for entry in [entry for entry in self._idle if not entry[1].is_active or now - entry[0] >= self.max_idle]:
+            self._idle.remove(entry)
+            await self._discard(entry[1])
+
+    async def _discard(self, manager, expired=True):
+        if expired:
+            self.expired += 1
+        try:
+            await manager.close()
+        except Exception as e:
+            print(f"Error closing idle Bedrock stream: {e}")
+
+    def stats(self):
+        """Return the pool counters and hit rate."""
+        acquired = self.hits + self.misses
+        return {
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / acquired, 3) if acquired else None,
+            "created": self.created,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
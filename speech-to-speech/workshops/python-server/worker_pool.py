@@ -0,0 +1,125 @@
+import multiprocessing
+import time
+
+# Per-worker slot: live sessions, event loop lag in seconds, last heartbeat (time.time())
+SESSIONS, LOOP_LAG, HEARTBEAT = range(3)
+SLOT_SIZE = 3
+
+
+class WorkerStatus:
+    """Live session counts and event loop lag of the server's workers, in shared memory.
+
+    Each worker writes its own slot about once a second; the health check reads
+    all of them. A worker whose heartbeat is older than `stale_after` seconds
+    counts as down. With `max_sessions` (per worker) set, the server reports
+    unhealthy once every live worker is at its cap, so a load balancer stops
+    sending new calls before they would be rejected.
+    """
+
+    def __init__(self, workers, max_sessions=0, stale_after=5.0):
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.stale_after = stale_after
+        self._slots = multiprocessing.Array('d', workers * SLOT_SIZE)
+
+    def update(self, index, sessions, loop_lag):
+        """Publish a worker's current session count and loop lag."""
+        base = index * SLOT_SIZE
+        with self._slots.get_lock():
+            self._slots[base + SESSIONS] = sessions
+            self._slots[base + LOOP_LAG] = loop_lag
+            self._slots[base + HEARTBEAT] = time.time()
+
+    def clear(self, index):
+        """Mark a worker as down until it reports again."""
+        base = index * SLOT_SIZE
+        with self._slots.get_lock():
+            self._slots[base:base + SLOT_SIZE] = [0.0] * SLOT_SIZE
+
+    def health(self):
+        """Return (healthy, details) aggregated across workers."""
+        now = time.time()
+        with self._slots.get_lock():
+            slots = [self._slots[i * SLOT_SIZE:(i + 1) * SLOT_SIZE] for i in range(self.workers)]
+        live = [slot for slot in slots if now - slot[HEARTBEAT] < self.stale_after]
+        sessions = int(sum(slot[SESSIONS] for slot in live))
+        details = {
+            "workers": self.workers,
+            "live_workers": len(live),
+            "sessions": sessions,
+            "max_loop_lag_ms": round(max((slot[LOOP_LAG] for slot in live), default=0) * 1000, 1),
+        }
+        healthy = bool(live)
+        if self.max_sessions:
+            capacity = len(live) * self.max_sessions
+            details["capacity"] = capacity
+            # Full when no live worker has a free session slot
+            healthy = healthy and any(slot[SESSIONS] < self.max_sessions for slot in live)
+        details["status"] = "healthy" if healthy else "unhealthy"
+        return healthy, details
+
+
+class Supervisor:
+    """Runs the server in worker processes and restarts the ones that exit.
+
+    `target(index, *args)` is the worker entry point. Workers that keep
+    crashing right after starting are restarted with exponential backoff, up
+    to `max_restart_delay` seconds, so a broken configuration does not spin.
+    """
+
+    def __init__(self, target, args, workers, status, min_uptime=10.0, max_restart_delay=30.0):
+        self.target = target
+        self.args = args
+        self.status = status
+        self.min_uptime = min_uptime
+        self.max_restart_delay = max_restart_delay
+        self.processes = [None] * workers
+        self._started = [0.0] * workers
+        self._delay = [0.0] * workers
+        self._restart_at = [0.0] * workers
+
+        # Counters
+        self.restarts = 0
+
+    def _start(self, index):
+        process = multiprocessing.Process(target=self.target, args=(index,) + tuple(self.args),
+                                          name=f"s2s-worker-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+        self._started[index] = time.monotonic()
+        print(f"Started worker {index} (pid {process.pid})")
+
+    def run(self, poll_interval=0.5):
+        """Start every worker and supervise them until interrupted."""
+        for index in range(len(self.processes)):
+            self._start(index)
+        try:
+            while True:
+                time.sleep(poll_interval)
+                now = time.monotonic()
+                for index, process in enumerate(self.processes):
+                    if process.is_alive():
+                        continue
+                    if not self._restart_at[index]:
+                        uptime = now - self._started[index]
+                        self._delay[index] = 0.0 if uptime >= self.min_uptime else \
+                            min(max(self._delay[index] * 2, 1.0), self.max_restart_delay)
+                        self._restart_at[index] = now + self._delay[index]
+                        self.status.clear(index)
+                        print(f"Worker {index} exited with code {process.exitcode}, "
+                              f"restarting in {self._delay[index]:.0f}s")
+                    if now >= self._restart_at[index]:
+                        self._restart_at[index] = 0.0
+                        self.restarts += 1
+                        self._start(index)
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5.0):
+        """Terminate the workers and wait for them to exit."""
+        for process in self.processes:
+            if process and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process:
+                process.join(timeout)
@@ -172,6 +172,14 @@ class S2sChatBot extends React.Component {
                     this.setState({chatMessages: chatMessages});
                 }
                 break;
+            case "bargeIn":
+                // Sent by the server on interruption; the rest of this block's audio is not sent
+                this.cancelAudio();
+                if (audioResponse.hasOwnProperty(contentId)) {
+                    audioResponse[contentId] = "";
+                    this.setState({audioResponse: audioResponse});
+                }
+                break;
             case "contentEnd":
                 if (contentType === "AUDIO") {
                     var audioUrl = base64LPCM(this.state.audioResponse[contentId]);